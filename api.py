@@ -17,7 +17,30 @@ from env_loader import load_env_file
 
 load_env_file()
 
-from honeypot import Logger, HoneypotDatabase, SSHService, FTPService, HTTPService, TelnetService, NCService
+from honeypot import (
+    Logger,
+    HoneypotDatabase,
+    SSHService,
+    FTPService,
+    HTTPService,
+    TelnetService,
+    NCService,
+    analysis_metrics,
+    enrichment_backfill_status,
+    get_enrichment_maintenance,
+    get_online_trainer,
+    get_payload_clustering,
+    lazy_classifier_metrics,
+    preload_classifier,
+    reclassification_status,
+    start_enrichment_backfill,
+    start_enrichment_maintenance,
+    start_online_trainer,
+    start_payload_clustering,
+    start_reclassification,
+    stop_enrichment_backfill,
+    stop_reclassification,
+)
 from app_meta import APP_NAME, APP_TAGLINE, APP_VERSION
 from notifications import provider_status, send_alert, severity_for_category
 from v31_core import DECOY_SWAGGER, deception_headers, fake_stack_trace, response_jitter_seconds
@@ -868,9 +891,19 @@ def setup_status_payload():
         ml_details = attack_classifier.predict_details("whoami")
         ml_loaded = bool(ml_details.get("model_loaded"))
         ml_error = ml_details.get("error") or ""
+        metrics = attack_classifier.classifier_metrics()
+        ml_metrics = {
+            "commands": metrics["commands"],
+            "fail_closed": metrics["fail_closed"],
+            "fail_closed_ratio": metrics["fail_closed_ratio"],
+            "cache_hit_ratio": metrics["prediction_cache"]["hit_ratio"],
+            "predict_avg_seconds": metrics["stage_seconds"]["predict"]["avg"],
+            "total_max_seconds": metrics["stage_seconds"]["total"]["max"],
+        }
     except Exception as exc:
         ml_loaded = False
         ml_error = exc.__class__.__name__
+        ml_metrics = {}
     return {
         "env_exists": Path(os.environ.get("HONEYPOT_ENV_FILE", ".env")).exists(),
         "auth_secret_strong": auth_secret_is_strong(os.environ.get("HONEYPOT_AUTH_SECRET", DEFAULT_AUTH_SECRET)),
@@ -879,6 +912,7 @@ def setup_status_payload():
         "db_writable": _db_path_writable(os.environ.get("HONEYPOT_DB_PATH", DB_PATH)),
         "ml_loaded": ml_loaded,
         "ml_error": ml_error,
+        "ml_metrics": ml_metrics,
         "alerts_enabled": alert_status["enabled"],
         "providers_configured": {name: bool(details.get("configured")) for name, details in alert_status["providers"].items()},
     }
@@ -890,6 +924,122 @@ def setup_status():
     return jsonify(setup_status_payload())
 
 
+@app.route("/api/runtime/metrics")
+@requires_token()
+def runtime_metrics():
+    payload = hp_db.runtime_metrics()
+    payload.update(analysis_metrics())
+    maintenance = get_enrichment_maintenance()
+    payload["enrichment_maintenance"] = maintenance.status() if maintenance else {"enabled": False}
+    return jsonify(payload)
+
+
+@app.route("/api/ml/metrics")
+@requires_token()
+def ml_metrics():
+    from ml import attack_classifier
+
+    analysis = analysis_metrics()
+    return jsonify({
+        "classifier": attack_classifier.classifier_metrics(),
+        "session_classifier": analysis["session_classifier"]["classification"],
+        "lazy_classifier": lazy_classifier_metrics(),
+        "command_classifier": analysis["command_classifier"],
+        "analysis_executor": analysis["analysis_executor"],
+    })
+
+
+@app.route("/api/ml/models", methods=["GET"])
+@requires_token(role="admin")
+def list_ml_models():
+    from ml import attack_classifier, model_registry
+
+    trainer = get_online_trainer()
+    return jsonify({
+        "serving_version": attack_classifier.active_model_version(),
+        "versions": model_registry.list_versions(),
+        "online_learning": trainer.status() if trainer else {"running": False},
+    })
+
+
+@app.route("/api/ml/models/<version>/promote", methods=["POST"])
+@requires_token(role="admin")
+def promote_ml_model(version):
+    from ml import attack_classifier
+
+    try:
+        status = attack_classifier.promote_model(version)
+    except ValueError as exc:
+        error = str(exc)
+        return jsonify({"error": error}), 404 if error == "unknown_model_version" else 400
+    actor = request.user.get("username", "unknown")
+    log_audit(actor, "ml.model.promote", target=version, details=f"backend={status.get('backend')}")
+    return jsonify({"success": True, "version": version, "model": status})
+
+
+@app.route("/api/ml/reclassify", methods=["GET"])
+@requires_token(role="admin")
+def reclassify_status():
+    return jsonify(reclassification_status(hp_db))
+
+
+@app.route("/api/ml/reclassify", methods=["POST"])
+@requires_token(role="admin")
+def reclassify_start():
+    body = request.get_json(silent=True) or {}
+    restart = bool(body.get("restart"))
+    started, status = start_reclassification(hp_db, restart=restart)
+    if started:
+        log_audit(request.user.get("username", "unknown"), "ml.reclassify.start", details=f"restart={restart}")
+    return jsonify({"started": started, "job": status}), 202 if started else 409
+
+
+@app.route("/api/ml/reclassify/stop", methods=["POST"])
+@requires_token(role="admin")
+def reclassify_stop():
+    status = stop_reclassification()
+    if status is None:
+        return jsonify({"error": "reclassification is not running"}), 409
+    log_audit(request.user.get("username", "unknown"), "ml.reclassify.stop")
+    return jsonify({"job": status})
+
+
+@app.route("/api/enrichment/backfill", methods=["GET"])
+@requires_token(role="admin")
+def enrichment_backfill_get():
+    return jsonify(enrichment_backfill_status(hp_db))
+
+
+@app.route("/api/enrichment/backfill", methods=["POST"])
+@requires_token(role="admin")
+def enrichment_backfill_start():
+    body = request.get_json(silent=True) or {}
+    restart = bool(body.get("restart"))
+    started, status = start_enrichment_backfill(hp_db, restart=restart)
+    if started:
+        log_audit(request.user.get("username", "unknown"), "enrichment.backfill.start", details=f"restart={restart}")
+    return jsonify({"started": started, "job": status}), 202 if started else 409
+
+
+@app.route("/api/enrichment/backfill/stop", methods=["POST"])
+@requires_token(role="admin")
+def enrichment_backfill_stop():
+    status = stop_enrichment_backfill()
+    if status is None:
+        return jsonify({"error": "enrichment backfill is not running"}), 409
+    log_audit(request.user.get("username", "unknown"), "enrichment.backfill.stop")
+    return jsonify({"job": status})
+
+
+@app.route("/api/ml/rules/top")
+@requires_token()
+def top_ml_rules():
+    from ml import signatures
+
+    limit = parse_limit(request.args.get("limit"), default=10, maximum=100)
+    return jsonify({"status": signatures.rules_status(), "rules": signatures.top_rules(limit)})
+
+
 @app.route("/api/threats/summary")
 @requires_token()
 def threat_summary():
@@ -1251,13 +1401,69 @@ def commands():
     conn = get_db()
     cur = conn.cursor()
     cur.execute("""
-        SELECT id, ip, service, command, timestamp, attack_category
+        SELECT id, ip, service, command, timestamp, attack_category, cluster_id
         FROM commands ORDER BY id DESC LIMIT ?
     """, (limit,))
     rows = cur.fetchall()
     conn.close()
     return jsonify([dict(r) for r in rows])
 
+@app.route("/api/commands/<int:command_id>/label", methods=["POST"])
+@requires_token(role="admin")
+def label_command(command_id):
+    from ml import online
+
+    body = request.get_json(silent=True) or {}
+    label = (body.get("attack_category") or "").strip()
+    allowed = online.categories()
+    if label not in allowed:
+        return jsonify({"error": "attack_category must be one of: " + ", ".join(allowed)}), 400
+    conn = get_db()
+    row = conn.execute("SELECT id, command, attack_category FROM commands WHERE id=?", (command_id,)).fetchone()
+    if not row:
+        conn.close()
+        return jsonify({"error": "command not found"}), 404
+    actor = request.user.get("username", "unknown")
+    conn.execute("UPDATE commands SET attack_category=? WHERE id=?", (label, command_id))
+    conn.execute(
+        """
+        INSERT INTO command_labels (command_id, command, label, previous_label, labeled_by, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (command_id, row["command"] or "", label, row["attack_category"], actor, utc_now()),
+    )
+    conn.commit()
+    conn.close()
+    log_audit(actor, "command.label", target=str(command_id), details=f"{row['attack_category']} -> {label}")
+    return jsonify({"success": True, "id": command_id, "attack_category": label, "previous_category": row["attack_category"]})
+
+
+@app.route("/api/clusters")
+@requires_token()
+def payload_clusters():
+    limit = parse_limit(request.args.get("limit"), default=20, maximum=200)
+    conn = get_db()
+    rows = conn.execute("""
+        SELECT id, representative, command_count, first_seen, last_seen FROM payload_clusters
+        ORDER BY command_count DESC, id LIMIT ?
+    """, (limit,)).fetchall()
+    clusters = []
+    for row in rows:
+        sources = conn.execute("""
+            SELECT ip, command_count, first_seen, last_seen FROM payload_cluster_sources
+            WHERE cluster_id=? ORDER BY command_count DESC, ip LIMIT 20
+        """, (row["id"],)).fetchall()
+        source_count = conn.execute(
+            "SELECT COUNT(*) FROM payload_cluster_sources WHERE cluster_id=?", (row["id"],)
+        ).fetchone()[0]
+        cluster = dict(row)
+        cluster["source_ip_count"] = source_count
+        cluster["source_ips"] = [dict(source) for source in sources]
+        clusters.append(cluster)
+    conn.close()
+    job = get_payload_clustering()
+    return jsonify({"clusters": clusters, "clustering": job.status() if job else {"running": False}})
+
 @app.route("/api/attacks")
 @requires_token()
 def attacks():
@@ -1440,6 +1646,11 @@ def audit_logs():
     return jsonify([dict(r) for r in rows])
 
 def start_services():
+    preload_classifier()
+    start_online_trainer(hp_db)
+    start_payload_clustering(hp_db)
+    start_enrichment_maintenance(hp_db)
+    hp_db.enrichment.preload_async()
     for name, svc in services.items():
         if not svc.running:
             svc.start()
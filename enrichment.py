@@ -3,21 +3,83 @@
 The module is intentionally dependency-free and safe-by-default: private/local IPs
 are handled locally, external lookups are optional, and no API tokens are exposed
 through API responses.
+
+Cached results are looked up in two tiers: a bounded in-process LRU/TTL map,
+then the ``enrichment_cache`` SQLite table over one persistent connection per
+database whose schema is created once. Each tier keeps hit/miss counters.
+Expired rows are purged in batches by ``EnrichmentCache.compact`` and the
+memory tier can be preloaded at startup with ``EnrichmentCache.warm``.
+
+Concurrent misses for one IP are coalesced: the first caller queries the
+provider and stores the result, later callers wait for that same answer.
+Provider calls pass through ``ProviderHealth`` (circuit breaker, request
+budget, negative cache); lookups it cannot admit are answered with degraded
+data at once and resolved into the cache in the background.
+
+``enrich_ip`` asks a ``ProviderChain`` built from HONEYPOT_ENRICHMENT_CHAIN
+(registered names: ip-api, geoip, reputation, plus custom JSON/HTTP providers
+from HONEYPOT_ENRICHMENT_HTTP_PROVIDERS_FILE). Providers are queried
+concurrently under one deadline and their fields merged by chain order. The
+offline geoip provider answers from local range files (see ``geoip``) and
+bypasses both cache tiers. Provider HTTP requests reuse per-host keep-alive
+connections. Application code uses an ``EnrichmentService`` rather than these
+functions directly. Records no provider could answer carry one of
+DEGRADED_LABELS as ``asn_org``; ``prefetch`` resolves such IPs in bulk.
 """
 
 from __future__ import annotations
 
+import abc
+import concurrent.futures
+import http.client
 import json
 import os
+import re
 import sqlite3
-from datetime import datetime, timedelta, timezone
+import threading
+import time
+from datetime import datetime, timezone
+import urllib.error
 import urllib.parse
-import urllib.request
+from collections import OrderedDict
 from ipaddress import ip_address
 
+import geoip
+import reputation
+from v31_core import (
+    LATENCY_BUCKETS_SECONDS,
+    CircuitBreaker,
+    EventWriteBuffer,
+    Histogram,
+    SingleFlight,
+    TokenBucket,
+    TTLCache,
+)
+
 
 TIMEOUT_SECONDS = float(os.environ.get("HONEYPOT_ENRICHMENT_TIMEOUT_SECONDS", "4"))
+IP_API_URL = os.environ.get("HONEYPOT_ENRICHMENT_IP_API_URL", "http://ip-api.com").rstrip("/")
+IP_API_FIELDS = "status,country,city,regionName,lat,lon,isp,org,as,asname,query,proxy,hosting,mobile,reverse"
+IP_API_BATCH_LIMIT = 100
+BATCH_WINDOW_SECONDS = float(os.environ.get("HONEYPOT_ENRICHMENT_BATCH_WINDOW_MS", "50")) / 1000.0
+COALESCE_TIMEOUT_SECONDS = float(
+    os.environ.get("HONEYPOT_ENRICHMENT_COALESCE_TIMEOUT_SECONDS", str(TIMEOUT_SECONDS + BATCH_WINDOW_SECONDS + 1))
+)
+# ip-api's free tier allows 45 single lookups or 15 batch requests per minute.
+REQUESTS_PER_MINUTE = int(
+    os.environ.get("HONEYPOT_ENRICHMENT_REQUESTS_PER_MINUTE", "15" if BATCH_WINDOW_SECONDS > 0 else "45")
+)
+BREAKER_FAILURES = int(os.environ.get("HONEYPOT_ENRICHMENT_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("HONEYPOT_ENRICHMENT_BREAKER_RESET_SECONDS", "30"))
+NEGATIVE_TTL_SECONDS = float(os.environ.get("HONEYPOT_ENRICHMENT_NEGATIVE_TTL_SECONDS", "300"))
+MAX_DEFERRED = int(os.environ.get("HONEYPOT_ENRICHMENT_MAX_DEFERRED", "10000"))
+BACKFILL_WAIT_SECONDS = float(os.environ.get("HONEYPOT_ENRICHMENT_BACKFILL_WAIT_SECONDS", "120"))
 DEFAULT_PROVIDER = os.environ.get("HONEYPOT_ENRICHMENT_PROVIDER", "ip-api").strip().lower()
+# Comma separated provider names in priority order; defaults to the single HONEYPOT_ENRICHMENT_PROVIDER.
+PROVIDER_CHAIN = os.environ.get("HONEYPOT_ENRICHMENT_CHAIN", "").strip().lower()
+CHAIN_DEADLINE_SECONDS = float(os.environ.get("HONEYPOT_ENRICHMENT_DEADLINE_SECONDS", str(COALESCE_TIMEOUT_SECONDS)))
+CHAIN_WORKERS = max(1, int(os.environ.get("HONEYPOT_ENRICHMENT_WORKERS", "8")))
+HTTP_PROVIDERS_FILE = os.environ.get("HONEYPOT_ENRICHMENT_HTTP_PROVIDERS_FILE", "").strip()
 ENABLE_EXTERNAL = os.environ.get("HONEYPOT_ENRICHMENT_ENABLED", "true").strip().lower() not in {
     "0",
     "false",
@@ -27,54 +89,331 @@ ENABLE_EXTERNAL = os.environ.get("HONEYPOT_ENRICHMENT_ENABLED", "true").strip().
 
 
 CACHE_TTL_HOURS = int(os.environ.get("HONEYPOT_ENRICHMENT_CACHE_TTL_HOURS", "24"))
+MEMORY_CACHE_SIZE = int(os.environ.get("HONEYPOT_ENRICHMENT_MEMORY_CACHE_SIZE", "50000"))
+COMPACT_BATCH_SIZE = max(1, int(os.environ.get("HONEYPOT_ENRICHMENT_COMPACT_BATCH_SIZE", "1000")))
+COMPACT_INTERVAL_SECONDS = float(os.environ.get("HONEYPOT_ENRICHMENT_COMPACT_INTERVAL_SECONDS", "3600"))
+WARM_LIMIT = int(os.environ.get("HONEYPOT_ENRICHMENT_WARM_LIMIT", "5000"))
 
 
 def _utc_now() -> str:
     return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
 
 
-def init_enrichment_cache(db_path: str) -> None:
-    conn = sqlite3.connect(db_path)
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS enrichment_cache (
-            ip TEXT PRIMARY KEY,
-            data TEXT NOT NULL,
-            cached_at TEXT NOT NULL
+def _parse_cached_at(value: str) -> datetime | None:
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _cached_epoch(value: str) -> float | None:
+    parsed = _parse_cached_at(value)
+    return parsed.timestamp() if parsed is not None else None
+
+
+class EnrichmentCache:
+    """Two-tier enrichment cache for one database: in-process LRU/TTL, then SQLite.
+
+    Rows carry ``cached_epoch`` (indexed) next to the ISO ``cached_at``, so
+    freshness checks, compaction and warm-up are plain numeric comparisons.
+    Memory entries keep the original epoch so a lookup honours the caller's
+    TTL no matter which tier answers it.
+    """
+
+    def __init__(self, db_path: str, max_entries: int = MEMORY_CACHE_SIZE, ttl_hours: int = CACHE_TTL_HOURS):
+        self.db_path = db_path
+        self.ttl_hours = ttl_hours
+        self.memory = TTLCache(max_entries=max_entries, ttl_seconds=ttl_hours * 3600)
+        self.sqlite_hits = 0
+        self.sqlite_misses = 0
+        self.warmed = 0
+        self.compaction = {"runs": 0, "purged": 0, "backfilled": 0, "last_run_at": None, "last_seconds": 0.0}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS enrichment_cache (
+                ip TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                cached_at TEXT NOT NULL,
+                cached_epoch REAL
+            )
+            """
         )
+        try:
+            self._conn.execute("ALTER TABLE enrichment_cache ADD COLUMN cached_epoch REAL")
+        except sqlite3.OperationalError:
+            pass  # Column exists
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_enrichment_cache_epoch ON enrichment_cache(cached_epoch)")
+        self._conn.commit()
+
+    def get(self, ip: str, ttl_hours: int = CACHE_TTL_HOURS) -> dict | None:
+        max_age = ttl_hours * 3600
+        now = time.time()
+        entry = self.memory.get(ip)
+        if entry is not None and now - entry[0] <= max_age:
+            return dict(entry[1])
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, cached_at, cached_epoch FROM enrichment_cache WHERE ip=?", (ip,)
+            ).fetchone()
+            # Rows written before the epoch column existed are parsed until compaction backfills them.
+            cached_epoch = (row[2] if row[2] is not None else _cached_epoch(row[1])) if row else None
+            if cached_epoch is None or now - cached_epoch > max_age:
+                self.sqlite_misses += 1
+                return None
+            self.sqlite_hits += 1
+        data = json.loads(row[0])
+        data["enrichment_provider"] = "cache"
+        self._remember(ip, data, cached_epoch)
+        return dict(data)
+
+    def set(self, ip: str, data: dict, cached_at: str | None = None) -> None:
+        cached_at = cached_at or _utc_now()
+        cached_epoch = _cached_epoch(cached_at)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO enrichment_cache (ip, data, cached_at, cached_epoch) VALUES (?, ?, ?, ?)",
+                (ip, json.dumps(data, sort_keys=True), cached_at, cached_epoch if cached_epoch is not None else 0.0),
+            )
+            self._conn.commit()
+        if cached_epoch is not None:
+            self._remember(ip, dict(data, enrichment_provider="cache"), cached_epoch)
+
+    def _remember(self, ip: str, data: dict, cached_epoch: float):
+        remaining = self.memory.ttl_seconds - (time.time() - cached_epoch)
+        if remaining > 0:
+            self.memory.set(ip, (cached_epoch, data), ttl_seconds=remaining)
+
+    def warm(self, ips: list[str] | None = None, limit: int | None = None) -> int:
+        """Preload fresh rows into the memory tier; returns how many were loaded.
+
+        ``ips`` are loaded in the given order of priority; without them the
+        most recently cached rows are used. Loading stops at ``limit`` (by
+        default the memory tier's capacity) so warm-up never evicts itself.
         """
-    )
-    conn.commit()
-    conn.close()
+        limit = min(limit or self.memory.max_entries, self.memory.max_entries)
+        cutoff = time.time() - self.ttl_hours * 3600
+        rows = []
+        with self._lock:
+            if ips is None:
+                rows = self._conn.execute(
+                    "SELECT ip, data, cached_epoch FROM enrichment_cache WHERE cached_epoch >= ? "
+                    "ORDER BY cached_epoch DESC LIMIT ?",
+                    (cutoff, limit),
+                ).fetchall()
+            else:
+                wanted = list(dict.fromkeys(ips))[:limit]
+                for offset in range(0, len(wanted), 500):
+                    chunk = wanted[offset:offset + 500]
+                    found = {row[0]: row for row in self._conn.execute(
+                        f"SELECT ip, data, cached_epoch FROM enrichment_cache "
+                        f"WHERE cached_epoch >= ? AND ip IN ({','.join('?' * len(chunk))})",
+                        (cutoff, *chunk),
+                    )}
+                    rows.extend(found[ip] for ip in chunk if ip in found)
+        for ip, data, cached_epoch in reversed(rows):  # highest priority last, so it is the newest LRU entry
+            self._remember(ip, dict(json.loads(data), enrichment_provider="cache"), cached_epoch)
+        with self._lock:
+            self.warmed += len(rows)
+        return len(rows)
+
+    def compact(self, ttl_hours: int | None = None, batch_size: int = COMPACT_BATCH_SIZE) -> dict:
+        """Delete expired rows in ``batch_size`` transactions; returns what was done.
+
+        Legacy rows without ``cached_epoch`` are backfilled first, also in
+        batches. The connection lock is released between batches so lookups
+        and writes interleave with a long purge.
+        """
+        started = time.perf_counter()
+        cutoff = time.time() - (self.ttl_hours if ttl_hours is None else ttl_hours) * 3600
+        backfilled = purged = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT ip, cached_at FROM enrichment_cache WHERE cached_epoch IS NULL LIMIT ?", (batch_size,)
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE enrichment_cache SET cached_epoch=? WHERE ip=?",
+                    [(_cached_epoch(cached_at) or 0.0, ip) for ip, cached_at in rows],
+                )
+                self._conn.commit()
+            backfilled += len(rows)
+            if len(rows) < batch_size:
+                break
+        while True:
+            with self._lock:
+                deleted = self._conn.execute(
+                    "DELETE FROM enrichment_cache WHERE rowid IN "
+                    "(SELECT rowid FROM enrichment_cache WHERE cached_epoch < ? LIMIT ?)",
+                    (cutoff, batch_size),
+                ).rowcount
+                self._conn.commit()
+            purged += deleted
+            if deleted < batch_size:
+                break
+        result = {"purged": purged, "backfilled": backfilled, "seconds": round(time.perf_counter() - started, 4)}
+        with self._lock:
+            self.compaction["runs"] += 1
+            self.compaction["purged"] += purged
+            self.compaction["backfilled"] += backfilled
+            self.compaction["last_run_at"] = time.time()
+            self.compaction["last_seconds"] = result["seconds"]
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, misses = self.sqlite_hits, self.sqlite_misses
+            warmed, compaction = self.warmed, dict(self.compaction)
+        lookups = hits + misses
+        return {
+            "memory": dict(self.memory.stats(), warmed=warmed),
+            "sqlite": {"hits": hits, "misses": misses, "hit_ratio": round(hits / lookups, 4) if lookups else 0.0},
+            "compaction": compaction,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_caches: dict[str, EnrichmentCache] = {}
+_cache_users: dict[str, int] = {}
+_caches_lock = threading.Lock()
+
+
+def enrichment_cache(db_path: str) -> EnrichmentCache:
+    """Shared cache for ``db_path``; the SQLite schema is initialized on first use only."""
+    cache = _caches.get(db_path)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(db_path)
+            if cache is None:
+                cache = _caches[db_path] = EnrichmentCache(db_path)
+    return cache
+
+
+def acquire_enrichment_cache(db_path: str) -> EnrichmentCache:
+    """Shared cache for ``db_path``, kept open until the matching ``release_enrichment_cache``."""
+    with _caches_lock:
+        cache = _caches.get(db_path)
+        if cache is None:
+            cache = _caches[db_path] = EnrichmentCache(db_path)
+        _cache_users[db_path] = _cache_users.get(db_path, 0) + 1
+    return cache
+
+
+def release_enrichment_cache(db_path: str) -> None:
+    """Drop one reference taken by ``acquire_enrichment_cache``; the last one closes the cache."""
+    with _caches_lock:
+        users = _cache_users.pop(db_path, 0) - 1
+        if users > 0:
+            _cache_users[db_path] = users
+            return
+        cache = _caches.pop(db_path, None)
+    if cache is not None:
+        cache.close()
+
+
+def close_enrichment_cache(db_path: str) -> None:
+    with _caches_lock:
+        _cache_users.pop(db_path, None)
+        cache = _caches.pop(db_path, None)
+    if cache is not None:
+        cache.close()
+
+
+def enrichment_cache_stats() -> dict:
+    with _caches_lock:
+        caches = dict(_caches)
+    return {path: cache.stats() for path, cache in caches.items()}
+
+
+def init_enrichment_cache(db_path: str) -> None:
+    enrichment_cache(db_path)
 
 
 def store_enrichment_cache(db_path: str, ip: str, data: dict, cached_at: str | None = None) -> None:
-    init_enrichment_cache(db_path)
-    conn = sqlite3.connect(db_path)
-    conn.execute(
-        "INSERT OR REPLACE INTO enrichment_cache (ip, data, cached_at) VALUES (?, ?, ?)",
-        (ip, json.dumps(data, sort_keys=True), cached_at or _utc_now()),
-    )
-    conn.commit()
-    conn.close()
+    enrichment_cache(db_path).set(ip, data, cached_at)
 
 
 def get_enrichment_cache(db_path: str, ip: str, ttl_hours: int = CACHE_TTL_HOURS) -> dict | None:
-    init_enrichment_cache(db_path)
-    conn = sqlite3.connect(db_path)
-    row = conn.execute("SELECT data, cached_at FROM enrichment_cache WHERE ip=?", (ip,)).fetchone()
-    conn.close()
-    if not row:
-        return None
-    try:
-        cached_at = datetime.fromisoformat(str(row[1]).replace("Z", "+00:00"))
-    except ValueError:
-        return None
-    if datetime.now(timezone.utc) - cached_at > timedelta(hours=ttl_hours):
-        return None
-    data = json.loads(row[0])
-    data["enrichment_provider"] = "cache"
-    return data
+    return enrichment_cache(db_path).get(ip, ttl_hours)
+
+
+class CacheMaintenance:
+    """Background upkeep for one EnrichmentCache: warm-up once, then periodic compaction.
+
+    ``warm_ips_fn(limit)`` returns the IPs worth preloading in priority order
+    (None preloads the most recently cached rows). The state after each step
+    is handed to ``checkpoint_fn`` so operators can see when the cache was
+    last compacted.
+    """
+
+    def __init__(self, name: str, cache: EnrichmentCache, interval_seconds: float = COMPACT_INTERVAL_SECONDS,
+                 warm_ips_fn=None, warm_limit: int = WARM_LIMIT, checkpoint_fn=None):
+        self.name = name
+        self.cache = cache
+        self.interval_seconds = max(1.0, interval_seconds)
+        self.warm_ips_fn = warm_ips_fn
+        self.warm_limit = warm_limit
+        self.checkpoint_fn = checkpoint_fn
+        self.state = {"name": name, "status": "idle", "warmed": 0, "runs": 0, "purged": 0, "backfilled": 0,
+                      "last_run_at": None, "error": None}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _checkpoint(self, **changes):
+        with self._lock:
+            self.state.update(changes)
+            snapshot = dict(self.state)
+        if self.checkpoint_fn:
+            self.checkpoint_fn(snapshot)
+
+    def run(self) -> dict:
+        try:
+            if self.warm_limit > 0:
+                self._checkpoint(status="warming", error=None)
+                ips = self.warm_ips_fn(self.warm_limit) if self.warm_ips_fn else None
+                self._checkpoint(warmed=self.cache.warm(ips, self.warm_limit))
+            while not self._stop.is_set():
+                result = self.cache.compact()
+                self._checkpoint(
+                    status="waiting",
+                    runs=self.state["runs"] + 1,
+                    purged=self.state["purged"] + result["purged"],
+                    backfilled=self.state["backfilled"] + result["backfilled"],
+                    last_run_at=time.time(),
+                )
+                self._stop.wait(self.interval_seconds)
+            self._checkpoint(status="stopped")
+        except Exception as exc:
+            self._checkpoint(status="failed", error=exc.__class__.__name__)
+        return self.status()
+
+    def start(self) -> bool:
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name=f"hp-enrichment-{self.name}", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self, wait: bool = True):
+        self._stop.set()
+        if wait and self._thread is not None:
+            self._thread.join(timeout=10)
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def status(self) -> dict:
+        with self._lock:
+            status = dict(self.state)
+        status["running"] = self.running()
+        return status
 
 
 def is_public_ip(ip: str) -> bool:
@@ -105,24 +444,22 @@ def local_enrichment(ip: str) -> dict:
     }
 
 
+REPUTATION_POINTS = {"proxy_or_vpn": 35, "hosting_provider": 25, "mobile_network": 5, "infrastructure_asn": 15}
+
+
 def reputation_from_ip_api(data: dict) -> tuple[int, list[str]]:
     flags: list[str] = []
-    score = 0
     if data.get("proxy"):
         flags.append("proxy_or_vpn")
-        score += 35
     if data.get("hosting"):
         flags.append("hosting_provider")
-        score += 25
     if data.get("mobile"):
         flags.append("mobile_network")
-        score += 5
     org_text = " ".join(str(data.get(k) or "") for k in ("isp", "org", "as")).lower()
     noisy_markers = ("cloud", "hosting", "vps", "vpn", "proxy", "tor", "colo", "datacenter", "data center")
     if any(marker in org_text for marker in noisy_markers):
         flags.append("infrastructure_asn")
-        score += 15
-    return min(score, 100), sorted(set(flags))
+    return min(sum(REPUTATION_POINTS[flag] for flag in flags), 100), sorted(set(flags))
 
 
 def level_for_score(score: int) -> str:
@@ -137,12 +474,8 @@ def level_for_score(score: int) -> str:
     return "unknown"
 
 
-def enrich_with_ip_api(ip: str) -> dict | None:
-    fields = "status,country,city,regionName,lat,lon,isp,org,as,asname,query,proxy,hosting,mobile,reverse"
-    url = "http://ip-api.com/json/{}?fields={}".format(urllib.parse.quote(ip), urllib.parse.quote(fields))
-    with urllib.request.urlopen(url, timeout=TIMEOUT_SECONDS) as response:
-        data = json.loads(response.read().decode("utf-8"))
-    if data.get("status") != "success":
+def _from_ip_api(data: dict) -> dict | None:
+    if not isinstance(data, dict) or data.get("status") != "success":
         return None
     score, flags = reputation_from_ip_api(data)
     as_value = data.get("as") or ""
@@ -166,29 +499,1055 @@ def enrich_with_ip_api(ip: str) -> dict | None:
     }
 
 
+class KeepAliveHTTP:
+    """Persistent HTTP(S) connections for provider requests, one per host and thread.
+
+    urllib's ``urlopen`` opens a TCP (and TLS) connection per request, while
+    enrichment talks to a handful of hosts many times a minute. A connection
+    the server closed is replaced and the request retried once. Status codes
+    of 400 and above raise ``urllib.error.HTTPError``, as ``urlopen`` does, so
+    ProviderHealth's 429 handling is unchanged.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open: set[http.client.HTTPConnection] = set()
+        self.opened = 0
+        self.requests = 0
+
+    def _connections(self) -> dict:
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        return connections
+
+    def _connection(self, scheme: str, netloc: str, timeout: float) -> http.client.HTTPConnection:
+        connections = self._connections()
+        connection = connections.get((scheme, netloc))
+        if connection is None:
+            factory = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            connection = connections[(scheme, netloc)] = factory(netloc, timeout=timeout)
+            with self._lock:
+                self.opened += 1
+                self._open.add(connection)
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        return connection
+
+    def _drop(self, scheme: str, netloc: str):
+        connection = self._connections().pop((scheme, netloc), None)
+        if connection is not None:
+            connection.close()
+            with self._lock:
+                self._open.discard(connection)
+
+    def request(self, method: str, url: str, body: bytes | None = None, headers: dict | None = None,
+                timeout: float = TIMEOUT_SECONDS):
+        """Send one request; returns ``(headers, body)`` of a successful response."""
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"unsupported_url_scheme:{parts.scheme}")
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        for attempt in range(2):
+            connection = self._connection(parts.scheme, parts.netloc, timeout)
+            reused = connection.sock is not None
+            try:
+                connection.request(method, target, body=body, headers=headers or {})
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.RemoteDisconnected, http.client.CannotSendRequest, ConnectionResetError,
+                    BrokenPipeError):
+                self._drop(parts.scheme, parts.netloc)
+                if attempt or not reused:
+                    raise
+            except Exception:
+                self._drop(parts.scheme, parts.netloc)
+                raise
+        with self._lock:
+            self.requests += 1
+        if response.will_close:
+            self._drop(parts.scheme, parts.netloc)
+        if response.status >= 400:
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+        return response.headers, data
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "connections_opened": self.opened}
+
+    def close(self):
+        """Close every pooled connection, whichever thread opened it."""
+        with self._lock:
+            connections, self._open = list(self._open), set()
+        for connection in connections:
+            connection.close()
+
+
+_http = KeepAliveHTTP()
+
+
+def enrich_with_ip_api(ip: str, http: KeepAliveHTTP | None = None) -> dict | None:
+    url = "{}/json/{}?fields={}".format(IP_API_URL, urllib.parse.quote(ip), urllib.parse.quote(IP_API_FIELDS))
+    headers, body = (http or _http).request("GET", url)
+    provider_health().observe_budget(headers)
+    return _from_ip_api(json.loads(body.decode("utf-8")))
+
+
+def enrich_with_geoip(ip: str) -> dict | None:
+    """Offline lookup in the HONEYPOT_GEOIP_PATHS range files; no network involved."""
+    provider = geoip.get_provider()
+    found = provider.lookup(ip) if provider is not None else None
+    if not found:
+        return None
+    score, flags = reputation_from_ip_api({"org": found.get("asn_org")})
+    return {
+        "country": found.get("country"),
+        "city": found.get("city"),
+        "region": found.get("region"),
+        "lat": found.get("lat"),
+        "lon": found.get("lon"),
+        "isp": found.get("asn_org"),
+        "asn": found.get("asn"),
+        "asn_org": found.get("asn_org"),
+        "reputation_score": score,
+        "reputation_level": level_for_score(score),
+        "reputation_flags": flags,
+        "enrichment_provider": "geoip",
+        "raw_geo": json.dumps(found, sort_keys=True),
+    }
+
+
+def enrich_batch_with_ip_api(ips: list[str], http: KeepAliveHTTP | None = None) -> dict[str, dict | None]:
+    """Resolve many IPs with ip-api's batch endpoint, at most IP_API_BATCH_LIMIT per POST."""
+    results: dict[str, dict | None] = {}
+    url = "{}/batch?fields={}".format(IP_API_URL, urllib.parse.quote(IP_API_FIELDS))
+    for offset in range(0, len(ips), IP_API_BATCH_LIMIT):
+        chunk = ips[offset:offset + IP_API_BATCH_LIMIT]
+        headers, body = (http or _http).request("POST", url, json.dumps(chunk).encode("utf-8"),
+                                                {"Content-Type": "application/json"})
+        rows = json.loads(body.decode("utf-8"))
+        provider_health().observe_budget(headers)
+        if not isinstance(rows, list) or len(rows) != len(chunk):
+            raise ValueError("ip-api batch response does not match request")
+        for ip, row in zip(chunk, rows):
+            results[ip] = _from_ip_api(row)
+    return results
+
+
+class EnrichmentBatcher:
+    """Collects unknown IPs for ``window_seconds`` and resolves them in one provider call.
+
+    ``resolve_many(ips)`` returns ``{ip: result or None}``. Every caller gets a
+    Future; callers asking for an IP that is already waiting share its Future
+    slot, so each IP appears once per batch. A failing batch resolves its
+    callers to None rather than raising.
+    """
+
+    def __init__(self, resolve_many, window_seconds: float = BATCH_WINDOW_SECONDS,
+                 max_batch: int = IP_API_BATCH_LIMIT):
+        self.resolve_many = resolve_many
+        self._waiting: dict[str, list[concurrent.futures.Future]] = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.resolved = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.latency = Histogram(LATENCY_BUCKETS_SECONDS)
+        self.buffer = EventWriteBuffer(flush_interval=window_seconds, sink=self._resolve, max_batch_size=max_batch)
+        self.buffer.start()
+
+    def submit(self, ip: str) -> concurrent.futures.Future:
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self._lock:
+            waiting = self._waiting.get(ip)
+            if waiting is not None:
+                waiting.append(future)
+                self.coalesced += 1
+                return future
+            self._waiting[ip] = [future]
+        self.buffer.add({"ip": ip})
+        return future
+
+    def _resolve(self, batch: list[dict]):
+        ips = [event["ip"] for event in batch]
+        started = time.perf_counter()
+        try:
+            results = self.resolve_many(ips)
+        except Exception:
+            results = {}
+            with self._lock:
+                self.failures += 1
+        self.latency.observe(time.perf_counter() - started)
+        with self._lock:
+            self.requests += 1
+            self.resolved += len(ips)
+            waiting = [(ip, self._waiting.pop(ip, [])) for ip in ips]
+        for ip, futures in waiting:
+            for future in futures:
+                if not future.done():
+                    future.set_result(results.get(ip))
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "waiting": len(self._waiting),
+                "requests": self.requests,
+                "resolved": self.resolved,
+                "coalesced": self.coalesced,
+                "failures": self.failures,
+                "latency_seconds": self.latency.snapshot(),
+            }
+
+    def shutdown(self):
+        self.buffer.stop()
+
+
+DEFERRED = object()  # provider call not admitted now; the lookup was queued for later
+
+
+class ProviderHealth:
+    """Admission control in front of one enrichment provider.
+
+    A circuit breaker stops calls during outages, a token bucket keeps calls
+    within the provider's published budget (and is emptied when the provider
+    reports the budget spent), and a short-TTL negative cache remembers IPs
+    that could not be resolved. Lookups that cannot be admitted are deferred:
+    the caller gets degraded data immediately and the IP is queued for a
+    background worker that resolves it into the cache as budget allows.
+    """
+
+    def __init__(self, resolve_many, requests_per_minute: int = REQUESTS_PER_MINUTE,
+                 failure_threshold: int = BREAKER_FAILURES, reset_seconds: float = BREAKER_RESET_SECONDS,
+                 negative_ttl_seconds: float = NEGATIVE_TTL_SECONDS, max_deferred: int = MAX_DEFERRED,
+                 batch_size: int = IP_API_BATCH_LIMIT):
+        self.resolve_many = resolve_many
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        # The burst plus one minute of refill never exceeds the per-minute budget.
+        burst = max(1, requests_per_minute // 4)
+        self.bucket = TokenBucket(max(requests_per_minute - burst, 1) / 60.0, burst)
+        self.negative = TTLCache(max_entries=max(1, max_deferred), ttl_seconds=negative_ttl_seconds)
+        self.max_deferred = max(1, max_deferred)
+        self.batch_size = batch_size
+        self.deferred_total = 0
+        self.deferred_dropped = 0
+        self.deferred_resolved = 0
+        self.throttled = 0
+        self._deferred: OrderedDict[str, set[str]] = OrderedDict()
+        self._wake = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def ready(self) -> bool:
+        """Whether a provider call would be admitted now, without consuming anything."""
+        return self.breaker.ready() and self.bucket.wait_seconds() == 0
+
+    def call(self, fn, *args):
+        """Run one provider request if admitted; returns DEFERRED when it was not."""
+        if not self.breaker.allow():
+            return DEFERRED
+        if not self.bucket.try_acquire():
+            self.breaker.release()
+            return DEFERRED
+        try:
+            result = fn(*args)
+        except urllib.error.HTTPError as exc:
+            if exc.code == 429:  # over budget is not an outage: wait out the window instead of tripping
+                self.throttled += 1
+                self.bucket.hold(_retry_after(exc.headers))
+                self.breaker.release()
+                return DEFERRED
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def observe_budget(self, headers):
+        """Honour ip-api's X-Rl (requests left) / X-Ttl (seconds to reset) response headers."""
+        try:
+            remaining = int(headers.get("X-Rl"))
+        except (TypeError, ValueError):
+            return
+        if remaining <= 0:
+            self.bucket.hold(_retry_after(headers))
+
+    def is_negative(self, ip: str) -> bool:
+        return self.negative.get(ip) is not None
+
+    def remember_failure(self, ip: str):
+        self.negative.set(ip, True)
+
+    def defer(self, ip: str, cache_db_path: str | None):
+        """Queue ``ip`` for background resolution into ``cache_db_path``; the oldest entry goes when full."""
+        if not cache_db_path:
+            return
+        with self._wake:
+            self._deferred.setdefault(ip, set()).add(cache_db_path)
+            self.deferred_total += 1
+            while len(self._deferred) > self.max_deferred:
+                self._deferred.popitem(last=False)
+                self.deferred_dropped += 1
+            self._wake.notify()
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        with self._wake:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="hp-enrichment-deferred", daemon=True)
+                self._thread.start()
+
+    def _requeue(self, items: list[tuple[str, set[str]]]):
+        with self._wake:
+            for ip, paths in reversed(items):
+                self._deferred.setdefault(ip, set()).update(paths)
+                self._deferred.move_to_end(ip, last=False)
+            while len(self._deferred) > self.max_deferred:
+                self._deferred.popitem(last=False)
+                self.deferred_dropped += 1
+
+    def run_once(self) -> int:
+        """Resolve one batch of deferred IPs if a call is admitted; returns how many were resolved."""
+        with self._wake:
+            items = [self._deferred.popitem(last=False) for _ in range(min(self.batch_size, len(self._deferred)))]
+        if not items:
+            return 0
+        try:
+            results = self.call(self.resolve_many, [ip for ip, _ in items])
+        except Exception:
+            results = DEFERRED  # counted by the breaker; retried once it lets a probe through
+        if results is DEFERRED:
+            self._requeue(items)
+            return 0
+        for ip, paths in items:
+            data = results.get(ip)
+            if not data:
+                self.remember_failure(ip)
+                continue
+            for path in paths:
+                store_enrichment_cache(path, ip, data)
+        with self._wake:
+            self.deferred_resolved += len(items)
+        return len(items)
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._wake:
+                while not self._deferred and not self._stop.is_set():
+                    self._wake.wait()
+            delay = max(self.breaker.retry_in(), self.bucket.wait_seconds())
+            if delay > 0 or not self.breaker.ready():
+                self._stop.wait(min(max(delay, 0.05), 1.0))
+                continue
+            try:
+                self.run_once()
+            except Exception:  # a cache write failure must not kill the worker
+                self._stop.wait(1.0)
+
+    def metrics(self) -> dict:
+        with self._wake:
+            deferred = {"queued": len(self._deferred), "total": self.deferred_total,
+                        "resolved": self.deferred_resolved, "dropped": self.deferred_dropped}
+        return {
+            "breaker": self.breaker.snapshot(),
+            "budget": self.bucket.snapshot(),
+            "throttled": self.throttled,
+            "negative_cache": self.negative.stats(),
+            "deferred": deferred,
+        }
+
+    def shutdown(self):
+        self._stop.set()
+        with self._wake:
+            self._wake.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+def _retry_after(headers) -> float:
+    try:
+        return max(1.0, float(headers.get("X-Ttl") or headers.get("Retry-After") or 60))
+    except (TypeError, ValueError):
+        return 60.0
+
+
+_health: ProviderHealth | None = None
+_health_lock = threading.Lock()
+
+
+def provider_health() -> ProviderHealth:
+    """Shared admission control for ip-api requests."""
+    global _health
+    if _health is None:
+        with _health_lock:
+            if _health is None:
+                _health = ProviderHealth(enrich_batch_with_ip_api)
+    return _health
+
+
+def reset_provider_health():
+    """Stop the deferred worker and forget breaker, budget and negative-cache state."""
+    global _health
+    with _health_lock:
+        health, _health = _health, None
+    if health is not None:
+        health.shutdown()
+
+
+def _admitted_batch(ips: list[str], http: KeepAliveHTTP | None = None) -> dict:
+    results = provider_health().call(enrich_batch_with_ip_api, ips, http)
+    return dict.fromkeys(ips, DEFERRED) if results is DEFERRED else results
+
+
+_batcher: EnrichmentBatcher | None = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher() -> EnrichmentBatcher | None:
+    """Shared ip-api batcher, or None when HONEYPOT_ENRICHMENT_BATCH_WINDOW_MS is 0."""
+    global _batcher
+    if BATCH_WINDOW_SECONDS <= 0:
+        return None
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = EnrichmentBatcher(_admitted_batch)
+    return _batcher
+
+
+_lookups = SingleFlight()
+
+
+def enrichment_metrics() -> dict:
+    """Process-wide enrichment counters: provider chain, ip-api batching, coalescing and GeoIP data."""
+    batcher = _batcher
+    if batcher is None:
+        batching = {"enabled": BATCH_WINDOW_SECONDS > 0, "window_seconds": BATCH_WINDOW_SECONDS}
+    else:
+        batching = {"enabled": True, "window_seconds": batcher.buffer.flush_interval, **batcher.metrics()}
+    health = _health.metrics() if _health is not None else None
+    chain = _chain.status() if _chain is not None else None
+    return {"chain": chain, "batcher": batching, "single_flight": _lookups.stats(), "provider_health": health,
+            "geoip": geoip.geoip_status(), "http": _http.stats()}
+
+
+def _lookup_ip_api(ip: str, batcher: EnrichmentBatcher | None = None, http: KeepAliveHTTP | None = None):
+    """ip-api result for ``ip``: a dict, None when unresolved, or DEFERRED when not admitted."""
+    batcher = batcher or get_batcher()
+    if batcher is None:
+        return provider_health().call(enrich_with_ip_api, ip, http)
+    return batcher.submit(ip).result(timeout=TIMEOUT_SECONDS + batcher.buffer.flush_interval)
+
+
+class EnrichmentProvider(abc.ABC):
+    """One source of enrichment fields, registered by name in PROVIDER_FACTORIES.
+
+    ``lookup`` returns a partial record (any of MERGED_FIELDS plus
+    ``reputation_flags`` and optionally ``flag_points``), None when the
+    provider knows nothing about the IP, or DEFERRED when the answer will
+    arrive later. ``network`` providers are only consulted offline (cache
+    only) when HONEYPOT_ENRICHMENT_ENABLED is false. A local provider whose
+    data is not loaded yet reports ``ready = False`` until ``preload()`` (or
+    its first lookup) has loaded it.
+    """
+
+    name = ""
+    network = False
+    ready = True
+    miss_label = "Enrichment unavailable"
+
+    @abc.abstractmethod
+    def lookup(self, ip: str, cache_db_path: str | None = None, offline: bool = False):
+        """Partial record for ``ip``, None or DEFERRED (see the class docstring)."""
+
+    def bind(self, http: KeepAliveHTTP | None = None, batcher: EnrichmentBatcher | None = None):
+        """Use a dedicated HTTP session and ip-api batcher instead of the shared ones."""
+
+    def preload(self):
+        """Load local data now so no lookup has to."""
+
+    def status(self) -> dict:
+        return {}
+
+
+class IpApiEnrichment(EnrichmentProvider):
+    """ip-api.com through the cache, single-flight coalescing, ProviderHealth and the batcher."""
+
+    name = "ip-api"
+    network = True
+    http = None
+    batcher = None
+
+    def bind(self, http=None, batcher=None):
+        self.http, self.batcher = http, batcher
+
+    def lookup(self, ip, cache_db_path=None, offline=False):
+        if cache_db_path:
+            cached = get_enrichment_cache(cache_db_path, ip)
+            if cached:
+                return cached
+        if offline:
+            return None
+        return _lookups.do((cache_db_path, ip), lambda: _resolve_external(ip, cache_db_path, self.batcher, self.http),
+                           timeout=COALESCE_TIMEOUT_SECONDS)
+
+    def status(self):
+        return {"health": _health.metrics() if _health is not None else None}
+
+
+class GeoIPEnrichment(EnrichmentProvider):
+    """Offline GeoIP/ASN range files (see ``geoip``); never cached so reloads apply at once."""
+
+    name = "geoip"
+    miss_label = "Not found in GeoIP data"
+    ready = False
+
+    def preload(self):
+        geoip.get_provider()
+        self.ready = True
+
+    def lookup(self, ip, cache_db_path=None, offline=False):
+        found = enrich_with_geoip(ip)
+        self.ready = True
+        return found
+
+    def status(self):
+        return geoip.geoip_status()
+
+
+class ReputationListEnrichment(EnrichmentProvider):
+    """Local blocklists (see ``reputation``): a listed IP gets ``listed_<name>`` worth that list's points."""
+
+    name = "reputation"
+    miss_label = "Not listed"
+
+    def __init__(self, lists: reputation.ReputationLists | None = None):
+        self.lists = lists
+        self.ready = lists is not None
+
+    def preload(self):
+        if self.lists is None:
+            self.lists = reputation.get_lists()
+        self.ready = True
+
+    def lookup(self, ip, cache_db_path=None, offline=False):
+        if not self.ready:
+            self.preload()
+        names = self.lists.lookup(ip) if self.lists is not None else ()
+        if not names:
+            return None
+        flags = [f"listed_{name}" for name in names]
+        return {"reputation_flags": flags,
+                "flag_points": {flag: self.lists.points[name] for flag, name in zip(flags, names)}}
+
+    def status(self):
+        return self.lists.status() if self.lists is not None else {"lists": {}}
+
+
+class HttpJsonEnrichment(EnrichmentProvider):
+    """Custom JSON-over-HTTP provider described by one entry of HONEYPOT_ENRICHMENT_HTTP_PROVIDERS_FILE.
+
+    ``url`` contains ``{ip}``; ``fields`` maps record fields to dotted paths in
+    the response; an optional ``score`` path becomes the flag ``flag`` (default
+    ``<name>_risk``) worth that many points. Header values written as
+    ``env:NAME`` are read from the environment so secrets stay out of the file.
+    A circuit breaker skips the provider while it keeps failing.
+    """
+
+    network = True
+    http = None
+
+    def __init__(self, config: dict):
+        self.name = str(config.get("name") or "")
+        self.url = str(config.get("url") or "")
+        if not PROVIDER_NAME_RE.match(self.name) or self.name in PROVIDER_FACTORIES:
+            raise ValueError(f"invalid_http_provider_name:{self.name!r}")
+        if not self.url.startswith(("http://", "https://")) or "{ip}" not in self.url:
+            raise ValueError(f"invalid_http_provider_url:{self.name}")
+        self.fields = {key: path for key, path in (config.get("fields") or {}).items() if key in MERGED_FIELDS}
+        self.score_path = config.get("score")
+        self.flag = str(config.get("flag") or f"{self.name}_risk")
+        self.timeout_seconds = float(config.get("timeout_seconds") or TIMEOUT_SECONDS)
+        self.headers = {
+            key: os.environ.get(value[4:], "") if isinstance(value, str) and value.startswith("env:") else str(value)
+            for key, value in (config.get("headers") or {}).items()
+        }
+        self.breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET_SECONDS)
+
+    def bind(self, http=None, batcher=None):
+        self.http = http
+
+    def lookup(self, ip, cache_db_path=None, offline=False):
+        if offline or not self.breaker.allow():
+            return None
+        try:
+            _, body = (self.http or _http).request("GET", self.url.format(ip=urllib.parse.quote(ip)), headers=self.headers,
+                                    timeout=self.timeout_seconds)
+            data = json.loads(body.decode("utf-8"))
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        record = {key: _dotted(data, path) for key, path in self.fields.items()}
+        record = {key: value for key, value in record.items() if value not in (None, "")}
+        try:
+            score = int(float(_dotted(data, self.score_path))) if self.score_path else 0
+        except (TypeError, ValueError):
+            score = 0
+        if score > 0:
+            record.update({"reputation_flags": [self.flag], "flag_points": {self.flag: min(score, 100)}})
+        return record or None
+
+    def status(self):  # never echo the URL or headers: they may carry credentials
+        return {"breaker": self.breaker.snapshot()}
+
+
+def _dotted(data, path):
+    for key in str(path or "").split("."):
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+PROVIDER_NAME_RE = re.compile(r"^[a-z0-9][a-z0-9._-]{0,63}$")
+MERGED_FIELDS = ("country", "city", "region", "lat", "lon", "isp", "asn", "asn_org", "raw_geo")
+PROVIDER_FACTORIES: dict[str, object] = {
+    "ip-api": IpApiEnrichment,
+    "geoip": GeoIPEnrichment,
+    "reputation": ReputationListEnrichment,
+}
+
+
+def register_provider(name: str, factory) -> None:
+    """Make ``factory()`` (returning an EnrichmentProvider) available to HONEYPOT_ENRICHMENT_CHAIN."""
+    if not PROVIDER_NAME_RE.match(name):
+        raise ValueError(f"invalid_provider_name:{name!r}")
+    PROVIDER_FACTORIES[name] = factory
+
+
+def load_http_providers(path: str) -> list[HttpJsonEnrichment]:
+    with open(path, encoding="utf-8") as f:
+        configs = json.load(f)
+    if not isinstance(configs, list):
+        raise ValueError("invalid_http_providers_file")
+    return [HttpJsonEnrichment(config) for config in configs if isinstance(config, dict)]
+
+
+def merge_records(records: list[tuple[str, dict]]) -> dict | None:
+    """Merge provider records given in priority order.
+
+    Each field comes from the highest-priority provider that has it. Flags
+    are unioned; a flag counts once, at the most points any provider gave it,
+    so two providers seeing the same hosting ASN do not double the score. A
+    provider's own ``reputation_score`` (e.g. an older cached record without
+    flags) is a floor for the merged score.
+    """
+    merged: dict = {}
+    points: dict[str, int] = {}
+    floor = 0
+    contributors = []
+    for name, record in records:
+        floor = max(floor, int(record.get("reputation_score") or 0))
+        contributors.append(record.get("enrichment_provider") or name)
+        for field in MERGED_FIELDS:
+            if merged.get(field) in (None, "") and record.get(field) not in (None, ""):
+                merged[field] = record[field]
+        flag_points = record.get("flag_points") or {}
+        for flag in record.get("reputation_flags") or ():
+            points[flag] = max(points.get(flag, 0), int(flag_points.get(flag, REPUTATION_POINTS.get(flag, 0))))
+    if not contributors:
+        return None
+    score = min(max(sum(points.values()), floor), 100)
+    merged.update({
+        "reputation_score": score,
+        "reputation_level": level_for_score(score),
+        "reputation_flags": sorted(points),
+        "enrichment_provider": "+".join(contributors),
+    })
+    return merged
+
+
+class ProviderChain:
+    """Queries providers concurrently under one deadline and merges their records by priority.
+
+    Loaded local providers run on the calling thread while network providers
+    run on a shared pool, so the cost of a lookup is the slowest provider that
+    answers within the deadline rather than the sum. A local provider that
+    still has to load its data (see ``preload``) goes to the pool as well, and
+    local calls are skipped as timed out once the deadline has passed, so
+    the deadline bounds the whole lookup. Answers arriving after
+    the deadline are dropped; they are counted under ``timeouts`` as well as
+    under their eventual outcome. A timed-out call that has not started is
+    cancelled; one already running keeps its worker until it returns, and
+    while such overruns hold every worker pooled providers are ``skipped``
+    rather than queued behind them.
+    """
+
+    def __init__(self, providers: list[EnrichmentProvider], deadline_seconds: float = CHAIN_DEADLINE_SECONDS,
+                 unknown: list[str] | None = None, error: str | None = None, workers: int = CHAIN_WORKERS):
+        self.providers = providers
+        self.deadline_seconds = deadline_seconds
+        self.unknown = unknown or []
+        self.error = error
+        self.workers = workers
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._overrunning = 0
+        self.counts = {provider.name: {"answered": 0, "missed": 0, "deferred": 0, "errors": 0, "timeouts": 0,
+                                       "skipped": 0}
+                       for provider in providers}
+        self.latency = {provider.name: Histogram(LATENCY_BUCKETS_SECONDS) for provider in providers}
+
+    def _executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix="hp-enrich")
+        return self._pool
+
+    def _count(self, name: str, outcome: str):
+        with self._lock:
+            self.counts[name][outcome] += 1
+
+    def _call(self, provider: EnrichmentProvider, ip: str, cache_db_path: str | None, offline: bool):
+        started = time.perf_counter()
+        try:
+            result = provider.lookup(ip, cache_db_path, offline)
+        except Exception:
+            result, outcome = None, "errors"
+        else:
+            outcome = "deferred" if result is DEFERRED else ("answered" if result else "missed")
+        self.latency[provider.name].observe(time.perf_counter() - started)
+        self._count(provider.name, outcome)
+        return result
+
+    def _abandon(self, future: concurrent.futures.Future):
+        """Give up on a call past the deadline, tracking it while it still holds a worker."""
+        if future.cancel():
+            return
+        with self._lock:
+            self._overrunning += 1
+        future.add_done_callback(self._overrun_done)
+
+    def _overrun_done(self, _future):
+        with self._lock:
+            self._overrunning -= 1
+
+    def preload(self):
+        """Load every local provider's data, e.g. at startup, instead of on the first lookup."""
+        for provider in self.providers:
+            if not provider.network:
+                provider.preload()
+
+    def enrich(self, ip: str, cache_db_path: str | None = None, offline: bool = False) -> dict:
+        pooled = [p for p in self.providers if p.network or not p.ready]
+        deadline = time.monotonic() + self.deadline_seconds
+        with self._lock:
+            saturated = self._overrunning >= self.workers
+        futures = {}
+        if pooled and saturated:
+            for provider in pooled:
+                self._count(provider.name, "skipped")
+        elif pooled:
+            futures = {p.name: self._executor().submit(self._call, p, ip, cache_db_path, offline) for p in pooled}
+        results = {}
+        for provider in self.providers:
+            if provider in pooled:
+                continue
+            if time.monotonic() >= deadline:
+                self._count(provider.name, "timeouts")
+            else:
+                results[provider.name] = self._call(provider, ip, cache_db_path, offline)
+        if futures:
+            concurrent.futures.wait(futures.values(), timeout=max(0.0, deadline - time.monotonic()))
+            for name, future in futures.items():
+                if future.done() and not future.cancelled():
+                    results[name] = future.result()
+                else:
+                    self._count(name, "timeouts")
+                    self._abandon(future)
+        records = [(p.name, results[p.name]) for p in self.providers if isinstance(results.get(p.name), dict)]
+        merged = merge_records(records)
+        if merged is None:
+            return self._degraded(ip, results, offline)
+        if len(records) < len(self.providers) and all(merged.get(field) in (None, "") for field in ("country", "asn_org")):
+            # e.g. only the blocklists answered while ip-api was deferred: keep the flags, but
+            # label the record like a full miss so the backfill re-enriches its location.
+            merged["asn_org"] = self._miss(results, offline)[0]
+        return merged
+
+    def _miss(self, results: dict, offline: bool) -> tuple[str, str]:
+        """``(asn_org, enrichment_provider)`` explaining why providers without a record in ``results`` gave none."""
+        missing = [p for p in self.providers if not isinstance(results.get(p.name), dict)]
+        deferred = [p for p in missing if results.get(p.name) is DEFERRED]
+        if deferred:
+            return "Enrichment deferred", deferred[0].name
+        if not self.providers:
+            return "Unsupported enrichment provider", self.unknown[0] if self.unknown else "unknown"
+        if offline and missing and all(p.network for p in missing):
+            return "External enrichment disabled", "disabled"
+        first = (missing or self.providers)[0]
+        return first.miss_label, first.name
+
+    def _degraded(self, ip: str, results: dict, offline: bool) -> dict:
+        result = local_enrichment(ip)
+        asn_org, provider = self._miss(results, offline)
+        result.update({"asn_org": asn_org, "enrichment_provider": provider})
+        return result
+
+    def status(self) -> dict:
+        with self._lock:
+            counts = {name: dict(value) for name, value in self.counts.items()}
+            overrunning = self._overrunning
+        return {
+            "providers": [
+                {"name": p.name, "network": p.network, **counts[p.name],
+                 "latency_seconds": self.latency[p.name].snapshot(), **p.status()}
+                for p in self.providers
+            ],
+            "unknown": self.unknown,
+            "error": self.error,
+            "deadline_seconds": self.deadline_seconds,
+            "overrunning": overrunning,
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def build_chain(spec: str, http_providers_file: str = "", http: KeepAliveHTTP | None = None,
+                batcher: EnrichmentBatcher | None = None) -> ProviderChain:
+    """Instantiate the providers named in ``spec``; unknown names are reported, a bad config fails closed.
+
+    ``http`` and ``batcher`` replace the shared HTTP session and ip-api batcher for this chain's providers.
+    """
+    factories = dict(PROVIDER_FACTORIES)
+    error = None
+    try:
+        if http_providers_file:
+            for provider in load_http_providers(http_providers_file):
+                factories[provider.name] = lambda provider=provider: provider
+        providers, unknown = [], []
+        for name in dict.fromkeys(part.strip() for part in spec.split(",") if part.strip()):
+            if name in factories:
+                providers.append(factories[name]())
+            else:
+                unknown.append(name)
+    except (OSError, ValueError) as exc:
+        error = str(exc) if isinstance(exc, ValueError) else f"load_failed:{exc.__class__.__name__}"
+        providers, unknown = [], []
+    if http is not None or batcher is not None:
+        for provider in providers:
+            provider.bind(http, batcher)
+    return ProviderChain(providers, unknown=unknown, error=error)
+
+
+_chain: ProviderChain | None = None
+_chain_spec = None
+_chain_lock = threading.Lock()
+
+
+def configured_chain_spec() -> tuple[str, str]:
+    """``build_chain`` arguments for HONEYPOT_ENRICHMENT_CHAIN.
+
+    Without an explicit chain: HONEYPOT_ENRICHMENT_PROVIDER, then the local
+    blocklists when HONEYPOT_REPUTATION_LISTS is set.
+    """
+    default = DEFAULT_PROVIDER + (",reputation" if reputation.LISTS_SPEC else "")
+    return PROVIDER_CHAIN or default, HTTP_PROVIDERS_FILE
+
+
+def get_chain() -> ProviderChain:
+    """Shared chain for the configured spec (see ``configured_chain_spec``); rebuilt if the spec changes."""
+    global _chain, _chain_spec
+    spec = configured_chain_spec()
+    if _chain is None or _chain_spec != spec:
+        with _chain_lock:
+            if _chain is None or _chain_spec != spec:
+                if _chain is not None:
+                    _chain.shutdown()
+                _chain, _chain_spec = build_chain(*spec), spec
+    return _chain
+
+
 def enrich_ip(ip: str, cache_db_path: str | None = None) -> dict:
     if not ip or not is_public_ip(ip):
         return local_enrichment(ip)
+    return get_chain().enrich(ip, cache_db_path, offline=not ENABLE_EXTERNAL)
+
+
+def _resolve_external(ip: str, cache_db_path: str | None, batcher: EnrichmentBatcher | None = None,
+                      http: KeepAliveHTTP | None = None):
+    """Provider lookup run once per IP by the single-flight leader; stores before waiters are released."""
     if cache_db_path:
-        cached = get_enrichment_cache(cache_db_path, ip)
+        cached = get_enrichment_cache(cache_db_path, ip)  # a flight that just landed may have filled it
         if cached:
             return cached
-    if not ENABLE_EXTERNAL:
-        result = local_enrichment(ip)
-        result.update({"asn_org": "External enrichment disabled", "enrichment_provider": "disabled"})
-        return result
-    if DEFAULT_PROVIDER != "ip-api":
-        result = local_enrichment(ip)
-        result.update({"asn_org": "Unsupported enrichment provider", "enrichment_provider": DEFAULT_PROVIDER or "unknown"})
-        return result
+    health = provider_health()
+    if health.is_negative(ip):
+        return None
+    if not health.ready():  # breaker open or budget spent: answer now, resolve in the background
+        health.defer(ip, cache_db_path)
+        return DEFERRED
     try:
-        enriched = enrich_with_ip_api(ip)
+        enriched = _lookup_ip_api(ip, batcher, http)
     except Exception:
         enriched = None
+    if enriched is DEFERRED:
+        health.defer(ip, cache_db_path)
+        return DEFERRED
     if not enriched:
-        result = local_enrichment(ip)
-        result.update({"asn_org": "Enrichment unavailable", "enrichment_provider": "ip-api"})
-        return result
+        health.remember_failure(ip)
+        return None
     if cache_db_path:
         store_enrichment_cache(cache_db_path, ip, enriched)
     return enriched
+
+
+# asn_org values written when no provider supplied a location; rows carrying them are re-enriched by the backfill.
+DEGRADED_LABELS = (
+    "Enrichment unavailable",
+    "Enrichment deferred",
+    "External enrichment disabled",
+    "Unsupported enrichment provider",
+)
+
+
+class EnrichmentUnavailable(RuntimeError):
+    """The provider did not admit a request within the caller's wait budget."""
+
+
+def is_degraded(record: dict) -> bool:
+    return record.get("asn_org") in DEGRADED_LABELS
+
+
+def prefetch(ips: list[str], cache_db_path: str, wait_seconds: float = BACKFILL_WAIT_SECONDS,
+             chain: ProviderChain | None = None, http: KeepAliveHTTP | None = None) -> int:
+    """Resolve uncached public ``ips`` into the cache with ip-api batch requests; returns how many resolved.
+
+    Meant for bulk callers such as the re-enrichment backfill: each batch of
+    up to IP_API_BATCH_LIMIT waits for ProviderHealth to admit it, spending
+    the same budget as live lookups instead of flooding the deferred queue.
+    Raises EnrichmentUnavailable when a batch is not admitted within
+    ``wait_seconds``. Does nothing when ip-api is not in the chain or
+    external enrichment is disabled.
+    """
+    if not ENABLE_EXTERNAL or not any(p.name == IpApiEnrichment.name for p in (chain or get_chain()).providers):
+        return 0
+    cache = enrichment_cache(cache_db_path)
+    health = provider_health()
+    pending = [ip for ip in dict.fromkeys(ips)
+               if is_public_ip(ip) and not health.is_negative(ip) and cache.get(ip) is None]
+    resolved = 0
+    for offset in range(0, len(pending), IP_API_BATCH_LIMIT):
+        batch = pending[offset:offset + IP_API_BATCH_LIMIT]
+        deadline = time.monotonic() + wait_seconds
+        while True:
+            try:
+                results = health.call(enrich_batch_with_ip_api, batch, http)
+            except Exception:
+                results = DEFERRED  # counted by the breaker, which paces the retries once open
+            if results is not DEFERRED:
+                break
+            delay = max(health.breaker.retry_in(), health.bucket.wait_seconds(), 0.5)
+            if time.monotonic() + delay > deadline:
+                raise EnrichmentUnavailable("ip-api did not admit a batch in time")
+            time.sleep(delay)
+        for ip in batch:
+            data = results.get(ip)
+            if data:
+                cache.set(ip, data)
+                resolved += 1
+            else:
+                health.remember_failure(ip)
+    return resolved
+
+
+class EnrichmentService:
+    """The one entry point for geo and reputation lookups against a HoneyPot database.
+
+    HoneypotDatabase owns one and the sensors reach it through their database,
+    so no caller talks to a provider directly. By default the service uses
+    the process-wide provider chain, ip-api batcher and pooled HTTP session,
+    so every database in the process shares one batching window. With
+    ``dedicated=True`` it builds its own chain, batcher and session instead.
+    ProviderHealth stays process-wide either way, because the provider budget
+    belongs to the egress address. A ``chain`` passed in is borrowed. The
+    per-database cache is shared by reference count. ``close()`` shuts down
+    only what the service built and drops its cache reference, so closing one
+    HoneypotDatabase never breaks another open on the same file.
+    """
+
+    def __init__(self, cache_db_path: str | None = None, chain: ProviderChain | None = None, dedicated: bool = False):
+        self.cache_db_path = cache_db_path
+        self._http = KeepAliveHTTP() if dedicated else None
+        self._batcher = None
+        if dedicated and BATCH_WINDOW_SECONDS > 0:
+            self._batcher = EnrichmentBatcher(lambda ips: _admitted_batch(ips, self._http))
+        self._owns_chain = dedicated and chain is None
+        if self._owns_chain:
+            chain = build_chain(*configured_chain_spec(), http=self._http, batcher=self._batcher)
+        self._chain = chain
+        self.cache = acquire_enrichment_cache(cache_db_path) if cache_db_path else None
+
+    @property
+    def chain(self) -> ProviderChain:
+        return self._chain if self._chain is not None else get_chain()
+
+    @property
+    def batcher(self) -> EnrichmentBatcher | None:
+        return self._batcher if self._http is not None else get_batcher()
+
+    @property
+    def http(self) -> KeepAliveHTTP:
+        return self._http or _http
+
+    def preload_async(self) -> threading.Thread:
+        """Load the chain's GeoIP ranges and blocklists in the background so no sensor thread waits on them."""
+        thread = threading.Thread(target=self.chain.preload, name="hp-enrich-preload", daemon=True)
+        thread.start()
+        return thread
+
+    def enrich(self, ip: str) -> dict:
+        if not ip or not is_public_ip(ip):
+            return local_enrichment(ip)
+        return self.chain.enrich(ip, self.cache_db_path, offline=not ENABLE_EXTERNAL)
+
+    def prefetch(self, ips: list[str], wait_seconds: float = BACKFILL_WAIT_SECONDS) -> int:
+        if not self.cache_db_path:
+            return 0
+        return prefetch(ips, self.cache_db_path, wait_seconds, chain=self.chain, http=self._http)
+
+    def metrics(self) -> dict:
+        metrics = {"cache": self.cache.stats() if self.cache is not None else None, **enrichment_metrics()}
+        if self._http is not None:
+            batcher = self._batcher
+            metrics.update({
+                "chain": self.chain.status(),
+                "http": self._http.stats(),
+                "batcher": ({"enabled": True, "window_seconds": batcher.buffer.flush_interval, **batcher.metrics()}
+                            if batcher is not None else {"enabled": False, "window_seconds": BATCH_WINDOW_SECONDS}),
+            })
+        return metrics
+
+    def close(self):
+        """Shut down what this service built and release its cache reference; shared components stay up."""
+        if self._owns_chain:
+            self._owns_chain = False
+            self._chain.shutdown()
+        if self._batcher is not None:
+            self._batcher.shutdown()
+            self._batcher = None
+        if self._http is not None:
+            self._http.close()
+        if self.cache is not None:
+            self.cache = None
+            release_enrichment_cache(self.cache_db_path)
@@ -0,0 +1,464 @@
+"""Offline GeoIP/ASN lookups for HoneyPot v3 enrichment.
+
+Range files listed in HONEYPOT_GEOIP_PATHS (files or directories, comma
+separated) are loaded into one sorted interval index per address family:
+parallel arrays of range starts, range ends, latitude/longitude and an index
+into a table of deduplicated (country, region, city, asn, asn_org) records.
+A lookup is one binary search; nothing touches the network.
+
+CSV files either carry a ``network`` CIDR column (GeoLite2 blocks) or
+``start_ip``/``end_ip`` columns. GeoLite2 blocks that only reference a
+``geoname_id`` are joined with the matching ``*-Locations-en.csv`` file in the
+same directory. ``.mmdb`` files need the optional ``maxminddb`` package.
+
+The data files are re-checked every HONEYPOT_GEOIP_RELOAD_SECONDS; changed
+files are loaded on a background thread and swapped in once complete
+(``ReloadingResource``), so lookups keep answering from the
+previous data meanwhile.
+"""
+
+from __future__ import annotations
+
+import abc
+import bisect
+import csv
+import glob
+import math
+import os
+import socket
+import threading
+import time
+from array import array
+
+GEOIP_PATHS = [p.strip() for p in os.environ.get("HONEYPOT_GEOIP_PATHS", "").split(",") if p.strip()]
+RELOAD_SECONDS = float(os.environ.get("HONEYPOT_GEOIP_RELOAD_SECONDS", "60"))
+FIELDS = ("country", "region", "city", "asn", "asn_org")
+_LOW64 = (1 << 64) - 1
+
+COLUMN_ALIASES = {
+    "country": ("country", "country_name"),
+    "region": ("region", "subdivision_1_name"),
+    "city": ("city", "city_name"),
+    "asn": ("asn", "autonomous_system_number"),
+    "asn_org": ("asn_org", "autonomous_system_organization"),
+    "lat": ("lat", "latitude"),
+    "lon": ("lon", "longitude"),
+}
+
+
+def _cell(row: list[str], index: int | None) -> str | None:
+    if index is None or index >= len(row):
+        return None
+    return row[index].strip() or None
+
+
+def parse_address(text: str) -> tuple[int, int]:
+    """(version, integer value) of an IPv4/IPv6 address; inet_pton is much cheaper than ipaddress."""
+    text = text.strip()
+    family, version = (socket.AF_INET6, 6) if ":" in text else (socket.AF_INET, 4)
+    try:
+        return version, int.from_bytes(socket.inet_pton(family, text), "big")
+    except OSError:
+        raise ValueError(f"geoip_invalid_address:{text}") from None
+
+
+def parse_network(text: str) -> tuple[int, int, int]:
+    address, _, length = text.partition("/")
+    version, value = parse_address(address)
+    bits = 32 if version == 4 else 128
+    host_bits = bits - int(length) if length.strip().isdigit() else (0 if not length else -1)
+    if not 0 <= host_bits <= bits:
+        raise ValueError(f"geoip_invalid_network:{text.strip()}")
+    mask = (1 << host_bits) - 1
+    return version, value & ~mask, value | mask
+
+
+def _as_asn(value) -> str | None:
+    if value in (None, ""):
+        return None
+    text = str(value).strip().upper()
+    return text if text.startswith("AS") else f"AS{text}"
+
+
+def _as_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class IntervalIndex:
+    """Sorted, non-overlapping address ranges of one family mapped to shared records.
+
+    Records are arbitrary hashable tuples (GeoIP fields here, list names in
+    ``reputation``); ``coordinates=False`` drops the per-range lat/lon arrays.
+
+    Ranges are appended straight into typed arrays while a file is read, so a
+    load never holds per-range Python objects. IPv4 bounds are 32-bit; IPv6
+    bounds are split into high and low 64-bit halves. ``finish()`` sorts and
+    drops overlaps only when the input needs it (GeoLite2 files are already
+    sorted and disjoint).
+    """
+
+    def __init__(self, version: int, coordinates: bool = True):
+        self.version = version
+        self.coordinates = coordinates
+        self.records: list[tuple] = []
+        self._record_lookup: dict[tuple, int] | None = {}
+        code = "I" if version == 4 else "Q"
+        self._starts, self._ends = array(code), array(code)
+        self._starts_low, self._ends_low = array("Q"), array("Q")
+        self._record_ids = array("I")
+        self._lat, self._lon = array("f"), array("f")
+        self._last_end = -1
+        self._ordered = True
+
+    def __len__(self) -> int:
+        return len(self._record_ids)
+
+    def add(self, start: int, end: int, record: tuple, lat: float = math.nan, lon: float = math.nan):
+        record_id = self._record_lookup.get(record)
+        if record_id is None:
+            record_id = self._record_lookup[record] = len(self.records)
+            self.records.append(record)
+        if start <= self._last_end:
+            self._ordered = False
+        self._last_end = max(self._last_end, end)
+        if self.version == 4:
+            self._starts.append(start)
+            self._ends.append(end)
+        else:
+            self._starts.append(start >> 64)
+            self._starts_low.append(start & _LOW64)
+            self._ends.append(end >> 64)
+            self._ends_low.append(end & _LOW64)
+        self._record_ids.append(record_id)
+        if self.coordinates:
+            self._lat.append(lat)
+            self._lon.append(lon)
+
+    def finish(self) -> "IntervalIndex":
+        """Sort by range start; of overlapping ranges the one listed first in the file wins."""
+        self._record_lookup = None
+        if self._ordered:
+            return self
+        columns = (self._starts, self._ends, self._starts_low, self._ends_low, self._record_ids, self._lat, self._lon)
+        order = sorted(range(len(self)), key=lambda i: (self._start(i), i))
+        keep, last_end = [], -1
+        for i in order:
+            if self._start(i) > last_end:
+                keep.append(i)
+                last_end = self._end(i)
+        for column in columns:
+            if len(column):
+                column[:] = array(column.typecode, (column[i] for i in keep))
+        self._ordered = True
+        return self
+
+    def _start(self, i: int) -> int:
+        return self._starts[i] if self.version == 4 else (self._starts[i] << 64) | self._starts_low[i]
+
+    def _end(self, i: int) -> int:
+        return self._ends[i] if self.version == 4 else (self._ends[i] << 64) | self._ends_low[i]
+
+    def _position(self, value: int) -> int:
+        """Index of the last range starting at or below ``value``, or -1."""
+        if self.version == 4:
+            return bisect.bisect_right(self._starts, value) - 1
+        high, low = value >> 64, value & _LOW64
+        lo, hi = bisect.bisect_left(self._starts, high), bisect.bisect_right(self._starts, high)
+        if lo == hi:
+            return lo - 1
+        return bisect.bisect_right(self._starts_low, low, lo, hi) - 1
+
+    def find(self, value: int) -> int:
+        """Position of the range containing ``value``, or -1."""
+        i = self._position(value)
+        return i if i >= 0 and value <= self._end(i) else -1
+
+    def record(self, value: int) -> tuple | None:
+        if self.version == 4:  # hot path for blocklist lookups: one bisect, no helper calls
+            i = bisect.bisect_right(self._starts, value) - 1
+            return self.records[self._record_ids[i]] if i >= 0 and value <= self._ends[i] else None
+        i = self.find(value)
+        return self.records[self._record_ids[i]] if i >= 0 else None
+
+    def lookup(self, value: int) -> dict | None:
+        i = self.find(value)
+        if i < 0:
+            return None
+        result = {field: item for field, item in zip(FIELDS, self.records[self._record_ids[i]]) if item is not None}
+        if self.coordinates and not math.isnan(self._lat[i]) and not math.isnan(self._lon[i]):
+            result["lat"], result["lon"] = round(self._lat[i], 4), round(self._lon[i], 4)
+        return result
+
+    def memory_bytes(self) -> int:
+        arrays = (self._starts, self._ends, self._starts_low, self._ends_low, self._record_ids, self._lat, self._lon)
+        return sum(a.itemsize * len(a) for a in arrays)
+
+
+class ReloadingResource(abc.ABC):
+    """A value built from data files that is rebuilt off-thread when the files change.
+
+    Subclasses implement ``build()`` (the expensive load) and ``signature()``
+    (a cheap fingerprint such as mtimes and sizes). ``maybe_reload()`` is
+    called on the hot path; at most every ``reload_seconds`` it compares the
+    fingerprint and, if it changed, rebuilds on a daemon thread and swaps the
+    new value in with one assignment, so readers never see a half-built
+    value. A failed build keeps the previous value, records ``error`` and is
+    not retried until the files change again.
+    """
+
+    thread_name = "hp-reload"
+
+    def __init__(self, reload_seconds: float = 60.0):
+        self.reload_seconds = float(reload_seconds)
+        self.value = None
+        self.error: str | None = None
+        self.reloads = 0
+        self._signature = None
+        self._failed_signature = None
+        self._checked_at = time.monotonic()
+        self._reloading = False
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def build(self):
+        """Load the value from the data files."""
+
+    @abc.abstractmethod
+    def signature(self):
+        """Cheap fingerprint of the data files; a change triggers a rebuild."""
+
+    def reload(self) -> bool:
+        """Rebuild now; returns False (keeping the old value) when the build fails."""
+        signature = self.signature()
+        try:
+            value = self.build()
+        except Exception as exc:  # a malformed file must never escape to lookups
+            known = isinstance(exc, (ValueError, RuntimeError))
+            self.error = str(exc) if known else f"load_failed:{exc.__class__.__name__}"
+            self._failed_signature = signature
+            return False
+        with self._lock:
+            self.value, self._signature = value, signature
+            self.error = self._failed_signature = None
+            self.reloads += 1
+        return True
+
+    def _reload_in_background(self):
+        try:
+            self.reload()
+        finally:
+            with self._lock:
+                self._reloading = False
+
+    def maybe_reload(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._reloading or self.reload_seconds <= 0 or now - self._checked_at < self.reload_seconds:
+                return
+            self._checked_at = now
+        signature = self.signature()
+        if signature == self._failed_signature or signature == self._signature:
+            return
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._reload_in_background, name=self.thread_name, daemon=True).start()
+
+    def status(self) -> dict:
+        return {"reloads": self.reloads, "reloading": self._reloading, "error": self.error}
+
+
+def _locations_for(path: str) -> dict[str, tuple]:
+    """geoname_id -> (country, region, city) from the GeoLite2 locations file next to a blocks file."""
+    prefix = os.path.basename(path).split("-Blocks-")[0]
+    matches = sorted(glob.glob(os.path.join(os.path.dirname(path), f"{prefix}-Locations-*.csv")))
+    matches.sort(key=lambda name: not name.endswith("-en.csv"))
+    if not matches:
+        return {}
+    locations = {}
+    with open(matches[0], newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if row.get("geoname_id"):
+                locations[row["geoname_id"]] = tuple(
+                    (row.get(name) or "").strip() or None
+                    for name in ("country_name", "subdivision_1_name", "city_name")
+                )
+    return locations
+
+
+def _csv_ranges(path: str):
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        position = {name.strip(): i for i, name in enumerate(next(reader, []))}
+        if "network" not in position and not {"start_ip", "end_ip"} <= position.keys():
+            raise ValueError(f"geoip_unknown_columns:{os.path.basename(path)}")
+        column = {
+            field: next((position[name] for name in aliases if name in position), None)
+            for field, aliases in COLUMN_ALIASES.items()
+        }
+        geoname = position.get("geoname_id")
+        registered = position.get("registered_country_geoname_id")
+        locations = _locations_for(path) if geoname is not None else {}
+        network = position.get("network")
+        for row in reader:
+            if not row:
+                continue
+            if network is not None:
+                version, start, end = parse_network(row[network])
+            else:
+                version, start = parse_address(row[position["start_ip"]])
+                end_version, end = parse_address(row[position["end_ip"]])
+                if end_version != version or end < start:
+                    raise ValueError(f"geoip_invalid_range:{row[position['start_ip']].strip()}")
+            country, region, city = (_cell(row, column[field]) for field in ("country", "region", "city"))
+            if locations:
+                location = locations.get(_cell(row, geoname) or _cell(row, registered) or "")
+                if location:
+                    country, region, city = country or location[0], region or location[1], city or location[2]
+            record = (country, region, city, _as_asn(_cell(row, column["asn"])), _cell(row, column["asn_org"]))
+            yield version, start, end, record, _as_float(_cell(row, column["lat"])), _as_float(_cell(row, column["lon"]))
+
+
+def _mmdb_name(data: dict, key: str) -> str | None:
+    return ((data.get(key) or {}).get("names") or {}).get("en")
+
+
+def _mmdb_ranges(path: str):
+    try:  # imported lazily: CSV data needs no extra package
+        import maxminddb
+    except ImportError:
+        raise RuntimeError("maxminddb_unavailable") from None
+    with maxminddb.open_database(path) as reader:
+        for network, data in reader:
+            data = data or {}
+            subdivisions = data.get("subdivisions") or [{}]
+            location = data.get("location") or {}
+            record = (_mmdb_name(data, "country") or _mmdb_name(data, "registered_country"),
+                      (subdivisions[0].get("names") or {}).get("en"), _mmdb_name(data, "city"),
+                      _as_asn(data.get("autonomous_system_number")),
+                      data.get("autonomous_system_organization"))
+            yield (network.version, int(network.network_address), int(network.broadcast_address), record,
+                   _as_float(location.get("latitude")), _as_float(location.get("longitude")))
+
+
+def data_files(paths: list[str]) -> list[str]:
+    """Expand directories into their CSV/MMDB range files; locations files are joined, not indexed."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            candidates = sorted(glob.glob(os.path.join(path, "*.csv")) + glob.glob(os.path.join(path, "*.mmdb")))
+            files.extend(name for name in candidates if "-Locations-" not in os.path.basename(name))
+        else:
+            files.append(path)
+    return files
+
+
+class GeoIPDatabase:
+    """Interval indexes for a set of data files; earlier files win field by field."""
+
+    def __init__(self, paths: list[str]):
+        self.files = data_files(paths)
+        self.indexes: list[tuple[IntervalIndex, IntervalIndex]] = []
+        for path in self.files:
+            loader = _mmdb_ranges if path.endswith(".mmdb") else _csv_ranges
+            v4, v6 = IntervalIndex(4), IntervalIndex(6)
+            for version, start, end, record, lat, lon in loader(path):
+                (v4 if version == 4 else v6).add(start, end, record, lat, lon)
+            self.indexes.append((v4.finish(), v6.finish()))
+        self.loaded_at = time.time()
+
+    def lookup(self, ip: str) -> dict | None:
+        try:
+            version, value = parse_address(ip)
+        except ValueError:
+            return None
+        merged: dict = {}
+        for v4, v6 in self.indexes:
+            found = (v4 if version == 4 else v6).lookup(value)
+            for key, item in (found or {}).items():
+                merged.setdefault(key, item)
+        return merged or None
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self.files),
+            "ipv4_ranges": sum(len(v4) for v4, _ in self.indexes),
+            "ipv6_ranges": sum(len(v6) for _, v6 in self.indexes),
+            "records": sum(len(v4.records) + len(v6.records) for v4, v6 in self.indexes),
+            "index_bytes": sum(v4.memory_bytes() + v6.memory_bytes() for v4, v6 in self.indexes),
+            "loaded_at": self.loaded_at,
+        }
+
+
+def file_signature(files: list[str]) -> tuple:
+    signature = []
+    for path in files:
+        try:
+            st = os.stat(path)
+            signature.append((path, st.st_mtime_ns, st.st_size))
+        except OSError:
+            signature.append((path, None, None))
+    return tuple(signature)
+
+
+class GeoIPProvider(ReloadingResource):
+    """Serves lookups from the current GeoIPDatabase and swaps in a fresh one when files change.
+
+    A failed load keeps the previous database and records the error in ``status()``.
+    """
+
+    thread_name = "hp-geoip-reload"
+
+    def __init__(self, paths: list[str], reload_seconds: float = RELOAD_SECONDS):
+        super().__init__(reload_seconds)
+        self.paths = list(paths)
+        self.reload()
+
+    @property
+    def database(self) -> GeoIPDatabase | None:
+        return self.value
+
+    def build(self) -> GeoIPDatabase:
+        return GeoIPDatabase(self.paths)
+
+    def signature(self) -> tuple:
+        return file_signature(data_files(self.paths))
+
+    def lookup(self, ip: str) -> dict | None:
+        self.maybe_reload()
+        database = self.value
+        return database.lookup(ip) if database is not None else None
+
+    def status(self) -> dict:
+        database = self.value
+        status = {"paths": self.paths, **super().status()}
+        if database is not None:
+            status.update(database.stats())
+        return status
+
+
+_provider: GeoIPProvider | None = None
+_provider_lock = threading.Lock()
+
+
+def get_provider() -> GeoIPProvider | None:
+    """Shared provider over HONEYPOT_GEOIP_PATHS, or None when no paths are configured."""
+    global _provider
+    if not GEOIP_PATHS:
+        return None
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = GeoIPProvider(GEOIP_PATHS)
+    return _provider
+
+
+def geoip_status() -> dict:
+    provider = _provider
+    if provider is None:
+        return {"enabled": bool(GEOIP_PATHS), "paths": GEOIP_PATHS}
+    return {"enabled": True, **provider.status()}
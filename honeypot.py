@@ -13,26 +13,32 @@ import sqlite3
 import sys
 import threading
 import time
-import urllib.request
 from abc import ABC, abstractmethod
 from datetime import datetime, timezone
-from ipaddress import ip_address
 
 from env_loader import load_env_file
 
 load_env_file()
 
 from app_meta import APP_NAME, APP_VERSION
-from notifications import send_alert_async, severity_for_category
+from notifications import alert_delivery_configured, send_alert_async, severity_for_category
 from v31_core import (
+    AnalysisExecutor,
+    BatchedSessionClassifier,
+    ClassificationStats,
     EventWriteBuffer,
     LazyClassifier,
+    MinHasher,
+    ResumableJob,
     SessionReplay,
+    SessionSequenceClassifier,
+    StreamingCommandClassifier,
+    classify_intent,
     deception_headers,
     detect_collaborator_payload,
     fingerprint_http_request,
 )
-from enrichment import enrich_ip
+from enrichment import DEGRADED_LABELS, CacheMaintenance, EnrichmentService, is_degraded
 
 try:
     import paramiko
@@ -40,13 +46,21 @@ except ImportError:
     paramiko = None
 
 try:
-    from ml.attack_classifier import predict as predict_attack
+    from ml.attack_classifier import predict as predict_attack, predict_many as predict_attack_many
+    from ml.attack_classifier import preload_model_async as preload_classifier, shutdown_process_pool
+    from ml.online import categories as model_categories
 except ImportError:
     def predict_attack(cmd): return None
+    def predict_attack_many(cmds): return [None] * len(cmds)
+    def model_categories(): return []
+    def preload_classifier(): return None
+    def shutdown_process_pool(wait=False): return None
 
 MIN_SESSION_SECONDS = 120
 MAX_CAPTURE_CHARS = int(os.environ.get("HONEYPOT_MAX_CAPTURE_CHARS", "2048"))
 SOCKET_TIMEOUT_SECONDS = int(os.environ.get("HONEYPOT_SOCKET_TIMEOUT_SECONDS", "60"))
+# Literal (not bound) so the partial index below matches the backfill queries.
+DEGRADED_ENRICHMENT_SQL = "asn_org IN ({})".format(", ".join("'{}'".format(label.replace("'", "''")) for label in DEGRADED_LABELS))
 
 
 def sanitize_event_text(value, max_chars=MAX_CAPTURE_CHARS):
@@ -76,14 +90,18 @@ def sanitize_event_text(value, max_chars=MAX_CAPTURE_CHARS):
 
 # --- Database ---
 class HoneypotDatabase:
-    def __init__(self, db_path="honeypot.db"):
+    def __init__(self, db_path="honeypot.db", enrichment=None):
         self.db_path = db_path
+        # Every geo/reputation lookup (sensors included, via their db) goes through this service.
+        self._owns_enrichment = enrichment is None
+        self.enrichment = enrichment or EnrichmentService(db_path)
         self._local = threading.local()
         self._write_lock = threading.RLock()
         self._init_db()
         self.command_buffer = EventWriteBuffer(
             flush_interval=float(os.environ.get("HONEYPOT_DB_FLUSH_INTERVAL", "0.5")),
             sink=self._write_command_batch,
+            max_batch_size=int(os.environ.get("HONEYPOT_DB_FLUSH_MAX_BATCH", "500")),
         )
         if os.environ.get("HONEYPOT_DB_BUFFER_AUTOSTART", "true").strip().lower() in {"1", "true", "yes", "on"}:
             self.command_buffer.start()
@@ -170,6 +188,42 @@ class HoneypotDatabase:
                 data TEXT NOT NULL,
                 timestamp TEXT NOT NULL
             );
+            CREATE TABLE IF NOT EXISTS command_labels (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                command_id INTEGER NOT NULL,
+                command TEXT NOT NULL,
+                label TEXT NOT NULL,
+                previous_label TEXT,
+                labeled_by TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS maintenance_jobs (
+                name TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS payload_clusters (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                representative TEXT NOT NULL,
+                signature TEXT NOT NULL,
+                command_count INTEGER NOT NULL DEFAULT 0,
+                first_seen TEXT,
+                last_seen TEXT
+            );
+            CREATE TABLE IF NOT EXISTS payload_cluster_buckets (
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                cluster_id INTEGER NOT NULL,
+                PRIMARY KEY (band, bucket)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS payload_cluster_sources (
+                cluster_id INTEGER NOT NULL,
+                ip TEXT NOT NULL,
+                command_count INTEGER NOT NULL DEFAULT 0,
+                first_seen TEXT,
+                last_seen TEXT,
+                PRIMARY KEY (cluster_id, ip)
+            );
             CREATE INDEX IF NOT EXISTS idx_connections_ip ON connections(ip);
             CREATE INDEX IF NOT EXISTS idx_commands_ip ON commands(ip);
             CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
@@ -178,21 +232,31 @@ class HoneypotDatabase:
             CREATE INDEX IF NOT EXISTS idx_cases_status ON cases(status);
             CREATE INDEX IF NOT EXISTS idx_cases_source_ip ON cases(source_ip);
             CREATE INDEX IF NOT EXISTS idx_replay_connection ON session_replay_events(connection_id);
+            CREATE INDEX IF NOT EXISTS idx_command_labels_command ON command_labels(command_id);
+            CREATE INDEX IF NOT EXISTS idx_payload_clusters_count ON payload_clusters(command_count);
         """)
         migrations = [
             ("commands", "attack_category", "TEXT"),
+            ("commands", "cluster_id", "INTEGER"),
             ("connections", "asn", "TEXT"),
             ("connections", "asn_org", "TEXT"),
             ("connections", "reputation_score", "INTEGER DEFAULT 0"),
             ("connections", "reputation_level", "TEXT"),
             ("connections", "reputation_flags", "TEXT"),
             ("connections", "enrichment_provider", "TEXT"),
+            ("connections", "session_intent_score", "REAL"),
+            ("connections", "session_intent", "TEXT"),
         ]
         for table, column, column_type in migrations:
             try:
                 conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
             except sqlite3.OperationalError:
                 pass  # Column exists
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_commands_cluster ON commands(cluster_id)")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_connections_degraded_enrichment "
+            f"ON connections(id, enrichment_provider) WHERE {DEGRADED_ENRICHMENT_SQL}"
+        )
         conn.commit()
         conn.close()
 
@@ -212,7 +276,7 @@ class HoneypotDatabase:
             country, city, region, isp = loc["c"], "Demo Node", "Simulated", "Global Botnet"
             lat, lon = loc["lat"] + random.uniform(-4, 4), loc["lon"] + random.uniform(-4, 4)
 
-        enrichment = enrich_ip(ip, cache_db_path=self.db_path)
+        enrichment = self.enrichment.enrich(ip)
         country = country or enrichment.get("country")
         city = city or enrichment.get("city")
         region = region or enrichment.get("region")
@@ -250,7 +314,7 @@ class HoneypotDatabase:
             "timestamp": timestamp,
             "attack_category": attack_category,
         })
-        send_alert_async({
+        alert = {
             "event_type": "command",
             "ip": ip,
             "service": service,
@@ -258,7 +322,28 @@ class HoneypotDatabase:
             "timestamp": timestamp,
             "attack_category": attack_category,
             "severity": severity_for_category(attack_category),
-        }, logging.getLogger("HoneypotAlerts"))
+        }
+        sequence = get_sequence_classifier() if connection_id else None
+        alerting = attack_category is None and alert_delivery_configured()
+        pending = None
+        if attack_category is None and (sequence is not None or alerting):
+            classifier = get_command_classifier()
+            if classifier is not None:
+                pending = classifier.submit(command)
+        if sequence is not None:
+            sequence.observe((self.db_path, connection_id), command, pending or attack_category)
+        if alerting and pending is not None:
+            pending.add_done_callback(lambda done: self._send_classified_alert(alert, done))
+            return
+        send_alert_async(alert, logging.getLogger("HoneypotAlerts"))
+
+    def _send_classified_alert(self, alert, done):
+        category = None
+        if not done.cancelled() and done.exception() is None:
+            category = done.result()
+        alert["attack_category"] = category
+        alert["severity"] = severity_for_category(category)
+        send_alert_async(alert, logging.getLogger("HoneypotAlerts"))
 
     def _write_command_batch(self, batch):
         def write_batch():
@@ -290,6 +375,129 @@ class HoneypotDatabase:
     def flush_command_buffer(self):
         return self.command_buffer.flush()
 
+    def update_commands_attack_categories(self, updates):
+        """Apply many (connection_id, attack_category) updates in one transaction."""
+        updates = [(category, connection_id) for connection_id, category in updates]
+        if not updates:
+            return 0
+        self.flush_command_buffer()
+        def update_batch():
+            c = self._get_conn()
+            c.executemany(
+                "UPDATE commands SET attack_category=? WHERE connection_id=? AND (attack_category IS NULL OR attack_category='')",
+                updates,
+            )
+            c.commit()
+            return len(updates)
+        return self._execute_with_retry(update_batch)
+
+    def update_connections_intent(self, updates):
+        """Store many (connection_id, intent_score) session verdicts in one transaction."""
+        updates = [(score, classify_intent(score), connection_id) for connection_id, score in updates]
+        if not updates:
+            return 0
+        def update_batch():
+            c = self._get_conn()
+            c.executemany("UPDATE connections SET session_intent_score=?, session_intent=? WHERE id=?", updates)
+            c.commit()
+            return len(updates)
+        return self._execute_with_retry(update_batch)
+
+    def set_command_categories(self, updates):
+        """Overwrite categories for many (attack_category, command_id) pairs in one transaction."""
+        updates = list(updates)
+        if not updates:
+            return 0
+        def update_batch():
+            c = self._get_conn()
+            c.executemany("UPDATE commands SET attack_category=? WHERE id=?", updates)
+            c.commit()
+            return len(updates)
+        return self._execute_with_retry(update_batch)
+
+    def commands_for_reclassification(self, after_id, until_id, limit):
+        """(id, command, attack_category) rows in (after_id, until_id], skipping analyst-labelled commands."""
+        return [tuple(r) for r in self._get_conn().execute(
+            """
+            SELECT c.id, c.command, c.attack_category FROM commands c
+            WHERE c.id > ? AND c.id <= ?
+              AND NOT EXISTS (SELECT 1 FROM command_labels l WHERE l.command_id = c.id)
+            ORDER BY c.id LIMIT ?
+            """,
+            (after_id, until_id, limit),
+        ).fetchall()]
+
+    def command_id_bounds(self):
+        """(max id, row count) of the commands table."""
+        self.flush_command_buffer()
+        row = self._get_conn().execute("SELECT COALESCE(MAX(id), 0), COUNT(*) FROM commands").fetchone()
+        return row[0], row[1]
+
+    def connections_needing_enrichment(self, after_id, until_id, limit):
+        """(id, ip) connection rows in (after_id, until_id] written with degraded enrichment."""
+        return [tuple(r) for r in self._get_conn().execute(
+            f"SELECT id, ip FROM connections WHERE {DEGRADED_ENRICHMENT_SQL} AND id > ? AND id <= ? ORDER BY id LIMIT ?",
+            (after_id, until_id, limit),
+        ).fetchall()]
+
+    def degraded_enrichment_bounds(self):
+        """(max id of the connections table, number of degraded rows)."""
+        c = self._get_conn()
+        max_id = c.execute("SELECT COALESCE(MAX(id), 0) FROM connections").fetchone()[0]
+        return max_id, c.execute(f"SELECT COUNT(*) FROM connections WHERE {DEGRADED_ENRICHMENT_SQL}").fetchone()[0]
+
+    def degraded_enrichment_counts(self):
+        """Degraded connection rows per ``enrichment_provider``."""
+        return {row[0] or "unknown": row[1] for row in self._get_conn().execute(
+            f"SELECT enrichment_provider, COUNT(*) FROM connections WHERE {DEGRADED_ENRICHMENT_SQL} GROUP BY enrichment_provider"
+        ).fetchall()}
+
+    def update_connection_enrichment(self, updates):
+        """Apply many (connection_id, enrichment record) pairs in one transaction; sensor-reported geo is kept."""
+        rows = [(
+            record.get("country"), record.get("city"), record.get("region"), record.get("lat"), record.get("lon"),
+            record.get("isp"), record.get("raw_geo"), record.get("asn"), record.get("asn_org"),
+            int(record.get("reputation_score") or 0), record.get("reputation_level"),
+            json.dumps(record.get("reputation_flags") or []), record.get("enrichment_provider"), connection_id,
+        ) for connection_id, record in updates]
+        if not rows:
+            return 0
+        def update_batch():
+            c = self._get_conn()
+            c.executemany(
+                """UPDATE connections SET country=COALESCE(country, ?), city=COALESCE(city, ?),
+                    region=COALESCE(region, ?), lat=COALESCE(lat, ?), lon=COALESCE(lon, ?), isp=COALESCE(isp, ?),
+                    raw_geo=COALESCE(raw_geo, ?), asn=?, asn_org=?, reputation_score=?, reputation_level=?,
+                    reputation_flags=?, enrichment_provider=? WHERE id=?""",
+                rows,
+            )
+            c.commit()
+            return len(rows)
+        return self._execute_with_retry(update_batch)
+
+    def enrichment_warmup_ips(self, limit):
+        """Source IPs worth preloading into the enrichment cache: most recently seen, then highest volume."""
+        c = self._get_conn()
+        recent = c.execute("SELECT ip FROM connections GROUP BY ip ORDER BY MAX(id) DESC LIMIT ?", (limit,)).fetchall()
+        busiest = c.execute("SELECT ip FROM connections GROUP BY ip ORDER BY COUNT(*) DESC LIMIT ?", (limit,)).fetchall()
+        ranked = [row[0] for pair in zip(recent, busiest) for row in pair]
+        ranked += [row[0] for row in recent[len(busiest):] + busiest[len(recent):]]
+        return list(dict.fromkeys(ranked))[:limit]
+
+    def load_job_state(self, name):
+        row = self._get_conn().execute("SELECT state FROM maintenance_jobs WHERE name=?", (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_job_state(self, name, state):
+        def write_state():
+            c = self._get_conn()
+            c.execute(
+                "INSERT OR REPLACE INTO maintenance_jobs (name, state, updated_at) VALUES (?, ?, ?)",
+                (name, json.dumps(state, sort_keys=True), datetime.now(timezone.utc).isoformat()),
+            )
+            c.commit()
+        self._execute_with_retry(write_state)
+
     def update_commands_attack_category(self, connection_id, attack_category):
         self.flush_command_buffer()
         def update_batch():
@@ -301,6 +509,91 @@ class HoneypotDatabase:
             c.commit()
         return self._execute_with_retry(update_batch)
 
+    def label_examples_after(self, after_id, limit):
+        """Analyst labels newer than ``after_id`` as (id, command, label) rows."""
+        return [tuple(r) for r in self._get_conn().execute(
+            "SELECT id, command, label FROM command_labels WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit),
+        ).fetchall()]
+
+    def commands_after(self, after_id, limit):
+        """Captured commands newer than ``after_id`` as (id, command) rows."""
+        return [tuple(r) for r in self._get_conn().execute(
+            "SELECT id, command FROM commands WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit),
+        ).fetchall()]
+
+    def commands_for_clustering(self, after_id, limit):
+        """(id, command, ip, timestamp) rows newer than ``after_id``."""
+        return [tuple(r) for r in self._get_conn().execute(
+            "SELECT id, command, ip, timestamp FROM commands WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit),
+        ).fetchall()]
+
+    def assign_payload_clusters(self, items, threshold):
+        """Assign each command to a payload cluster in one transaction.
+
+        ``items`` are (command_id, command, ip, timestamp, signature, band_keys)
+        tuples from a MinHasher. Candidates are the clusters sharing an LSH
+        bucket with the command; the closest one whose representative
+        signature is at least ``threshold`` similar wins, otherwise the command
+        starts a new cluster. Returns the number of commands assigned.
+        """
+        items = list(items)
+        if not items:
+            return 0
+        def assign_batch():
+            c = self._get_conn()
+            signatures = {}
+            assignments = []
+            for command_id, command, ip, timestamp, signature, band_keys in items:
+                candidates = []
+                for band, bucket in enumerate(band_keys):
+                    row = c.execute(
+                        "SELECT cluster_id FROM payload_cluster_buckets WHERE band=? AND bucket=?", (band, bucket)
+                    ).fetchone()
+                    if row and row[0] not in candidates:
+                        candidates.append(row[0])
+                best, best_score = None, threshold
+                for cluster_id in candidates:
+                    if cluster_id not in signatures:
+                        row = c.execute("SELECT signature FROM payload_clusters WHERE id=?", (cluster_id,)).fetchone()
+                        signatures[cluster_id] = tuple(json.loads(row[0])) if row else ()
+                    score = MinHasher.similarity(signature, signatures[cluster_id])
+                    if score >= best_score:
+                        best, best_score = cluster_id, score
+                if best is None:
+                    best = c.execute(
+                        """INSERT INTO payload_clusters (representative, signature, command_count, first_seen, last_seen)
+                        VALUES (?, ?, 1, ?, ?)""",
+                        (command or "", json.dumps(signature), timestamp, timestamp),
+                    ).lastrowid
+                    signatures[best] = tuple(signature)
+                else:
+                    c.execute(
+                        """UPDATE payload_clusters SET command_count = command_count + 1,
+                        first_seen = MIN(COALESCE(first_seen, ?), ?), last_seen = MAX(COALESCE(last_seen, ?), ?)
+                        WHERE id=?""",
+                        (timestamp, timestamp, timestamp, timestamp, best),
+                    )
+                c.executemany(
+                    "INSERT OR IGNORE INTO payload_cluster_buckets (band, bucket, cluster_id) VALUES (?, ?, ?)",
+                    [(band, bucket, best) for band, bucket in enumerate(band_keys)],
+                )
+                if ip:
+                    c.execute(
+                        """INSERT INTO payload_cluster_sources (cluster_id, ip, command_count, first_seen, last_seen)
+                        VALUES (?, ?, 1, ?, ?)
+                        ON CONFLICT(cluster_id, ip) DO UPDATE SET command_count = command_count + 1,
+                            last_seen = MAX(COALESCE(last_seen, excluded.last_seen), excluded.last_seen)""",
+                        (best, ip, timestamp, timestamp),
+                    )
+                assignments.append((best, command_id))
+            c.executemany("UPDATE commands SET cluster_id=? WHERE id=?", assignments)
+            c.commit()
+            return len(assignments)
+        return self._execute_with_retry(assign_batch)
+
     def record_session_replay(self, connection_id, offset_sec, data, stream="o"):
         data = sanitize_event_text(data, max_chars=MAX_CAPTURE_CHARS)
         timestamp = datetime.now(timezone.utc).isoformat().replace("+00:00", "") + "Z"
@@ -333,55 +626,430 @@ class HoneypotDatabase:
             c.commit()
         return self._execute_with_retry(update_duration)
 
+    def runtime_metrics(self):
+        enrichment = self.enrichment.metrics()
+        return {
+            "command_buffer": self.command_buffer.metrics(),
+            "enrichment_cache": enrichment.pop("cache"),
+            "enrichment": enrichment,
+        }
+
     def close(self):
         if hasattr(self, "command_buffer"):
             self.command_buffer.stop()
+        if self._owns_enrichment:  # an injected service belongs to the caller
+            self.enrichment.close()
         if hasattr(self._local, "conn"):
             self._local.conn.close()
             del self._local.conn
 
-# --- Geolocation ---
-def get_geolocation(ip):
-    try:
-        parsed_ip = ip_address(ip)
-        if (
-            parsed_ip.is_loopback
-            or parsed_ip.is_private
-            or parsed_ip.is_link_local
-            or parsed_ip.is_multicast
-            or parsed_ip.is_reserved
-        ):
-            return {"country": "Local Network", "city": "Internal", "query": ip}
-    except ValueError:
-        if ip == "localhost":
-            return {"country": "Local Network", "city": "Internal", "query": ip}
-
-    if ip in ("127.0.0.1", "localhost", "::1") or ip.startswith("192.168.") or ip.startswith("10."):
-        return {"country": "Local Network", "city": "Internal", "query": ip}
+def log_sensor_connection(db, ip, port, service):
+    """Log a sensor connection through the cached enrichment path only."""
+    return db.log_connection(ip, port, service)
+
+
+_analysis_executor = None
+_analysis_executor_lock = threading.Lock()
+
+
+def get_analysis_executor():
+    """Return the process-wide executor used for post-session analysis."""
+    global _analysis_executor
+    with _analysis_executor_lock:
+        if _analysis_executor is None:
+            _analysis_executor = AnalysisExecutor(
+                max_workers=int(os.environ.get("HONEYPOT_ANALYSIS_WORKERS", "2")),
+                max_queue=int(os.environ.get("HONEYPOT_ANALYSIS_QUEUE_MAX", "1000")),
+            )
+        return _analysis_executor
+
+
+_session_classifier = None
+
+
+def _apply_session_categories(pairs):
+    by_db = {}
+    for db, result in pairs:
+        by_db.setdefault(id(db), (db, []))[1].append((result["session_id"], result["attack_category"]))
+    for db, updates in by_db.values():
+        db.update_commands_attack_categories(updates)
+
+
+def _apply_sequence_categories(pairs):
+    # Sequence sessions are keyed by (db_path, connection_id).
+    pairs = [(db, dict(result, session_id=result["session_id"][1])) for db, result in pairs]
+    _apply_session_categories(pairs)
+    by_db = {}
+    for db, result in pairs:
+        by_db.setdefault(id(db), (db, []))[1].append((result["session_id"], result["features"]["intent_score"]))
+    for db, updates in by_db.values():
+        db.update_connections_intent(updates)
+
+
+def get_session_classifier():
+    """Return the shared micro-batching classifier for finished sessions."""
+    global _session_classifier
+    executor = get_analysis_executor()
+    with _analysis_executor_lock:
+        if _session_classifier is None:
+            _session_classifier = BatchedSessionClassifier(
+                lambda documents: predict_attack_many(documents),
+                apply_fn=_apply_session_categories,
+                executor=executor,
+                window_seconds=float(os.environ.get("HONEYPOT_CLASSIFY_BATCH_WINDOW_MS", "50")) / 1000.0,
+                max_batch=int(os.environ.get("HONEYPOT_CLASSIFY_BATCH_MAX", "256")),
+            )
+        return _session_classifier
+
+
+_command_classifier = None
+
+
+def get_command_classifier():
+    """Return the shared real-time command classifier, or None when disabled."""
+    global _command_classifier
+    if os.environ.get("HONEYPOT_REALTIME_CLASSIFY", "true").strip().lower() not in {"1", "true", "yes", "on"}:
+        return None
+    with _analysis_executor_lock:
+        if _command_classifier is None:
+            _command_classifier = StreamingCommandClassifier(
+                lambda commands: predict_attack_many(commands),
+                window_seconds=float(os.environ.get("HONEYPOT_REALTIME_CLASSIFY_WINDOW_MS", "5")) / 1000.0,
+                max_batch=int(os.environ.get("HONEYPOT_REALTIME_CLASSIFY_BATCH_MAX", "64")),
+            )
+        return _command_classifier
+
+
+_sequence_classifier = None
+
+
+def get_sequence_classifier():
+    """Return the shared session-sequence classifier, or None when disabled.
+
+    It needs per-command labels, so it is only available alongside the
+    real-time command classifier.
+    """
+    global _sequence_classifier
+    if os.environ.get("HONEYPOT_SESSION_SEQUENCE_CLASSIFY", "true").strip().lower() not in {"1", "true", "yes", "on"}:
+        return None
+    if get_command_classifier() is None:
+        return None
+    with _analysis_executor_lock:
+        if _sequence_classifier is None:
+            _sequence_classifier = SessionSequenceClassifier(
+                apply_fn=_apply_sequence_categories,
+                window_seconds=float(os.environ.get("HONEYPOT_CLASSIFY_BATCH_WINDOW_MS", "50")) / 1000.0,
+                max_batch=int(os.environ.get("HONEYPOT_CLASSIFY_BATCH_MAX", "256")),
+                max_sessions=int(os.environ.get("HONEYPOT_SESSION_SEQUENCE_MAX_SESSIONS", "10000")),
+            )
+        return _sequence_classifier
+
+
+_online_trainer = None
+ONLINE_LEARNING_JOB = "online_learning"
+
+
+def start_online_trainer(db):
+    """Start background online learning from ``db`` when HONEYPOT_ML_ONLINE_LEARNING is enabled."""
+    global _online_trainer
     try:
-        with urllib.request.urlopen(f"http://ip-api.com/json/{ip}?fields=status,country,city,regionName,lat,lon,isp,query", timeout=5) as r:
-            d = json.loads(r.read().decode())
-            return d if d.get("status") == "success" else None
-    except Exception:
+        from ml import online
+    except ImportError:
+        return None
+    if not online.ONLINE_ENABLED:
         return None
+    with _analysis_executor_lock:
+        if _online_trainer is None:
+            try:
+                learner = online.OnlineLearner()
+            except RuntimeError:  # scikit-learn not installed
+                return None
+            _online_trainer = online.OnlineTrainer(
+                learner,
+                lambda cursor, limit: online.training_batch(db, cursor, limit),
+                checkpoint_fn=lambda snapshot: db.save_job_state(ONLINE_LEARNING_JOB, snapshot),
+                state=db.load_job_state(ONLINE_LEARNING_JOB),
+            )
+            _online_trainer.start()
+        return _online_trainer
 
 
-def log_sensor_connection(db, ip, port, service):
-    """Log a sensor connection through the cached enrichment path only."""
-    return db.log_connection(ip, port, service)
+def get_online_trainer():
+    return _online_trainer
+
+
+RECLASSIFY_JOB = "reclassify_commands"
+_reclassification_job = None
+_reclassification_lock = threading.Lock()
+
+
+def _reclassify_chunk(db, rows):
+    """Classify one chunk with a single batched model call and bulk-write changed labels.
+
+    Only labels the classifier could have produced are replaced; sensor-assigned
+    categories (e.g. Burp Collaborator Trap) and analyst labels are left alone.
+    """
+    replaceable = set(model_categories()) | {None, "", "Unknown"}
+    candidates = [(command_id, command or "", current) for command_id, command, current in rows if current in replaceable]
+    unique = list(dict.fromkeys(command for _, command, _ in candidates))
+    predicted = dict(zip(unique, predict_attack_many(unique))) if unique else {}
+    updates = []
+    for command_id, command, current in candidates:
+        category = predicted.get(command) or "Unknown"
+        if category != current:
+            updates.append((category, command_id))
+    return db.set_command_categories(updates)
+
+
+def start_reclassification(db, restart=False):
+    """Start (or resume) the background reclassification of historical commands.
+
+    Returns ``(started, status)``. A finished job, or ``restart=True``, begins a
+    new pass over every command captured up to now.
+    """
+    global _reclassification_job
+    with _reclassification_lock:
+        if _reclassification_job is not None and _reclassification_job.running():
+            return False, _reclassification_job.status()
+        state = db.load_job_state(RECLASSIFY_JOB)
+        if restart or not state or state.get("status") == "completed":
+            target_id, total = db.command_id_bounds()
+            try:
+                from ml.attack_classifier import active_model_version
+                model_version = active_model_version()
+            except ImportError:
+                model_version = None
+            state = {"target_id": target_id, "total": total, "model_version": model_version}
+        target_id = state["target_id"]
+        _reclassification_job = ResumableJob(
+            RECLASSIFY_JOB,
+            lambda cursor, limit: db.commands_for_reclassification(cursor, target_id, limit),
+            lambda rows: _reclassify_chunk(db, rows),
+            checkpoint_fn=lambda snapshot: db.save_job_state(RECLASSIFY_JOB, snapshot),
+            chunk_size=int(os.environ.get("HONEYPOT_RECLASSIFY_CHUNK_SIZE", "500")),
+            duty_cycle=float(os.environ.get("HONEYPOT_RECLASSIFY_DUTY_CYCLE", "0.5")),
+            state=state,
+        )
+        _reclassification_job.start()
+        return True, _reclassification_job.status()
+
+
+def stop_reclassification():
+    job = _reclassification_job
+    if job is not None:
+        job.stop()
+    return job.status() if job is not None else None
+
+
+def reclassification_status(db):
+    job = _reclassification_job
+    if job is not None:
+        return job.status()
+    return db.load_job_state(RECLASSIFY_JOB) or {"name": RECLASSIFY_JOB, "status": "idle"}
+
+
+CLUSTER_JOB = "payload_clustering"
+_payload_clustering = None
+_payload_minhasher = MinHasher()
+
+
+def _cluster_chunk(db, rows, threshold):
+    items = []
+    for command_id, command, ip, timestamp in rows:
+        signature = _payload_minhasher.signature(command or "")
+        items.append((command_id, command, ip, timestamp, signature, _payload_minhasher.band_keys(signature)))
+    return db.assign_payload_clusters(items, threshold)
+
+
+def start_payload_clustering(db):
+    """Start the background stage that assigns new commands to payload clusters.
+
+    It follows the commands table from a checkpointed cursor, so a restart
+    resumes instead of re-clustering history. Disabled with
+    HONEYPOT_PAYLOAD_CLUSTERING=false.
+    """
+    global _payload_clustering
+    if os.environ.get("HONEYPOT_PAYLOAD_CLUSTERING", "true").strip().lower() not in {"1", "true", "yes", "on"}:
+        return None
+    threshold = float(os.environ.get("HONEYPOT_CLUSTER_SIMILARITY", "0.5"))
+    with _analysis_executor_lock:
+        if _payload_clustering is None or not _payload_clustering.running():
+            _payload_clustering = ResumableJob(
+                CLUSTER_JOB,
+                db.commands_for_clustering,
+                lambda rows: _cluster_chunk(db, rows, threshold),
+                checkpoint_fn=lambda snapshot: db.save_job_state(CLUSTER_JOB, snapshot),
+                chunk_size=int(os.environ.get("HONEYPOT_CLUSTER_CHUNK_SIZE", "500")),
+                duty_cycle=float(os.environ.get("HONEYPOT_CLUSTER_DUTY_CYCLE", "0.5")),
+                state=db.load_job_state(CLUSTER_JOB),
+                follow_seconds=float(os.environ.get("HONEYPOT_CLUSTER_INTERVAL_SECONDS", "5")),
+            )
+            _payload_clustering.start()
+        return _payload_clustering
+
+
+def get_payload_clustering():
+    return _payload_clustering
+
+
+BACKFILL_JOB = "enrichment_backfill"
+_enrichment_backfill = None
+_enrichment_backfill_lock = threading.Lock()
+
+
+def _backfill_chunk(db, rows):
+    ips = list(dict.fromkeys(ip for _, ip in rows))
+    db.enrichment.prefetch(ips)
+    records = {ip: db.enrichment.enrich(ip) for ip in ips}
+    return db.update_connection_enrichment(
+        [(connection_id, records[ip]) for connection_id, ip in rows if not is_degraded(records[ip])]
+    )
+
+
+def start_enrichment_backfill(db, restart=False):
+    """Start (or resume) re-enrichment of connections written while providers were unavailable.
+
+    Returns ``(started, status)``. Unique IPs of each chunk are resolved in
+    provider-sized batches under the shared rate limit; a pass that runs out of
+    provider admission fails with its cursor kept, so starting it again
+    resumes. A finished job, or ``restart=True``, begins a new pass.
+    """
+    global _enrichment_backfill
+    with _enrichment_backfill_lock:
+        if _enrichment_backfill is not None and _enrichment_backfill.running():
+            return False, _enrichment_backfill.status()
+        state = db.load_job_state(BACKFILL_JOB)
+        if restart or not state or state.get("status") == "completed":
+            target_id, total = db.degraded_enrichment_bounds()
+            state = {"target_id": target_id, "total": total}
+        target_id = state["target_id"]
+        _enrichment_backfill = ResumableJob(
+            BACKFILL_JOB,
+            lambda cursor, limit: db.connections_needing_enrichment(cursor, target_id, limit),
+            lambda rows: _backfill_chunk(db, rows),
+            checkpoint_fn=lambda snapshot: db.save_job_state(BACKFILL_JOB, snapshot),
+            chunk_size=int(os.environ.get("HONEYPOT_ENRICHMENT_BACKFILL_CHUNK_SIZE", "500")),
+            duty_cycle=float(os.environ.get("HONEYPOT_ENRICHMENT_BACKFILL_DUTY_CYCLE", "0.5")),
+            state=state,
+        )
+        _enrichment_backfill.start()
+        return True, _enrichment_backfill.status()
+
+
+def stop_enrichment_backfill():
+    job = _enrichment_backfill
+    if job is not None:
+        job.stop()
+    return job.status() if job is not None else None
+
+
+def enrichment_backfill_status(db):
+    job = _enrichment_backfill
+    status = job.status() if job is not None else db.load_job_state(BACKFILL_JOB) or {"name": BACKFILL_JOB, "status": "idle"}
+    status["degraded"] = db.degraded_enrichment_counts()
+    return status
+
+
+ENRICHMENT_CACHE_JOB = "enrichment_cache_maintenance"
+_enrichment_maintenance = None
+
+
+def start_enrichment_maintenance(db):
+    """Preload known attackers into the enrichment memory tier, then purge expired cache rows periodically.
+
+    Warm-up takes the most recently seen and highest-volume source IPs, so a
+    restart does not send the first wave of returning attackers back to the
+    providers. Disabled with HONEYPOT_ENRICHMENT_MAINTENANCE=false.
+    """
+    global _enrichment_maintenance
+    if os.environ.get("HONEYPOT_ENRICHMENT_MAINTENANCE", "true").strip().lower() not in {"1", "true", "yes", "on"}:
+        return None
+    if db.enrichment.cache is None:  # an injected service without a cache database
+        return None
+    with _analysis_executor_lock:
+        if _enrichment_maintenance is None or not _enrichment_maintenance.running():
+            _enrichment_maintenance = CacheMaintenance(
+                ENRICHMENT_CACHE_JOB,
+                db.enrichment.cache,
+                warm_ips_fn=db.enrichment_warmup_ips,
+                checkpoint_fn=lambda snapshot: db.save_job_state(ENRICHMENT_CACHE_JOB, snapshot),
+            )
+            _enrichment_maintenance.start()
+        return _enrichment_maintenance
+
+
+def get_enrichment_maintenance():
+    return _enrichment_maintenance
+
+
+def shutdown_analysis_executor(wait=False):
+    """Stop the classification stages and the shared analysis executor."""
+    global _analysis_executor, _session_classifier, _command_classifier, _sequence_classifier, _online_trainer
+    with _analysis_executor_lock:
+        classifiers = [_command_classifier, _sequence_classifier, _session_classifier]
+        _command_classifier = _sequence_classifier = _session_classifier = None
+        trainer, _online_trainer = _online_trainer, None
+    if trainer is not None:
+        trainer.stop()
+    for job in (_reclassification_job, _payload_clustering, _enrichment_maintenance, _enrichment_backfill):
+        if job is not None:
+            job.stop(wait=wait)
+    for classifier in classifiers:
+        if classifier is not None:
+            classifier.shutdown()
+    with _analysis_executor_lock:
+        executor, _analysis_executor = _analysis_executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=not wait)
+    shutdown_process_pool(wait=wait)
+
+
+_lazy_classifier_stats = ClassificationStats()
+
+
+def lazy_classifier_metrics():
+    """Queue wait and classify timings of sessions classified with a custom ``predict_fn``."""
+    return _lazy_classifier_stats.snapshot()
+
+
+def analysis_metrics():
+    """Metrics of the analysis executor and classifiers started so far.
+
+    Unlike the get_* accessors this never creates a component, so polling a
+    metrics endpoint does not start worker threads in an idle process.
+    """
+    executor, session, command, sequence = _analysis_executor, _session_classifier, _command_classifier, _sequence_classifier
+    idle = {"running": False}
+    return {
+        "analysis_executor": executor.metrics() if executor is not None else idle,
+        "session_classifier": session.metrics() if session is not None else dict(idle, classification=ClassificationStats().snapshot()),
+        "command_classifier": command.metrics() if command is not None else idle,
+        "sequence_classifier": sequence.metrics() if sequence is not None else idle,
+    }
 
 
 def classify_session_after_disconnect(db, connection_id, commands, predict_fn=None):
-    """Classify a completed session asynchronously and update uncategorized commands."""
-    classifier = LazyClassifier(predict_fn or predict_attack, max_workers=1)
+    """Classify a completed session asynchronously and update uncategorized commands.
+
+    Without a custom ``predict_fn`` a session whose commands were observed live
+    is classified from its precomputed sequence features. Otherwise it joins
+    the shared micro-batch so many sessions share one model call and one
+    category UPDATE transaction.
+    """
+    if predict_fn is None:
+        sequence = get_sequence_classifier()
+        future = sequence.finish((getattr(db, "db_path", None), connection_id), context=db) if sequence is not None else None
+        if future is not None:
+            return future
+        return get_session_classifier().submit(connection_id, commands, context=db)
+    classifier = LazyClassifier(predict_fn, executor=get_analysis_executor(), stats=_lazy_classifier_stats)
+    commands = list(commands)
+    queued_at = time.perf_counter()
 
     def classify_and_update():
-        try:
-            result = classifier._classify(connection_id, list(commands))
-            db.update_commands_attack_category(connection_id, result.get("attack_category") or "Unknown")
-            return result
-        finally:
-            classifier.queue.shutdown(wait=False)
+        result = classifier._classify(connection_id, commands, queued_at)
+        db.update_commands_attack_category(connection_id, result.get("attack_category") or "Unknown")
+        return result
 
     return classifier.queue.submit(classify_and_update)
 
@@ -891,6 +1559,7 @@ def main():
     def stop(*_):
         log.info("Shutting down...")
         for name, s in services.items(): s.stop()
+        shutdown_analysis_executor()
         db.close()
         import sys
         sys.exit(0)
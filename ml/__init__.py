@@ -1,4 +1,32 @@
 """ML attack classifier for HoneyPot v3."""
-from .attack_classifier import model_status, predict, predict_details, preprocess, reset_model_cache
+from .attack_classifier import (
+    active_model_version,
+    classifier_metrics,
+    model_status,
+    preload_model_async,
+    predict,
+    predict_details,
+    predict_details_many,
+    predict_many,
+    prediction_cache_stats,
+    preprocess,
+    promote_model,
+    reset_metrics,
+    reset_model_cache,
+)
 
-__all__ = ["model_status", "predict", "predict_details", "preprocess", "reset_model_cache"]
+__all__ = [
+    "active_model_version",
+    "classifier_metrics",
+    "model_status",
+    "preload_model_async",
+    "predict",
+    "predict_details",
+    "predict_details_many",
+    "predict_many",
+    "prediction_cache_stats",
+    "preprocess",
+    "promote_model",
+    "reset_metrics",
+    "reset_model_cache",
+]
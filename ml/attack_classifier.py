@@ -5,21 +5,142 @@ The honeypot calls predict() on attacker-controlled commands from multiple
 services, so this module must never crash request/session handling. Model loading
 is lazy, cached, and intentionally fails closed to "Unknown" when artifacts are
 missing, corrupted, or incompatible with the installed sklearn version.
+
+Scanners repeat the same handful of commands, so successful predictions are
+memoized in a bounded LRU/TTL cache keyed by the preprocessed command and the
+fingerprint of the loaded artifacts.
+
+When ``ml/train.py`` has exported flat model arrays (``model_arrays/``), the
+classifier runs on a pure-numpy engine that memory-maps them instead of
+unpickling sklearn objects. Select the engine with HONEYPOT_ML_BACKEND
+(``auto``, ``numpy`` or ``sklearn``).
+
+If the model registry (see model_registry.py) has an active version, that
+artifact set is loaded instead of the built-in one. ``preload_model_async``
+loads and verifies it off the request path at startup, and ``promote_model``
+swaps in a new version atomically: predictions always read the classifier,
+vectorizer and fingerprint as one snapshot.
+
+Obvious signatures are answered by the rule engine in signatures.py before
+the cache or the model is consulted.
+
+Each batch records per-stage timings (preprocess, rules, cache, vectorize,
+predict, process pool) and fail-closed outcomes in fixed-bucket histograms
+and counters; ``classifier_metrics()`` returns them.
+
+With HONEYPOT_ML_PROCESS_WORKERS > 0 cache misses are evaluated in a small
+spawn-based process pool instead of the sensor/dashboard interpreter. Every
+worker verifies and loads the active artifact set once, then receives chunks
+of preprocessed commands and returns (category, confidence) pairs.
 """
+import bisect
 import hashlib
+import json
+import math
+import multiprocessing
 import os
 import pickle
 import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from typing import Any
 
+from . import model_registry, signatures
+
+try:
+    import numpy as np
+except ImportError:  # numpy engine unavailable; pickled sklearn path still works
+    np = None
+
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH = os.path.join(SCRIPT_DIR, "model.pkl")
 VECTORIZER_PATH = os.path.join(SCRIPT_DIR, "vectorizer.pkl")
 MANIFEST_PATH = os.path.join(SCRIPT_DIR, "artifacts.sha256")
+ARRAYS_DIR = os.path.join(SCRIPT_DIR, "model_arrays")
+ARRAY_FILES = (
+    "meta.json",
+    "idf.npy",
+    "children_left.npy",
+    "children_right.npy",
+    "feature.npy",
+    "threshold.npy",
+    "value.npy",
+    "roots.npy",
+)
+ARRAYS_FORMAT_VERSION = 1
+BACKEND = os.environ.get("HONEYPOT_ML_BACKEND", "auto").strip().lower()
+
+PREDICTION_CACHE_SIZE = int(os.environ.get("HONEYPOT_ML_CACHE_SIZE", "8192"))
+PREDICTION_CACHE_TTL_SECONDS = float(os.environ.get("HONEYPOT_ML_CACHE_TTL_SECONDS", "3600"))
+PREDICT_CHUNK_SIZE = max(1, int(os.environ.get("HONEYPOT_ML_PREDICT_CHUNK_SIZE", "1024")))
+PROCESS_WORKERS = max(0, int(os.environ.get("HONEYPOT_ML_PROCESS_WORKERS", "0")))
 
 _classifier = None
 _vectorizer = None
 _load_error = None
+_model_fingerprint = None
+_backend = None
+_model_version = None
+_artifact_paths = None
+_model_lock = threading.Lock()
+_load_lock = threading.Lock()
+
+_process_pool = None
+_process_pool_fingerprint = None
+_process_pool_lock = threading.Lock()
+
+_prediction_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_hits = 0
+_cache_misses = 0
+
+
+class Histogram:
+    """Fixed-bucket, thread-safe histogram; snapshots match the sensor's v31_core metrics."""
+
+    def __init__(self, bounds):
+        self.bounds = tuple(sorted(float(b) for b in bounds))
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        value = float(value)
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+            self._max = max(self._max, value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            count, total, maximum = self._count, self._sum, self._max
+        buckets = [{"le": bound, "count": counts[i]} for i, bound in enumerate(self.bounds)]
+        buckets.append({"le": "+Inf", "count": counts[-1]})
+        return {
+            "count": count,
+            "sum": round(total, 6),
+            "avg": round(total / count, 6) if count else 0.0,
+            "max": round(maximum, 6),
+            "buckets": buckets,
+        }
+
+
+LATENCY_BUCKETS_SECONDS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+METRIC_STAGES = ("preprocess", "rules", "cache", "vectorize", "predict", "pool", "total")
+_stage_seconds = {stage: Histogram(LATENCY_BUCKETS_SECONDS) for stage in METRIC_STAGES}
+_batch_size = Histogram(BATCH_SIZE_BUCKETS)
+_counters: Counter = Counter()
+_errors: Counter = Counter()
+_metrics_lock = threading.Lock()
 
 
 def _sha256(path: str) -> str:
@@ -30,11 +151,12 @@ def _sha256(path: str) -> str:
     return digest.hexdigest()
 
 
-def _manifest_hashes() -> dict[str, str]:
+def _manifest_hashes(manifest_path: str | None = None) -> dict[str, str]:
+    manifest_path = manifest_path or MANIFEST_PATH
     hashes = {}
-    if not os.path.exists(MANIFEST_PATH):
+    if not os.path.exists(manifest_path):
         return hashes
-    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+    with open(manifest_path, "r", encoding="utf-8") as f:
         for line in f:
             parts = line.strip().split()
             if len(parts) >= 2 and len(parts[0]) == 64:
@@ -42,14 +164,170 @@ def _manifest_hashes() -> dict[str, str]:
     return hashes
 
 
-def _artifacts_verified() -> bool:
-    hashes = _manifest_hashes()
-    required = {"model.pkl": MODEL_PATH, "vectorizer.pkl": VECTORIZER_PATH}
+def _fingerprint(hashes: dict[str, str], names: tuple[str, ...] = ("model.pkl", "vectorizer.pkl")) -> str:
+    material = ":".join(hashes.get(name, "") for name in names)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:16]
+
+
+def _artifacts_verified(model_path: str | None = None, vectorizer_path: str | None = None,
+                        manifest_path: str | None = None) -> bool:
+    hashes = _manifest_hashes(manifest_path)
+    required = {"model.pkl": model_path or MODEL_PATH, "vectorizer.pkl": vectorizer_path or VECTORIZER_PATH}
     if not all(name in hashes for name in required):
         return False
     return all(_sha256(path).lower() == hashes[name] for name, path in required.items())
 
 
+def _array_manifest_names() -> tuple[str, ...]:
+    return tuple(f"model_arrays/{name}" for name in ARRAY_FILES)
+
+
+def _arrays_exist(arrays_dir: str | None = None) -> bool:
+    arrays_dir = arrays_dir or ARRAYS_DIR
+    return all(os.path.exists(os.path.join(arrays_dir, name)) for name in ARRAY_FILES)
+
+
+def _arrays_verified(arrays_dir: str | None = None, manifest_path: str | None = None) -> bool:
+    arrays_dir = arrays_dir or ARRAYS_DIR
+    hashes = _manifest_hashes(manifest_path)
+    for name in ARRAY_FILES:
+        key = f"model_arrays/{name}"
+        if key not in hashes or _sha256(os.path.join(arrays_dir, name)).lower() != hashes[key]:
+            return False
+    return True
+
+
+class ArrayVectorizer:
+    """Char word-boundary TF-IDF transform equivalent to the exported TfidfVectorizer."""
+
+    _white_spaces = re.compile(r"\s\s+")
+
+    def __init__(self, vocabulary: list[str], idf, ngram_range=(1, 4), lowercase: bool = True,
+                 sublinear_tf: bool = True, norm: str | None = "l2"):
+        self.vocabulary_ = {term: index for index, term in enumerate(vocabulary)}
+        self.idf_ = idf
+        self.min_n, self.max_n = int(ngram_range[0]), int(ngram_range[1])
+        self.lowercase = lowercase
+        self.sublinear_tf = sublinear_tf
+        self.norm = norm
+
+    def _ngrams(self, text: str) -> list[str]:
+        if self.lowercase:
+            text = text.lower()
+        text = self._white_spaces.sub(" ", text)
+        ngrams = []
+        for word in text.split():
+            word = f" {word} "
+            length = len(word)
+            for n in range(self.min_n, self.max_n + 1):
+                offset = 0
+                ngrams.append(word[offset:offset + n])
+                while offset + n < length:
+                    offset += 1
+                    ngrams.append(word[offset:offset + n])
+                if offset == 0:  # a short word is counted once, as sklearn does
+                    break
+        return ngrams
+
+    def transform(self, documents: list[str]):
+        matrix = np.zeros((len(documents), len(self.vocabulary_)), dtype=np.float64)
+        vocabulary = self.vocabulary_
+        for row, document in enumerate(documents):
+            counts = Counter(vocabulary[g] for g in self._ngrams(document) if g in vocabulary)
+            if not counts:
+                continue
+            columns = sorted(counts)
+            if self.sublinear_tf:
+                weights = [(math.log(counts[c]) + 1.0) * self.idf_[c] for c in columns]
+            else:
+                weights = [counts[c] * self.idf_[c] for c in columns]
+            if self.norm == "l2":
+                length = math.sqrt(sum(w * w for w in weights))
+                if length:
+                    weights = [w / length for w in weights]
+            matrix[row, columns] = weights
+        return matrix
+
+
+class ArrayForestClassifier:
+    """Vectorized random-forest evaluation over flat, memory-mapped node arrays.
+
+    Every tree's nodes live in one set of arrays; ``roots`` holds each tree's
+    first node and leaves have ``children_left == -1``. All samples walk all
+    trees at once, one tree level per numpy step.
+    """
+
+    def __init__(self, children_left, children_right, feature, threshold, value, roots, classes: list[str]):
+        self.children_left = children_left
+        self.children_right = children_right
+        self.feature = feature
+        self.threshold = threshold
+        self.value = value
+        self.roots = roots
+        self.classes_ = np.asarray(classes, dtype=object)
+
+    def apply(self, X):
+        """Return the leaf index reached in every tree, shape (n_samples, n_trees)."""
+        # sklearn compares float32 features against float64 thresholds.
+        X = np.asarray(X, dtype=np.float32)
+        n_samples, n_trees = X.shape[0], len(self.roots)
+        nodes = np.tile(np.asarray(self.roots, dtype=np.intp), n_samples)
+        samples = np.repeat(np.arange(n_samples, dtype=np.intp), n_trees)
+        active = np.flatnonzero(self.children_left[nodes] >= 0)
+        while active.size:
+            current = nodes[active]
+            go_left = X[samples[active], self.feature[current]] <= self.threshold[current]
+            following = np.where(go_left, self.children_left[current], self.children_right[current])
+            nodes[active] = following
+            active = active[self.children_left[following] >= 0]
+        return nodes.reshape(n_samples, n_trees)
+
+    def predict_proba(self, X):
+        leaves = self.apply(X)
+        proba = np.zeros((leaves.shape[0], self.value.shape[1]), dtype=np.float64)
+        for tree in range(leaves.shape[1]):
+            proba += self.value[leaves[:, tree]]
+        return proba / leaves.shape[1]
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def load_model_arrays(directory: str | None = None, mmap_mode: str | None = "r") -> tuple:
+    """Load exported arrays and return a (vectorizer, classifier) pair."""
+    directory = directory or ARRAYS_DIR
+    if np is None:
+        raise RuntimeError("numpy is not installed")
+    with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format_version") != ARRAYS_FORMAT_VERSION:
+        raise ValueError("unsupported model array format")
+
+    def array(name):
+        loaded = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode, allow_pickle=False)
+        # Plain ndarray view over the mapping: avoids memmap subclass overhead per index op.
+        return loaded.view(np.ndarray) if isinstance(loaded, np.memmap) else loaded
+
+    vectorizer = ArrayVectorizer(
+        meta["vocabulary"],
+        array("idf"),
+        ngram_range=tuple(meta["ngram_range"]),
+        lowercase=meta["lowercase"],
+        sublinear_tf=meta["sublinear_tf"],
+        norm=meta["norm"],
+    )
+    classifier = ArrayForestClassifier(
+        array("children_left"),
+        array("children_right"),
+        array("feature"),
+        array("threshold"),
+        array("value"),
+        array("roots"),
+        meta["classes"],
+    )
+    return vectorizer, classifier
+
+
 def preprocess(text: Any) -> str:
     """Normalize command text while preserving shell/security signal."""
     if not isinstance(text, str):
@@ -60,47 +338,238 @@ def preprocess(text: Any) -> str:
     return text if text else "unknown"
 
 
+def _cache_get(clean: str, fingerprint: str | None) -> tuple | None:
+    global _cache_hits, _cache_misses
+    key = (fingerprint, clean)
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _prediction_cache.get(key)
+        if entry is None or entry[0] <= now:
+            if entry is not None:
+                del _prediction_cache[key]
+            _cache_misses += 1
+            return None
+        _prediction_cache.move_to_end(key)
+        _cache_hits += 1
+        return entry[1]
+
+
+def _cache_put(clean: str, prediction: tuple, fingerprint: str | None):
+    if PREDICTION_CACHE_SIZE <= 0:
+        return
+    key = (fingerprint, clean)
+    with _cache_lock:
+        _prediction_cache[key] = (time.monotonic() + PREDICTION_CACHE_TTL_SECONDS, prediction)
+        _prediction_cache.move_to_end(key)
+        while len(_prediction_cache) > PREDICTION_CACHE_SIZE:
+            _prediction_cache.popitem(last=False)
+
+
+def clear_prediction_cache():
+    """Drop memoized predictions and reset hit/miss counters."""
+    global _cache_hits, _cache_misses
+    with _cache_lock:
+        _prediction_cache.clear()
+        _cache_hits = 0
+        _cache_misses = 0
+
+
+def prediction_cache_stats() -> dict:
+    with _cache_lock:
+        hits, misses, size = _cache_hits, _cache_misses, len(_prediction_cache)
+    lookups = hits + misses
+    return {
+        "size": size,
+        "max_entries": PREDICTION_CACHE_SIZE,
+        "ttl_seconds": PREDICTION_CACHE_TTL_SECONDS,
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        "model_fingerprint": _model_fingerprint,
+    }
+
+
 def reset_model_cache():
-    """Clear cached artifacts. Primarily useful for tests and retraining flows."""
-    global _classifier, _vectorizer, _load_error
-    _classifier = None
-    _vectorizer = None
-    _load_error = None
+    """Clear cached artifacts and predictions. Useful for tests and retraining flows."""
+    global _classifier, _vectorizer, _load_error, _model_fingerprint, _backend, _model_version, _artifact_paths
+    with _model_lock:
+        _classifier = None
+        _vectorizer = None
+        _load_error = None
+        _model_fingerprint = None
+        _backend = None
+        _model_version = None
+        _artifact_paths = None
+    clear_prediction_cache()
+    shutdown_process_pool()
 
 
-def _load() -> bool:
-    """Load classifier/vectorizer once. Return False instead of raising."""
-    global _classifier, _vectorizer, _load_error
+class _ArtifactError(Exception):
+    """Raised with a fail-closed error code when an artifact set cannot be used."""
 
-    if _classifier is not None and _vectorizer is not None:
-        return True
 
-    if not os.path.exists(MODEL_PATH) or not os.path.exists(VECTORIZER_PATH):
-        _load_error = "missing_model_artifact"
-        return False
+def _builtin_artifact_paths() -> dict:
+    return {"model": MODEL_PATH, "vectorizer": VECTORIZER_PATH, "manifest": MANIFEST_PATH, "arrays": ARRAYS_DIR}
+
+
+def _active_artifacts() -> tuple[dict, str | None]:
+    version = model_registry.active_version()
+    if version:
+        return model_registry.artifact_paths(model_registry.version_dir(version)), version
+    return _builtin_artifact_paths(), None
+
+
+def _read_artifacts(paths: dict) -> tuple:
+    """Verify and load one artifact set; returns (classifier, vectorizer, fingerprint, backend)."""
+    if BACKEND in {"auto", "numpy"} and np is not None and _arrays_exist(paths["arrays"]):
+        try:
+            if _arrays_verified(paths["arrays"], paths["manifest"]):
+                vectorizer, classifier = load_model_arrays(paths["arrays"])
+                fingerprint = _fingerprint(_manifest_hashes(paths["manifest"]), _array_manifest_names())
+                return classifier, vectorizer, fingerprint, "numpy"
+        except Exception:
+            pass  # fall back to the verified pickles in auto mode
+    if BACKEND == "numpy":
+        raise _ArtifactError("numpy_backend_unavailable")
+
+    if not os.path.exists(paths["model"]) or not os.path.exists(paths["vectorizer"]):
+        raise _ArtifactError("missing_model_artifact")
     try:
-        if not _artifacts_verified():
-            _load_error = "artifact_hash_mismatch"
-            return False
+        verified = _artifacts_verified(paths["model"], paths["vectorizer"], paths["manifest"])
     except Exception:
-        _load_error = "artifact_hash_mismatch"
-        return False
+        verified = False
+    if not verified:
+        raise _ArtifactError("artifact_hash_mismatch")
 
     try:
-        with open(MODEL_PATH, "rb") as f:
+        with open(paths["model"], "rb") as f:
             classifier = pickle.load(f)
-        with open(VECTORIZER_PATH, "rb") as f:
+        with open(paths["vectorizer"], "rb") as f:
             vectorizer = pickle.load(f)
     except Exception as exc:  # fail closed; never break honeypot capture
-        _classifier = None
-        _vectorizer = None
-        _load_error = f"load_failed:{exc.__class__.__name__}"
-        return False
+        raise _ArtifactError(f"load_failed:{exc.__class__.__name__}")
+    return classifier, vectorizer, _fingerprint(_manifest_hashes(paths["manifest"])), "sklearn"
 
-    _classifier = classifier
-    _vectorizer = vectorizer
-    _load_error = None
-    return True
+
+def _install(classifier, vectorizer, fingerprint: str, backend: str, version: str | None, paths: dict | None):
+    global _classifier, _vectorizer, _load_error, _model_fingerprint, _backend, _model_version, _artifact_paths
+    with _model_lock:
+        _classifier = classifier
+        _vectorizer = vectorizer
+        _model_fingerprint = fingerprint
+        _backend = backend
+        _model_version = version
+        _artifact_paths = paths
+        _load_error = None
+    clear_prediction_cache()
+
+
+def _snapshot() -> tuple:
+    """Classifier, vectorizer, fingerprint and artifact paths of the active model, read together."""
+    with _model_lock:
+        return _classifier, _vectorizer, _model_fingerprint, _artifact_paths
+
+
+def _load() -> bool:
+    """Load classifier/vectorizer once. Return False instead of raising."""
+    global _load_error
+
+    if _classifier is not None and _vectorizer is not None:
+        return True
+    with _load_lock:
+        if _classifier is not None and _vectorizer is not None:
+            return True
+        try:
+            paths, version = _active_artifacts()
+            classifier, vectorizer, fingerprint, backend = _read_artifacts(paths)
+        except _ArtifactError as exc:
+            _load_error = str(exc)
+            return False
+        _install(classifier, vectorizer, fingerprint, backend, version, paths)
+        return True
+
+
+def preload_model_async() -> threading.Thread:
+    """Load and verify the active model in the background so no session waits on it."""
+    thread = threading.Thread(target=_load, name="hp-ml-preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def promote_model(version: str) -> dict:
+    """Verify and load a registered version, then make it active atomically.
+
+    The currently active model keeps serving until the new one is fully
+    loaded; on failure nothing changes and ValueError carries the error code.
+    """
+    if version not in model_registry.read_registry()["versions"]:
+        raise ValueError("unknown_model_version")
+    with _load_lock:
+        paths = model_registry.artifact_paths(model_registry.version_dir(version))
+        try:
+            loaded = _read_artifacts(paths)
+        except _ArtifactError as exc:
+            raise ValueError(str(exc)) from None
+        model_registry.set_active(version)
+        _install(*loaded, version, paths)
+    return model_status()
+
+
+def _worker_init(paths: dict):
+    """Process-pool initializer: verify and load the artifact set once per worker."""
+    global _load_error
+    try:
+        _install(*_read_artifacts(paths), None, paths)
+    except _ArtifactError as exc:
+        _load_error = str(exc)
+
+
+def _worker_predict(cleaned: list[str]) -> list[tuple]:
+    classifier, vectorizer, _, _ = _snapshot()
+    if classifier is None:
+        raise RuntimeError(_load_error or "model cache not initialized")
+    return _predict_uncached(cleaned, classifier, vectorizer)
+
+
+def _get_process_pool(paths: dict, fingerprint: str):
+    """Pool bound to one model fingerprint; a promoted model gets fresh workers."""
+    global _process_pool, _process_pool_fingerprint
+    with _process_pool_lock:
+        if _process_pool is not None and _process_pool_fingerprint == fingerprint:
+            return _process_pool
+        stale, _process_pool = _process_pool, ProcessPoolExecutor(
+            max_workers=PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_worker_init,
+            initargs=(paths,),
+        )
+        _process_pool_fingerprint = fingerprint
+    if stale is not None:
+        stale.shutdown(wait=False)  # in-flight chunks finish on the previous model
+    return _process_pool
+
+
+def _discard_process_pool(pool):
+    global _process_pool, _process_pool_fingerprint
+    with _process_pool_lock:
+        if _process_pool is not pool:
+            return
+        _process_pool = _process_pool_fingerprint = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_process_pool(wait: bool = False):
+    """Stop classification worker processes, if any were started."""
+    global _process_pool, _process_pool_fingerprint
+    with _process_pool_lock:
+        pool, _process_pool, _process_pool_fingerprint = _process_pool, None, None
+    if pool is not None:
+        pool.shutdown(wait=wait, cancel_futures=not wait)
+
+
+def active_model_version() -> str | None:
+    """Registry version currently serving predictions (None for the built-in artifacts)."""
+    return _model_version
 
 
 def model_status() -> dict:
@@ -110,11 +579,18 @@ def model_status() -> dict:
         "loaded": loaded,
         "model_path": MODEL_PATH,
         "vectorizer_path": VECTORIZER_PATH,
+        "arrays_path": ARRAYS_DIR,
+        "backend": _backend,
+        "version": _model_version,
+        "registry_dir": model_registry.REGISTRY_DIR,
+        "process_workers": PROCESS_WORKERS,
         "manifest_path": MANIFEST_PATH,
         "manifest_exists": os.path.exists(MANIFEST_PATH),
         "model_exists": os.path.exists(MODEL_PATH),
         "vectorizer_exists": os.path.exists(VECTORIZER_PATH),
         "error": _load_error,
+        "prediction_cache": prediction_cache_stats(),
+        "rules": signatures.rules_status(),
     }
 
 
@@ -127,42 +603,213 @@ def predict(command: Any, default: str = "Unknown") -> str:
     return details["attack_category"]
 
 
+def _predict_uncached(cleaned: list[str], classifier, vectorizer) -> list[tuple]:
+    """Run the model on preprocessed commands; returns (category, confidence) pairs.
+
+    Probabilistic models are evaluated once with predict_proba and the label is
+    the argmax, which is what RandomForestClassifier.predict does internally.
+    """
+    if classifier is None or vectorizer is None:
+        raise RuntimeError("model cache not initialized")
+
+    started = time.perf_counter()
+    vec = vectorizer.transform(cleaned)
+    vectorized = time.perf_counter()
+    _stage_seconds["vectorize"].observe(vectorized - started)
+    if hasattr(classifier, "predict_proba") and hasattr(classifier, "classes_"):
+        classes = classifier.classes_
+        probabilities = np.asarray(classifier.predict_proba(vec))
+        best = probabilities.argmax(axis=1)
+        confidences = probabilities.max(axis=1)
+        predictions = [(str(classes[index]), float(confidence)) for index, confidence in zip(best.tolist(), confidences.tolist())]
+    else:
+        predictions = [(str(category), None) for category in classifier.predict(vec)]
+    _stage_seconds["predict"].observe(time.perf_counter() - vectorized)
+    return predictions
+
+
+def _details(category: str, confidence: float | None, model_loaded: bool, error: str | None, clean: str,
+             rule_id: str | None = None) -> dict:
+    return {
+        "attack_category": category,
+        "confidence": confidence,
+        "model_loaded": model_loaded,
+        "error": error,
+        "command_clean": clean,
+        "rule_id": rule_id,
+    }
+
+
+def predict_details_many(commands: list[Any], default: str = "Unknown") -> list[dict]:
+    """Predict category plus confidence/diagnostic metadata for many commands.
+
+    Commands matching a high-confidence signature rule are answered by the
+    rule (``rule_id`` is set) without touching the model. Cached commands are
+    answered from the prediction cache, duplicates are classified once, and
+    the remainder is evaluated in chunks of PREDICT_CHUNK_SIZE so arbitrarily
+    large inputs keep bounded memory. A failing chunk fails closed to
+    ``default`` without affecting the others.
+    """
+    started = time.perf_counter()
+    results = _predict_details_many(commands, default)
+    _record_batch(results, time.perf_counter() - started)
+    return results
+
+
+def _record_batch(results: list[dict], elapsed: float):
+    _stage_seconds["total"].observe(elapsed)
+    _batch_size.observe(len(results))
+    rule_hits = failed = 0
+    errors = Counter()
+    for result in results:
+        if result["rule_id"] is not None:
+            rule_hits += 1
+        elif result["error"] is not None or not result["model_loaded"]:
+            failed += 1
+            errors[result["error"] or "model_unavailable"] += 1
+    with _metrics_lock:
+        _counters["batches"] += 1
+        _counters["commands"] += len(results)
+        _counters["rule_hits"] += rule_hits
+        _counters["fail_closed"] += failed
+        _errors.update(errors)
+
+
+def _predict_details_many(commands: list[Any], default: str) -> list[dict]:
+    mark = time.perf_counter()
+    cleaned = [preprocess(command) for command in commands]
+    results: list[dict | None] = [None] * len(cleaned)
+    mark = _observe_stage("preprocess", mark)
+    engine = signatures.get_engine()
+    rule_hits = {}
+    if engine is not None and len(engine):
+        for index, clean in enumerate(cleaned):
+            hit = engine.match(clean)
+            if hit is not None:
+                rule_hits[index] = hit
+    _observe_stage("rules", mark)
+    remaining = len(cleaned) - len(rule_hits)
+    loaded = _load() if remaining else _classifier is not None
+    for index, hit in rule_hits.items():
+        results[index] = _details(hit["attack_category"], hit["confidence"], loaded, None, cleaned[index], hit["rule_id"])
+    if not remaining:
+        return results
+    if not loaded:
+        return [result or _details(default, None, False, _load_error, clean) for result, clean in zip(results, cleaned)]
+
+    classifier, vectorizer, fingerprint, paths = _snapshot()
+    mark = time.perf_counter()
+    misses: dict[str, list[int]] = {}
+    for index, clean in enumerate(cleaned):
+        if results[index] is not None:
+            continue
+        cached = _cache_get(clean, fingerprint)
+        if cached is not None:
+            results[index] = _details(cached[0], cached[1], True, None, clean)
+        else:
+            misses.setdefault(clean, []).append(index)
+
+    _observe_stage("cache", mark)
+    pending = list(misses)
+    pool = _get_process_pool(paths, fingerprint) if PROCESS_WORKERS > 0 and paths and pending else None
+    chunk_size = PREDICT_CHUNK_SIZE
+    if pool is not None:
+        chunk_size = max(1, min(chunk_size, math.ceil(len(pending) / PROCESS_WORKERS)))
+    chunks = [pending[offset:offset + chunk_size] for offset in range(0, len(pending), chunk_size)]
+    mark = time.perf_counter()
+    outcomes = _run_chunks(chunks, classifier, vectorizer, pool)
+    if pool is not None:
+        _observe_stage("pool", mark)
+    for chunk, outcome in zip(chunks, outcomes):
+        if not isinstance(outcome, Exception) and len(outcome) != len(chunk):
+            outcome = RuntimeError("prediction size mismatch")
+        if isinstance(outcome, Exception):  # fail closed on bad payload/model incompatibility
+            error = f"predict_failed:{outcome.__class__.__name__}"
+            for clean in chunk:
+                for index in misses[clean]:
+                    results[index] = _details(default, None, True, error, clean)
+            continue
+        for clean, (category, confidence) in zip(chunk, outcome):
+            _cache_put(clean, (category, confidence), fingerprint)
+            for index in misses[clean]:
+                results[index] = _details(category, confidence, True, None, clean)
+    return results
+
+
+def _observe_stage(stage: str, since: float) -> float:
+    now = time.perf_counter()
+    _stage_seconds[stage].observe(now - since)
+    return now
+
+
+def classifier_metrics() -> dict:
+    """Stage latency histograms, batch sizes, cache hit rate and fail-closed counters."""
+    with _metrics_lock:
+        counters = dict(_counters)
+        errors = dict(_errors)
+    commands = counters.get("commands", 0)
+    return {
+        "backend": _backend,
+        "version": _model_version,
+        "batches": counters.get("batches", 0),
+        "commands": commands,
+        "rule_hits": counters.get("rule_hits", 0),
+        "fail_closed": counters.get("fail_closed", 0),
+        "fail_closed_ratio": round(counters.get("fail_closed", 0) / commands, 4) if commands else 0.0,
+        "errors": errors,
+        "stage_seconds": {stage: histogram.snapshot() for stage, histogram in _stage_seconds.items()},
+        "batch_size": _batch_size.snapshot(),
+        "prediction_cache": prediction_cache_stats(),
+    }
+
+
+def reset_metrics():
+    """Zero the timing histograms and counters (the prediction cache keeps its own)."""
+    global _batch_size
+    with _metrics_lock:
+        for stage in METRIC_STAGES:
+            _stage_seconds[stage] = Histogram(LATENCY_BUCKETS_SECONDS)
+        _batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        _counters.clear()
+        _errors.clear()
+
+
+def _run_chunks(chunks: list[list[str]], classifier, vectorizer, pool) -> list:
+    """Predictions (or the raised exception) per chunk, in chunk order."""
+    if pool is None:
+        outcomes = []
+        for chunk in chunks:
+            try:
+                outcomes.append(_predict_uncached(chunk, classifier, vectorizer))
+            except Exception as exc:
+                outcomes.append(exc)
+        return outcomes
+
+    pending = []
+    for chunk in chunks:
+        try:
+            pending.append(pool.submit(_worker_predict, chunk))
+        except Exception as exc:  # BrokenProcessPool / RuntimeError after shutdown
+            pending.append(exc)
+    outcomes = []
+    for item in pending:
+        if isinstance(item, Exception):
+            outcomes.append(item)
+            continue
+        try:
+            outcomes.append(item.result())
+        except Exception as exc:
+            outcomes.append(exc)
+    if any(isinstance(outcome, BrokenProcessPool) for outcome in outcomes):
+        _discard_process_pool(pool)
+    return outcomes
+
+
+def predict_many(commands: list[Any], default: str = "Unknown") -> list[str]:
+    """Predict categories for many commands with one model pass per chunk."""
+    return [details["attack_category"] for details in predict_details_many(commands, default=default)]
+
+
 def predict_details(command: Any, default: str = "Unknown") -> dict:
     """Predict category plus confidence/diagnostic metadata."""
-    clean = preprocess(command)
-    if not _load():
-        return {
-            "attack_category": default,
-            "confidence": None,
-            "model_loaded": False,
-            "error": _load_error,
-            "command_clean": clean,
-        }
-
-    try:
-        classifier = _classifier
-        vectorizer = _vectorizer
-        if classifier is None or vectorizer is None:
-            raise RuntimeError("model cache not initialized")
-
-        vec = vectorizer.transform([clean])
-        category = classifier.predict(vec)[0]
-        confidence = None
-        if hasattr(classifier, "predict_proba") and hasattr(classifier, "classes_"):
-            probabilities = classifier.predict_proba(vec)[0]
-            confidence = float(max(probabilities)) if len(probabilities) else None
-        return {
-            "attack_category": str(category),
-            "confidence": confidence,
-            "model_loaded": True,
-            "error": None,
-            "command_clean": clean,
-        }
-    except Exception as exc:  # fail closed on bad payload/model incompatibility
-        return {
-            "attack_category": default,
-            "confidence": None,
-            "model_loaded": True,
-            "error": f"predict_failed:{exc.__class__.__name__}",
-            "command_clean": clean,
-        }
+    return predict_details_many([command], default=default)[0]
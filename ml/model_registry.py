@@ -0,0 +1,168 @@
+"""Versioned model registry for the HoneyPot v3 attack classifier.
+
+Each version is a complete artifact set copied from a training run::
+
+    <registry>/registry.json            {"active": "v2", "versions": {"v1": {...}, "v2": {...}}}
+    <registry>/<version>/model.pkl
+    <registry>/<version>/vectorizer.pkl
+    <registry>/<version>/artifacts.sha256
+    <registry>/<version>/model_arrays/  (optional numpy export)
+
+Versions are immutable once registered; inactive ones can only be deleted
+whole (online-learning candidates are pruned that way). Promotion only flips ``active`` in
+registry.json, which is rewritten atomically; loading and verification is done
+by ``attack_classifier.promote_model`` before the flip.
+"""
+import json
+import os
+import re
+import shutil
+import threading
+from datetime import datetime, timezone
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+REGISTRY_DIR = os.environ.get("HONEYPOT_ML_REGISTRY_DIR") or os.path.join(SCRIPT_DIR, "registry")
+REGISTRY_FILE = "registry.json"
+ARTIFACT_MANIFEST = "artifacts.sha256"
+VERSION_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$")
+
+_lock = threading.Lock()
+
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def valid_version(version) -> bool:
+    return isinstance(version, str) and bool(VERSION_RE.match(version)) and version not in {".", ".."}
+
+
+def _registry_dir(registry_dir: str | None) -> str:
+    return registry_dir or REGISTRY_DIR
+
+
+def read_registry(registry_dir: str | None = None) -> dict:
+    path = os.path.join(_registry_dir(registry_dir), REGISTRY_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {"active": None, "versions": {}}
+    if not isinstance(data, dict) or not isinstance(data.get("versions"), dict):
+        return {"active": None, "versions": {}}
+    data.setdefault("active", None)
+    return data
+
+
+def _write_registry(data: dict, registry_dir: str | None = None):
+    directory = _registry_dir(registry_dir)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, REGISTRY_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def version_dir(version: str, registry_dir: str | None = None) -> str:
+    if not valid_version(version):
+        raise ValueError("invalid_model_version")
+    return os.path.join(_registry_dir(registry_dir), version)
+
+
+def artifact_paths(base_dir: str) -> dict:
+    """Paths of one artifact set, in the same layout as the ml/ directory."""
+    return {
+        "model": os.path.join(base_dir, "model.pkl"),
+        "vectorizer": os.path.join(base_dir, "vectorizer.pkl"),
+        "manifest": os.path.join(base_dir, ARTIFACT_MANIFEST),
+        "arrays": os.path.join(base_dir, "model_arrays"),
+    }
+
+
+def active_version(registry_dir: str | None = None) -> str | None:
+    data = read_registry(registry_dir)
+    active = data.get("active")
+    if valid_version(active) and active in data["versions"]:
+        return active
+    return None
+
+
+def list_versions(registry_dir: str | None = None) -> list[dict]:
+    data = read_registry(registry_dir)
+    versions = []
+    for name, details in data["versions"].items():
+        entry = dict(details) if isinstance(details, dict) else {}
+        entry.update({"version": name, "active": name == data.get("active")})
+        versions.append(entry)
+    return sorted(versions, key=lambda item: (item.get("created_at") or "", item["version"]))
+
+
+def _manifest_files(manifest_path: str) -> list[str]:
+    names = []
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.strip().split()
+            if len(parts) >= 2 and len(parts[0]) == 64:
+                name = parts[-1]
+                if os.path.isabs(name) or ".." in name.replace("\\", "/").split("/"):
+                    raise ValueError("unsafe_manifest_entry")
+                names.append(name)
+    return names
+
+
+def register_version(version: str, source_dir: str = SCRIPT_DIR, registry_dir: str | None = None) -> dict:
+    """Copy the artifact set in ``source_dir`` into the registry as ``version``.
+
+    Only files listed in the source artifacts.sha256 are copied. The set is
+    staged next to its final location and moved into place in one rename.
+    """
+    target = version_dir(version, registry_dir)
+    source_manifest = os.path.join(source_dir, ARTIFACT_MANIFEST)
+    if not os.path.exists(source_manifest):
+        raise ValueError("missing_model_artifact")
+    names = _manifest_files(source_manifest)
+    with _lock:
+        data = read_registry(registry_dir)
+        if version in data["versions"] or os.path.exists(target):
+            raise ValueError("model_version_exists")
+        staging = os.path.join(_registry_dir(registry_dir), f".staging-{version}")
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            for name in names:
+                destination = os.path.join(staging, name)
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                shutil.copy2(os.path.join(source_dir, name), destination)
+            shutil.copy2(source_manifest, os.path.join(staging, ARTIFACT_MANIFEST))
+            os.replace(staging, target)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        data["versions"][version] = {"created_at": _utc_now(), "files": names}
+        _write_registry(data, registry_dir)
+    return {"version": version, "path": target, "files": names}
+
+
+def set_active(version: str, registry_dir: str | None = None) -> dict:
+    with _lock:
+        data = read_registry(registry_dir)
+        if version not in data["versions"]:
+            raise ValueError("unknown_model_version")
+        data["active"] = version
+        data["versions"][version]["promoted_at"] = _utc_now()
+        _write_registry(data, registry_dir)
+    return data
+
+
+def delete_version(version: str, registry_dir: str | None = None):
+    """Remove an inactive version and its artifacts; the active version cannot be deleted."""
+    target = version_dir(version, registry_dir)
+    with _lock:
+        data = read_registry(registry_dir)
+        if version not in data["versions"]:
+            raise ValueError("unknown_model_version")
+        if data.get("active") == version:
+            raise ValueError("model_version_active")
+        del data["versions"][version]
+        _write_registry(data, registry_dir)
+        shutil.rmtree(target, ignore_errors=True)
@@ -0,0 +1,294 @@
+"""Online incremental learning for the HoneyPot v3 attack classifier.
+
+A HashingVectorizer has no fitted vocabulary, so new commands never require a
+refit, and SGDClassifier(loss="log_loss") accepts mini-batches through
+partial_fit. The learner is bootstrapped from dataset.csv, then an
+OnlineTrainer feeds it analyst relabels and newly captured commands in the
+background. Every HONEYPOT_ML_ONLINE_CHECKPOINT_EXAMPLES examples it registers
+a candidate version in the model registry and keeps only the newest
+HONEYPOT_ML_ONLINE_KEEP_CANDIDATES of them. Candidates are never activated
+automatically; an admin promotes them like any other version. The trainer
+cursor is saved with each checkpoint, so a restart resumes from the last
+candidate instead of rescanning every command.
+
+scikit-learn is only needed when online learning is enabled
+(HONEYPOT_ML_ONLINE_LEARNING=true).
+"""
+import csv
+import hashlib
+import os
+import pickle
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable
+
+from . import model_registry, signatures
+from .attack_classifier import preprocess
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DATASET = os.path.join(SCRIPT_DIR, "dataset.csv")
+ONLINE_ENABLED = os.environ.get("HONEYPOT_ML_ONLINE_LEARNING", "false").strip().lower() in {"1", "true", "yes", "on"}
+BATCH_SIZE = max(1, int(os.environ.get("HONEYPOT_ML_ONLINE_BATCH_SIZE", "256")))
+INTERVAL_SECONDS = float(os.environ.get("HONEYPOT_ML_ONLINE_INTERVAL_SECONDS", "30"))
+CHECKPOINT_EXAMPLES = max(1, int(os.environ.get("HONEYPOT_ML_ONLINE_CHECKPOINT_EXAMPLES", "500")))
+KEEP_CANDIDATES = max(1, int(os.environ.get("HONEYPOT_ML_ONLINE_KEEP_CANDIDATES", "3")))
+N_FEATURES = 2 ** 16
+CANDIDATE_PREFIX = "online-"
+# dataset.csv carries a few stray labels (e.g. "os"); analysts may only pick real categories.
+ATTACK_CATEGORIES = frozenset({
+    "Benign", "Brute Force", "Credential Access", "Credential Stuffing", "Data Exfiltration", "Defense Evasion",
+    "Malware Attempt", "Malware Download", "Malware Execution", "Persistence", "Privilege Escalation",
+    "Reconnaissance", "Reverse Shell", "Web Exploit",
+})
+BOOTSTRAP_EPOCHS = 5
+ANALYST_LABEL_WEIGHT = 5.0
+
+
+def categories(dataset: str = DATASET) -> list[str]:
+    """Label set of the training dataset restricted to ATTACK_CATEGORIES; online labels must come from it."""
+    with open(dataset, newline="", encoding="utf-8") as f:
+        return sorted({row["attack_category"] for row in csv.DictReader(f)} & ATTACK_CATEGORIES)
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class OnlineLearner:
+    """Hashing vectorizer plus a partial_fit linear model, safe to share across threads."""
+
+    def __init__(self, classes: list[str] | None = None, n_features: int = N_FEATURES):
+        try:  # imported lazily: inference and label validation must not pay for sklearn
+            from sklearn.feature_extraction.text import HashingVectorizer
+            from sklearn.linear_model import SGDClassifier
+        except ImportError:
+            raise RuntimeError("sklearn_unavailable") from None
+        self.classes = list(classes or categories())
+        self.vectorizer = HashingVectorizer(
+            analyzer="char_wb", ngram_range=(1, 4), n_features=n_features, alternate_sign=False, norm="l2"
+        )
+        self.model = SGDClassifier(loss="log_loss", alpha=1e-5, random_state=42)
+        self.examples_seen = 0
+        self.since_checkpoint = 0
+        self.last_checkpoint = None
+        self._lock = threading.Lock()
+
+    def partial_fit(self, commands: list[Any], labels: list[str], weights: list[float] | None = None) -> int:
+        """Update the model with one mini-batch; examples with unknown labels are skipped."""
+        keep = [i for i, label in enumerate(labels) if label in self.classes]
+        if not keep:
+            return 0
+        X = self.vectorizer.transform([preprocess(commands[i]) for i in keep])
+        y = [labels[i] for i in keep]
+        sample_weight = [weights[i] for i in keep] if weights is not None else None
+        with self._lock:
+            self.model.partial_fit(X, y, classes=self.classes, sample_weight=sample_weight)
+            self.examples_seen += len(keep)
+            self.since_checkpoint += len(keep)
+        return len(keep)
+
+    def bootstrap(self, dataset: str = DATASET, epochs: int = BOOTSTRAP_EPOCHS) -> int:
+        with open(dataset, newline="", encoding="utf-8") as f:
+            rows = [(row["command"], row["attack_category"]) for row in csv.DictReader(f) if row.get("command")]
+        rng = random.Random(42)
+        for _ in range(epochs):
+            rng.shuffle(rows)
+            for offset in range(0, len(rows), BATCH_SIZE):
+                batch = rows[offset:offset + BATCH_SIZE]
+                self.partial_fit([command for command, _ in batch], [label for _, label in batch])
+        with self._lock:
+            self.since_checkpoint = 0
+        return len(rows)
+
+    def predict(self, commands: list[Any]) -> list[str]:
+        X = self.vectorizer.transform([preprocess(command) for command in commands])
+        with self._lock:
+            return [str(label) for label in self.model.predict(X)]
+
+    def checkpoint(self, registry_dir: str | None = None) -> str:
+        """Register the current model as a candidate version and return its name."""
+        version = CANDIDATE_PREFIX + datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+        with tempfile.TemporaryDirectory() as staging:
+            with self._lock:
+                with open(os.path.join(staging, "model.pkl"), "wb") as f:
+                    pickle.dump(self.model, f)
+                self.since_checkpoint = 0
+            with open(os.path.join(staging, "vectorizer.pkl"), "wb") as f:
+                pickle.dump(self.vectorizer, f)
+            with open(os.path.join(staging, model_registry.ARTIFACT_MANIFEST), "w", encoding="utf-8") as f:
+                for name in ("model.pkl", "vectorizer.pkl"):
+                    f.write(f"{_sha256(os.path.join(staging, name))}  {name}\n")
+            model_registry.register_version(version, staging, registry_dir)
+        self.last_checkpoint = version
+        return version
+
+    def restore(self, version: str, examples_seen: int = 0, registry_dir: str | None = None) -> bool:
+        """Resume from a checkpointed candidate; False when it is gone or fails verification."""
+        base = model_registry.version_dir(version, registry_dir)
+        paths = model_registry.artifact_paths(base)
+        try:
+            with open(paths["manifest"], "r", encoding="utf-8") as f:
+                hashes = {parts[-1]: parts[0].lower() for parts in (line.split() for line in f) if len(parts) >= 2}
+            if hashes.get("model.pkl") != _sha256(paths["model"]):
+                return False
+            with open(paths["model"], "rb") as f:
+                model = pickle.load(f)
+        except Exception:
+            return False
+        if list(getattr(model, "classes_", [])) != self.classes:
+            return False
+        with self._lock:
+            self.model = model
+            self.examples_seen = max(1, int(examples_seen))
+            self.since_checkpoint = 0
+            self.last_checkpoint = version
+        return True
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "classes": len(self.classes),
+                "examples_seen": self.examples_seen,
+                "since_checkpoint": self.since_checkpoint,
+                "last_checkpoint": self.last_checkpoint,
+            }
+
+
+class OnlineTrainer:
+    """Background loop feeding mini-batches from ``fetch_fn`` into an OnlineLearner.
+
+    ``fetch_fn(cursor, limit)`` returns ``(examples, cursor)`` where examples
+    are ``(command, label, weight)`` tuples and cursor is opaque to the trainer.
+    After every registered candidate ``checkpoint_fn`` receives a JSON-safe
+    snapshot (cursor, candidate version, examples seen) that ``state`` accepts
+    on the next start.
+    """
+
+    def __init__(self, learner: OnlineLearner, fetch_fn: Callable[[Any, int], tuple[list[tuple], Any]],
+                 batch_size: int = BATCH_SIZE, interval_seconds: float = INTERVAL_SECONDS,
+                 checkpoint_examples: int = CHECKPOINT_EXAMPLES, registry_dir: str | None = None,
+                 checkpoint_fn: Callable[[dict], None] | None = None, state: dict | None = None,
+                 keep_candidates: int = KEEP_CANDIDATES):
+        self.learner = learner
+        self.fetch_fn = fetch_fn
+        self.batch_size = batch_size
+        self.interval_seconds = interval_seconds
+        self.checkpoint_examples = checkpoint_examples
+        self.registry_dir = registry_dir
+        self.checkpoint_fn = checkpoint_fn
+        self.keep_candidates = max(1, keep_candidates)
+        self.cursor = None
+        if state and state.get("version") and learner.restore(state["version"], state.get("examples_seen", 0), registry_dir):
+            cursor = state.get("cursor")
+            self.cursor = tuple(cursor) if isinstance(cursor, list) else cursor
+        self.batches = 0
+        self.last_error = None
+        self.last_update_seconds = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self) -> int:
+        """Consume every pending mini-batch; returns the number of examples learned."""
+        learned = 0
+        while not self._stop.is_set():
+            examples, cursor = self.fetch_fn(self.cursor, self.batch_size)
+            if examples:
+                started = time.perf_counter()
+                learned += self.learner.partial_fit(
+                    [command for command, _, _ in examples],
+                    [label for _, label, _ in examples],
+                    [weight for _, _, weight in examples],
+                )
+                self.last_update_seconds = round(time.perf_counter() - started, 4)
+                self.batches += 1
+            advanced = cursor != self.cursor
+            self.cursor = cursor
+            if not advanced:
+                break
+        if self.learner.since_checkpoint >= self.checkpoint_examples:
+            self.checkpoint()
+        return learned
+
+    def checkpoint(self) -> str:
+        """Register a candidate, prune older ones and hand the resume snapshot to ``checkpoint_fn``."""
+        version = self.learner.checkpoint(self.registry_dir)
+        prune_candidates(self.keep_candidates, self.registry_dir)
+        if self.checkpoint_fn is not None:
+            cursor = list(self.cursor) if isinstance(self.cursor, tuple) else self.cursor
+            self.checkpoint_fn({"cursor": cursor, "version": version, "examples_seen": self.learner.examples_seen})
+        return version
+
+    def _run(self):
+        if self.learner.examples_seen == 0:
+            self.learner.bootstrap()
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+                self.last_error = None
+            except Exception as exc:  # keep learning on the next tick
+                self.last_error = exc.__class__.__name__
+            self._stop.wait(self.interval_seconds)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="hp-ml-online", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def status(self) -> dict:
+        status = self.learner.status()
+        status.update({
+            "running": bool(self._thread and self._thread.is_alive()),
+            "batches": self.batches,
+            "cursor": self.cursor,
+            "last_update_seconds": self.last_update_seconds,
+            "last_error": self.last_error,
+        })
+        return status
+
+
+def prune_candidates(keep: int = KEEP_CANDIDATES, registry_dir: str | None = None) -> list[str]:
+    """Delete all but the ``keep`` newest online candidates; the active version is never removed."""
+    candidates = [
+        entry["version"] for entry in model_registry.list_versions(registry_dir)
+        if entry["version"].startswith(CANDIDATE_PREFIX) and not entry["active"]
+    ]
+    removed = candidates[:max(0, len(candidates) - max(1, keep))]
+    for version in removed:
+        model_registry.delete_version(version, registry_dir)
+    return removed
+
+
+def training_batch(db, cursor: tuple | None, limit: int) -> tuple[list[tuple], tuple]:
+    """OnlineTrainer fetch_fn over a HoneypotDatabase.
+
+    Analyst labels are consumed first and weighted ANALYST_LABEL_WEIGHT. Newly
+    captured commands follow; only those matched by a signature rule carry a
+    trustworthy label, so the rest just advance the cursor.
+    """
+    label_id, command_id = cursor or (0, 0)
+    labels = db.label_examples_after(label_id, limit)
+    if labels:
+        return [(command, label, ANALYST_LABEL_WEIGHT) for _, command, label in labels], (labels[-1][0], command_id)
+    rows = db.commands_after(command_id, limit)
+    if not rows:
+        return [], (label_id, command_id)
+    engine = signatures.get_engine()
+    examples = []
+    for _, command in rows:
+        hit = engine.match(preprocess(command), count=False) if engine is not None else None
+        if hit is not None:
+            examples.append((command, hit["attack_category"], 1.0))
+    return examples, (label_id, rows[-1][0])
@@ -0,0 +1,146 @@
+"""Signature fast path that runs ahead of the HoneyPot v3 attack classifier.
+
+Rules live in signatures.json (override with HONEYPOT_ML_RULES_PATH) and are
+matched against preprocessed command text. All patterns are compiled into one
+alternation used as a prefilter, so the common no-match case costs a single
+regex scan; only prefilter hits walk the rules in file order to find the
+winning rule id. A command matched by a rule at or above
+HONEYPOT_ML_RULES_MIN_CONFIDENCE never reaches the model.
+"""
+import json
+import os
+import re
+import threading
+from collections import Counter
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+RULES_PATH = os.environ.get("HONEYPOT_ML_RULES_PATH") or os.path.join(SCRIPT_DIR, "signatures.json")
+RULES_ENABLED = os.environ.get("HONEYPOT_ML_RULES_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+MIN_CONFIDENCE = float(os.environ.get("HONEYPOT_ML_RULES_MIN_CONFIDENCE", "0.9"))
+RULE_ID_RE = re.compile(r"^[a-z0-9][a-z0-9._-]{0,63}$")
+
+_engine = None
+_engine_error = None
+_engine_lock = threading.Lock()
+
+
+class SignatureEngine:
+    """Compiled rule set with per-rule hit counters."""
+
+    def __init__(self, rules: list[dict], min_confidence: float = MIN_CONFIDENCE):
+        self._rules = []
+        seen = set()
+        for rule in rules:
+            rule_id = rule.get("id")
+            if not isinstance(rule_id, str) or not RULE_ID_RE.match(rule_id) or rule_id in seen:
+                raise ValueError(f"invalid_rule_id:{rule_id!r}")
+            category = rule.get("category")
+            if not isinstance(category, str) or not category.strip():
+                raise ValueError(f"invalid_rule_category:{rule_id}")
+            confidence = float(rule.get("confidence", 1.0))
+            if not 0.0 <= confidence <= 1.0:
+                raise ValueError(f"invalid_rule_confidence:{rule_id}")
+            try:
+                regex = re.compile(rule["pattern"])
+            except (KeyError, TypeError, re.error):
+                raise ValueError(f"invalid_rule_pattern:{rule_id}") from None
+            seen.add(rule_id)
+            if confidence >= min_confidence:
+                self._rules.append((rule_id, category, confidence, regex, rule.get("description", "")))
+        self._prefilter = None
+        if self._rules:
+            self._prefilter = re.compile("|".join(f"(?:{regex.pattern})" for _, _, _, regex, _ in self._rules))
+        self._hits = Counter()
+        self._checked = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str, min_confidence: float = MIN_CONFIDENCE) -> "SignatureEngine":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        rules = data.get("rules") if isinstance(data, dict) else None
+        if not isinstance(rules, list):
+            raise ValueError("invalid_rules_file")
+        return cls(rules, min_confidence=min_confidence)
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+    def match(self, text: str, count: bool = True) -> dict | None:
+        """Return the first matching rule as a prediction, or None for the model to decide.
+
+        ``count=False`` leaves the hit counters alone (offline use such as training).
+        """
+        hit = None
+        if self._prefilter is not None and self._prefilter.search(text):
+            for rule_id, category, confidence, regex, _ in self._rules:
+                if regex.search(text):
+                    hit = {"rule_id": rule_id, "attack_category": category, "confidence": confidence}
+                    break
+        if not count:
+            return hit
+        with self._lock:
+            self._checked += 1
+            if hit is not None:
+                self._hits[hit["rule_id"]] += 1
+        return hit
+
+    def top_rules(self, limit: int = 10) -> list[dict]:
+        with self._lock:
+            hits = dict(self._hits)
+        ranked = sorted(self._rules, key=lambda rule: (-hits.get(rule[0], 0), rule[0]))
+        return [
+            {"rule_id": rule_id, "attack_category": category, "confidence": confidence,
+             "description": description, "hits": hits.get(rule_id, 0)}
+            for rule_id, category, confidence, _, description in ranked[:max(0, limit)]
+        ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            checked = self._checked
+            matched = sum(self._hits.values())
+        return {
+            "rules": len(self._rules),
+            "checked": checked,
+            "matched": matched,
+            "hit_ratio": round(matched / checked, 4) if checked else 0.0,
+        }
+
+
+def get_engine() -> SignatureEngine | None:
+    """Shared engine, or None when rules are disabled. A bad rules file yields an empty engine."""
+    global _engine, _engine_error
+    if not RULES_ENABLED:
+        return None
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                try:
+                    _engine = SignatureEngine.from_file(RULES_PATH)
+                    _engine_error = None
+                except (OSError, ValueError) as exc:
+                    _engine = SignatureEngine([])
+                    _engine_error = str(exc) if isinstance(exc, ValueError) else f"load_failed:{exc.__class__.__name__}"
+    return _engine
+
+
+def reload_rules() -> dict:
+    """Drop the compiled engine (and its counters) so the rules file is read again."""
+    global _engine
+    with _engine_lock:
+        _engine = None
+    get_engine()
+    return rules_status()
+
+
+def top_rules(limit: int = 10) -> list[dict]:
+    engine = get_engine()
+    return engine.top_rules(limit) if engine is not None else []
+
+
+def rules_status() -> dict:
+    engine = get_engine()
+    status = {"enabled": RULES_ENABLED, "path": RULES_PATH, "min_confidence": MIN_CONFIDENCE, "error": _engine_error}
+    if engine is not None:
+        status.update(engine.stats())
+    return status
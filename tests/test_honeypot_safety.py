@@ -16,13 +16,13 @@ class HoneypotSafetyTests(unittest.TestCase):
         self.assertLessEqual(len(cleaned), 80)
         self.assertTrue(cleaned.endswith("...[truncated]"))
 
-    def test_private_network_geolocation_stays_local_and_offline(self):
-        with patch("honeypot.urllib.request.urlopen") as urlopen:
-            geo = honeypot.get_geolocation("172.16.1.10")
+    def test_private_network_enrichment_stays_local_and_offline(self):
+        with patch("enrichment.KeepAliveHTTP.request") as request:
+            record = honeypot.EnrichmentService().enrich("172.16.1.10")
 
-        urlopen.assert_not_called()
-        self.assertEqual(geo["country"], "Local Network")
-        self.assertEqual(geo["query"], "172.16.1.10")
+        request.assert_not_called()
+        self.assertEqual(record["asn_org"], "Local Network")
+        self.assertEqual(record["enrichment_provider"], "local")
 
     def test_service_connection_guard_enforces_global_and_per_ip_caps(self):
         class DummyService(honeypot.Service):
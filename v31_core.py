@@ -7,6 +7,7 @@ connection handling.
 
 from __future__ import annotations
 
+import bisect
 import concurrent.futures
 import hashlib
 import json
@@ -14,7 +15,8 @@ import random
 import re
 import threading
 import time
-from collections import Counter
+import zlib
+from collections import Counter, OrderedDict, deque
 from dataclasses import dataclass, field
 from typing import Callable, Iterable, Any
 
@@ -54,38 +56,370 @@ class ThreadedTaskQueue:
         self.executor.shutdown(wait=wait, cancel_futures=not wait)
 
 
+class Histogram:
+    """Fixed-bucket, thread-safe histogram for cheap in-process metrics."""
+
+    def __init__(self, bounds: Iterable[float]):
+        self.bounds = tuple(sorted(float(b) for b in bounds))
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        value = float(value)
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+            if value > self._max:
+                self._max = value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            count, total, maximum = self._count, self._sum, self._max
+        buckets = [{"le": bound, "count": counts[i]} for i, bound in enumerate(self.bounds)]
+        buckets.append({"le": "+Inf", "count": counts[-1]})
+        return {
+            "count": count,
+            "sum": round(total, 6),
+            "avg": round(total / count, 6) if count else 0.0,
+            "max": round(maximum, 6),
+            "buckets": buckets,
+        }
+
+
+LATENCY_BUCKETS_SECONDS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class TTLCache:
+    """Bounded, thread-safe LRU mapping whose entries expire after ``ttl_seconds``."""
+
+    def __init__(self, max_entries: int = 4096, ttl_seconds: float = 300.0):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds)
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Any, value: Any, ttl_seconds: float | None = None):
+        expires_at = time.monotonic() + (self.ttl_seconds if ttl_seconds is None else float(ttl_seconds))
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, misses, size = self.hits, self.misses, len(self._data)
+        lookups = hits + misses
+        return {
+            "size": size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers share its outcome.
+
+    The first caller for a key (the leader) runs ``fn``; callers arriving while
+    it is in flight wait on the leader's Future for up to ``timeout`` seconds
+    and receive the same result or exception. The key is released only after
+    ``fn`` returns, so a leader that stores its result (e.g. in a cache) before
+    returning guarantees one call per key per cache lifetime.
+    """
+
+    def __init__(self):
+        self._calls: dict[Any, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+        self.timeouts = 0
+
+    def do(self, key: Any, fn: Callable[[], Any], timeout: float | None = None) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = concurrent.futures.Future()
+                self.leaders += 1
+            else:
+                self.shared += 1
+        if not leader:
+            try:
+                return future.result(timeout=timeout)
+            except concurrent.futures.TimeoutError:
+                with self._lock:
+                    self.timeouts += 1
+                raise
+        try:
+            result = fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"in_flight": len(self._calls), "leaders": self.leaders, "shared": self.shared,
+                    "timeouts": self.timeouts}
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe.
+
+    Closed: every call is allowed. ``failure_threshold`` consecutive failures
+    open the circuit and calls are refused for ``reset_seconds``; then one
+    probe is let through (half-open) and its outcome closes or re-opens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_seconds = float(reset_seconds)
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opens = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _cooled_down(self, now: float) -> bool:
+        return self.state == self.OPEN and now - self._opened_at >= self.reset_seconds
+
+    def ready(self) -> bool:
+        """Whether ``allow()`` would currently succeed, without taking the probe slot."""
+        with self._lock:
+            return self.state == self.CLOSED or self._cooled_down(time.monotonic()) or (
+                self.state == self.HALF_OPEN and not self._probing)
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self._cooled_down(time.monotonic()):
+                self.state, self._probing = self.HALF_OPEN, False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def release(self):
+        """Give back a probe slot taken by ``allow()`` when no call was made."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.state, self.failures, self._probing = self.CLOSED, 0, False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.state, self._opened_at = self.OPEN, time.monotonic()
+                self.opens += 1
+
+    def retry_in(self) -> float:
+        """Seconds until a call may be allowed again (0 when one is allowed now)."""
+        with self._lock:
+            if self.state == self.OPEN:
+                return max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+            return 0.0
+
+    def snapshot(self) -> dict:
+        retry_in = self.retry_in()
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures, "opens": self.opens,
+                    "rejected": self.rejected, "retry_in_seconds": round(retry_in, 3)}
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilling ``rate`` tokens per second up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = max(0.0, float(rate))
+        self.capacity = max(1.0, float(capacity))
+        self.granted = 0
+        self.denied = 0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._held_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        start = max(self._updated, self._held_until)
+        if now > start:
+            self._tokens = min(self.capacity, self._tokens + (now - start) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now >= self._held_until and self._tokens >= tokens:
+                self._tokens -= tokens
+                self.granted += 1
+                return True
+            self.denied += 1
+            return False
+
+    def wait_seconds(self, tokens: float = 1.0) -> float:
+        """Seconds until ``tokens`` could be acquired, assuming nobody else takes them."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            held = max(0.0, self._held_until - now)
+            deficit = tokens - self._tokens
+            if deficit <= 0:
+                return held
+            return held + (deficit / self.rate if self.rate > 0 else float("inf"))
+
+    def hold(self, seconds: float):
+        """Empty the bucket and grant nothing for ``seconds``, e.g. when the remote budget is spent."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens = 0.0
+            self._held_until = max(self._held_until, now + max(0.0, float(seconds)))
+
+    def snapshot(self) -> dict:
+        wait = self.wait_seconds()
+        with self._lock:
+            return {"rate_per_second": round(self.rate, 4), "capacity": self.capacity,
+                    "tokens": round(self._tokens, 3), "granted": self.granted, "denied": self.denied,
+                    "next_token_seconds": round(wait, 3)}
+
+
 class EventWriteBuffer:
-    """Thread-safe in-memory event buffer flushed to a supplied sink in batches."""
+    """Thread-safe in-memory event buffer flushed to a supplied sink in batches.
+
+    The background writer sleeps on a condition variable and wakes when either
+    ``max_batch_size`` events are pending or the oldest pending event is
+    ``flush_interval`` seconds old. Large bursts are split into sink calls of at
+    most ``max_batch_size`` events so a single transaction never grows unbounded.
+    Events are stored as given; callers must not mutate them after ``add``.
+    """
 
-    def __init__(self, flush_interval: float = 0.5, sink: Callable[[list[dict]], Any] | None = None):
+    def __init__(self, flush_interval: float = 0.5, sink: Callable[[list[dict]], Any] | None = None,
+                 max_batch_size: int = 500):
         self.flush_interval = flush_interval
+        self.max_batch_size = max(1, int(max_batch_size))
         self.sink = sink or (lambda batch: None)
         self._events: list[dict] = []
+        self._added_at: list[float] = []  # arrival time of each pending event, for the age trigger
+        self._oldest_at: float | None = None
         self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
         self._running = False
         self._thread: threading.Thread | None = None
+        self.flush_latency = Histogram(LATENCY_BUCKETS_SECONDS)
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self.flush_failures = 0
 
     def add(self, event: dict):
-        with self._lock:
-            self._events.append(dict(event))
+        with self._wakeup:
+            self._events.append(event)
+            self._added_at.append(time.monotonic())
+            if len(self._events) == 1:
+                # Idle writer sleeps without a deadline; arm the age trigger.
+                self._oldest_at = self._added_at[0]
+                self._wakeup.notify()
+            elif len(self._events) >= self.max_batch_size:
+                self._wakeup.notify()
 
     def pending_count(self) -> int:
         with self._lock:
             return len(self._events)
 
-    def flush(self) -> int:
+    def _take(self) -> tuple[list[dict], list[float]]:
         with self._lock:
-            batch = self._events
-            self._events = []
-        if not batch:
-            return 0
-        try:
-            self.sink(batch)
-        except Exception:
-            with self._lock:
-                self._events = batch + self._events
-            raise
-        return len(batch)
+            batch = self._events[: self.max_batch_size]
+            added_at = self._added_at[: len(batch)]
+            del self._events[: len(batch)]
+            del self._added_at[: len(batch)]
+            # Events left behind keep their own age so the max-delay flush is never postponed.
+            self._oldest_at = self._added_at[0] if self._added_at else None
+        return batch, added_at
+
+    def _requeue(self, batch: list[dict], added_at: list[float]):
+        with self._lock:
+            self._events[:0] = batch
+            self._added_at[:0] = added_at
+            self._oldest_at = self._added_at[0] if self._added_at else None
+
+    def flush(self) -> int:
+        """Write every pending event in sink calls of at most ``max_batch_size``."""
+        flushed = 0
+        with self._flush_lock:
+            while True:
+                batch, added_at = self._take()
+                if not batch:
+                    return flushed
+                started = time.monotonic()
+                try:
+                    self.sink(batch)
+                except Exception:
+                    self._requeue(batch, added_at)
+                    self.flush_failures += 1
+                    raise
+                self.flush_latency.observe(time.monotonic() - started)
+                self.batch_size.observe(len(batch))
+                flushed += len(batch)
+
+    def _wait_for_work(self):
+        with self._wakeup:
+            while self._running:
+                if len(self._events) >= self.max_batch_size:
+                    return
+                if self._oldest_at is None:
+                    self._wakeup.wait()
+                    continue
+                remaining = self._oldest_at + self.flush_interval - time.monotonic()
+                if remaining <= 0:
+                    return
+                self._wakeup.wait(remaining)
 
     def start(self):
         if self._running:
@@ -94,41 +428,769 @@ class EventWriteBuffer:
 
         def loop():
             while self._running:
-                time.sleep(self.flush_interval)
+                self._wait_for_work()
                 try:
                     self.flush()
                 except Exception:
                     # Preserve the batch for the next flush attempt; callers can still
-                    # surface explicit flush failures during shutdown/tests.
-                    continue
+                    # surface explicit flush failures during shutdown/tests. Back off so
+                    # a persistently failing sink does not spin.
+                    time.sleep(self.flush_interval)
 
         self._thread = threading.Thread(target=loop, daemon=True)
         self._thread.start()
 
     def stop(self):
-        self._running = False
+        with self._wakeup:
+            self._running = False
+            self._wakeup.notify_all()
         if self._thread:
             self._thread.join(timeout=self.flush_interval * 2)
         self.flush()
 
+    def metrics(self) -> dict:
+        return {
+            "pending": self.pending_count(),
+            "max_batch_size": self.max_batch_size,
+            "flush_interval": self.flush_interval,
+            "flush_failures": self.flush_failures,
+            "flush_latency_seconds": self.flush_latency.snapshot(),
+            "batch_size": self.batch_size.snapshot(),
+        }
+
+
+class AnalysisExecutor:
+    """Long-lived, bounded worker pool for post-session analysis.
+
+    Work waits in a FIFO of at most ``max_queue`` items. When the queue is full
+    the oldest waiting task is cancelled so fresh sessions are analysed first
+    and a burst can never grow memory without bound.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 1000, thread_name_prefix: str = "hpv31-analysis"):
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(1, int(max_queue))
+        self.thread_name_prefix = thread_name_prefix
+        self._queue: deque = deque()
+        self._cond = threading.Condition()
+        self._threads: list[threading.Thread] = []
+        self._idle_workers = 0
+        self._shutdown = False
+        self._counters = Counter()
+        self.queue_wait = Histogram(LATENCY_BUCKETS_SECONDS)
+        self.run_time = Histogram(LATENCY_BUCKETS_SECONDS)
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> concurrent.futures.Future:
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("analysis executor is shut down")
+            if len(self._queue) >= self.max_queue:
+                dropped = self._queue.popleft()
+                dropped[0].cancel()
+                self._counters["dropped"] += 1
+            self._queue.append((future, fn, args, kwargs, time.monotonic()))
+            self._counters["submitted"] += 1
+            if not self._idle_workers and len(self._threads) < self.max_workers:
+                thread = threading.Thread(
+                    target=self._worker, name=f"{self.thread_name_prefix}-{len(self._threads)}", daemon=True
+                )
+                self._threads.append(thread)
+                thread.start()
+            self._cond.notify()
+        return future
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                self._idle_workers += 1
+                while not self._queue and not self._shutdown:
+                    self._cond.wait()
+                self._idle_workers -= 1
+                if not self._queue:
+                    return
+                future, fn, args, kwargs, enqueued_at = self._queue.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.monotonic()
+            self.queue_wait.observe(started - enqueued_at)
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as exc:
+                future.set_exception(exc)
+                outcome = "failed"
+            else:
+                future.set_result(result)
+                outcome = "completed"
+            self.run_time.observe(time.monotonic() - started)
+            with self._cond:
+                self._counters[outcome] += 1
+
+    def queue_depth(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False):
+        with self._cond:
+            self._shutdown = True
+            if cancel_futures:
+                while self._queue:
+                    self._queue.popleft()[0].cancel()
+                    self._counters["cancelled"] += 1
+            self._cond.notify_all()
+            threads = list(self._threads)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def metrics(self) -> dict:
+        with self._cond:
+            counters = dict(self._counters)
+            depth = len(self._queue)
+            workers = len(self._threads)
+        return {
+            "workers": workers,
+            "max_workers": self.max_workers,
+            "queue_depth": depth,
+            "max_queue": self.max_queue,
+            "submitted": counters.get("submitted", 0),
+            "completed": counters.get("completed", 0),
+            "failed": counters.get("failed", 0),
+            "dropped": counters.get("dropped", 0),
+            "cancelled": counters.get("cancelled", 0),
+            "queue_wait_seconds": self.queue_wait.snapshot(),
+            "run_seconds": self.run_time.snapshot(),
+        }
+
+
+class ClassificationStats:
+    """Queue wait, classify time, batch size and outcome counters for a session classifier.
+
+    One instance can be shared by many short-lived classifiers so their
+    numbers accumulate in one place.
+    """
+
+    def __init__(self):
+        self.queue_wait = Histogram(LATENCY_BUCKETS_SECONDS)
+        self.classify_seconds = Histogram(LATENCY_BUCKETS_SECONDS)
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, started: float, categories: list[str | None] | None, queued_at: Iterable[float] = (),
+               failed: int = 0):
+        """Record one classify call; ``started`` and ``queued_at`` are ``time.perf_counter()`` values."""
+        finished = time.perf_counter()
+        for queued in queued_at:
+            self.queue_wait.observe(max(0.0, started - queued))
+        self.classify_seconds.observe(finished - started)
+        categories = categories or []
+        self.batch_size.observe(len(categories) + failed)
+        unknown = sum(1 for category in categories if not category or category == "Unknown")
+        with self._lock:
+            self._counts["sessions"] += len(categories) + failed
+            self._counts["unknown"] += unknown
+            self._counts["errors"] += failed
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+        sessions = counts.get("sessions", 0)
+        return {
+            "sessions": sessions,
+            "unknown": counts.get("unknown", 0),
+            "errors": counts.get("errors", 0),
+            "unknown_ratio": round(counts.get("unknown", 0) / sessions, 4) if sessions else 0.0,
+            "queue_wait_seconds": self.queue_wait.snapshot(),
+            "classify_seconds": self.classify_seconds.snapshot(),
+            "batch_size": self.batch_size.snapshot(),
+        }
+
 
 class LazyClassifier:
-    """Runs command classification after session activity is available."""
+    """Runs command classification after session activity is available.
+
+    Pass a shared ``executor`` (anything with ``submit``) to run on a
+    long-lived pool; otherwise the classifier owns a private task queue.
+    Pass a shared ``stats`` to accumulate timings across instances.
+    """
 
-    def __init__(self, predict_fn: Callable[[str], str | None], max_workers: int = 2):
-        self.queue = ThreadedTaskQueue(max_workers=max_workers)
+    def __init__(self, predict_fn: Callable[[str], str | None], max_workers: int = 2, executor: Any = None,
+                 stats: ClassificationStats | None = None):
+        self._owns_queue = executor is None
+        self.queue = executor if executor is not None else ThreadedTaskQueue(max_workers=max_workers)
         self.predict_fn = predict_fn
+        self.stats = stats if stats is not None else ClassificationStats()
 
     def classify_session_async(self, session_id: int, commands: Iterable[str]):
-        return self.queue.submit(self._classify, session_id, list(commands))
+        return self.queue.submit(self._classify, session_id, list(commands), time.perf_counter())
 
-    def _classify(self, session_id: int, commands: list[str]) -> dict:
+    def _classify(self, session_id: int, commands: list[str], queued_at: float | None = None) -> dict:
+        started = time.perf_counter()
+        queued = () if queued_at is None else (queued_at,)
         joined = "\n".join(commands)
-        category = self.predict_fn(joined) or "Unknown"
+        try:
+            category = self.predict_fn(joined) or "Unknown"
+        except Exception:
+            self.stats.record(started, None, queued, failed=1)
+            raise
+        self.stats.record(started, [category], queued)
         return {"session_id": session_id, "attack_category": category}
 
+    def metrics(self) -> dict:
+        return self.stats.snapshot()
+
+    def shutdown(self):
+        if self._owns_queue:
+            self.queue.shutdown(wait=True)
+
+
+class BatchedSessionClassifier:
+    """Micro-batches finished sessions into one vectorizer/model call.
+
+    Sessions are gathered for up to ``window_seconds`` or ``max_batch`` items,
+    classified with a single ``predict_many_fn`` call on the shared executor,
+    and handed to ``apply_fn`` together so callers can write all category
+    updates in one transaction.
+    """
+
+    def __init__(self, predict_many_fn: Callable[[list[str]], list[str | None]],
+                 apply_fn: Callable[[list[tuple[Any, dict]]], Any] | None = None, executor: Any = None,
+                 window_seconds: float = 0.05, max_batch: int = 256):
+        self.predict_many_fn = predict_many_fn
+        self.apply_fn = apply_fn
+        self.executor = executor
+        self.stats = ClassificationStats()
+        self.buffer = EventWriteBuffer(flush_interval=window_seconds, sink=self._dispatch, max_batch_size=max_batch)
+        self.buffer.start()
+
+    def submit(self, session_id: int, commands: Iterable[str], context: Any = None) -> concurrent.futures.Future:
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        self.buffer.add({"session_id": session_id, "commands": list(commands), "context": context, "future": future,
+                         "queued_at": time.perf_counter()})
+        return future
+
+    @staticmethod
+    def _fail(batch: list[dict], exc: BaseException | None = None):
+        for item in batch:
+            if item["future"].done():
+                continue
+            if exc is None:
+                item["future"].cancel()
+            else:
+                item["future"].set_exception(exc)
+
+    def _dispatch(self, batch: list[dict]):
+        if self.executor is None:
+            self._classify_batch(batch)
+            return
+        try:
+            task = self.executor.submit(self._classify_batch, batch)
+        except RuntimeError as exc:
+            self._fail(batch, exc)
+            return
+        task.add_done_callback(lambda done: self._fail(batch) if done.cancelled() else None)
+
+    def _classify_batch(self, batch: list[dict]) -> int:
+        started = time.perf_counter()
+        queued_at = [item["queued_at"] for item in batch]
+        try:
+            categories = list(self.predict_many_fn(["\n".join(item["commands"]) for item in batch]))
+            if len(categories) != len(batch):
+                raise RuntimeError("batch prediction size mismatch")
+            results = [
+                {"session_id": item["session_id"], "attack_category": category or "Unknown"}
+                for item, category in zip(batch, categories)
+            ]
+            if self.apply_fn:
+                self.apply_fn([(item["context"], result) for item, result in zip(batch, results)])
+        except Exception as exc:
+            self.stats.record(started, None, queued_at, failed=len(batch))
+            self._fail(batch, exc)
+            return 0
+        self.stats.record(started, categories, queued_at)
+        for item, result in zip(batch, results):
+            if not item["future"].done():
+                item["future"].set_result(result)
+        return len(results)
+
+    def metrics(self) -> dict:
+        metrics = self.buffer.metrics()
+        metrics["classification"] = self.stats.snapshot()
+        return metrics
+
     def shutdown(self):
-        self.queue.shutdown(wait=True)
+        self.buffer.stop()
+
+
+class StreamingCommandClassifier:
+    """Low-latency per-command classification ahead of alert decisions.
+
+    Repeated commands are answered from a TTL cache without touching the
+    model. Misses are gathered for ``window_seconds`` (a few milliseconds) and
+    classified together on the buffer's own thread, so alerting never queues
+    behind post-session analysis.
+    """
+
+    def __init__(self, predict_many_fn: Callable[[list[str]], list[str | None]], window_seconds: float = 0.005,
+                 max_batch: int = 64, cache_size: int = 4096, cache_ttl_seconds: float = 300.0):
+        self.predict_many_fn = predict_many_fn
+        self.cache = TTLCache(max_entries=cache_size, ttl_seconds=cache_ttl_seconds)
+        self.latency = Histogram(LATENCY_BUCKETS_SECONDS)
+        self.buffer = EventWriteBuffer(flush_interval=window_seconds, sink=self._classify_batch, max_batch_size=max_batch)
+        self.buffer.start()
+
+    def submit(self, command: str) -> concurrent.futures.Future:
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        category = self.cache.get(command)
+        if category is not None:
+            self.latency.observe(0.0)
+            future.set_result(category)
+            return future
+        self.buffer.add({"command": command, "future": future, "queued_at": time.monotonic()})
+        return future
+
+    def _classify_batch(self, batch: list[dict]) -> int:
+        unique = list(dict.fromkeys(item["command"] for item in batch))
+        try:
+            categories = list(self.predict_many_fn(unique))
+            if len(categories) != len(unique):
+                raise RuntimeError("batch prediction size mismatch")
+        except Exception as exc:
+            for item in batch:
+                if not item["future"].done():
+                    item["future"].set_exception(exc)
+            return 0
+        resolved = {}
+        for command, category in zip(unique, categories):
+            resolved[command] = category or "Unknown"
+            self.cache.set(command, resolved[command])
+        now = time.monotonic()
+        for item in batch:
+            self.latency.observe(now - item["queued_at"])
+            if not item["future"].done():
+                item["future"].set_result(resolved[item["command"]])
+        return len(batch)
+
+    def metrics(self) -> dict:
+        return {
+            "cache": self.cache.stats(),
+            "latency_seconds": self.latency.snapshot(),
+            "buffer": self.buffer.metrics(),
+        }
+
+    def shutdown(self):
+        self.buffer.stop()
+
+
+class ResumableJob:
+    """Chunked background maintenance job with a checkpointed id cursor.
+
+    ``fetch_fn(cursor, limit)`` returns rows whose first element is a
+    monotonically increasing id; ``process_fn(rows)`` handles one chunk and
+    returns how many records it changed. After every chunk the state is handed
+    to ``checkpoint_fn`` so a restarted process resumes where it stopped. The
+    job sleeps between chunks so it works at most ``duty_cycle`` of the time,
+    leaving the database to sensor writes. With ``follow_seconds`` set the job
+    never completes: once caught up it polls for new rows at that interval.
+    """
+
+    def __init__(self, name: str, fetch_fn: Callable[[int, int], list], process_fn: Callable[[list], int],
+                 checkpoint_fn: Callable[[dict], Any] | None = None, chunk_size: int = 500,
+                 duty_cycle: float = 0.5, state: dict | None = None, follow_seconds: float | None = None):
+        self.name = name
+        self.follow_seconds = follow_seconds
+        self.fetch_fn = fetch_fn
+        self.process_fn = process_fn
+        self.checkpoint_fn = checkpoint_fn
+        self.chunk_size = max(1, chunk_size)
+        self.duty_cycle = min(1.0, max(0.05, duty_cycle))
+        self.state = {"name": name, "status": "idle", "cursor": 0, "processed": 0, "updated": 0, "chunks": 0,
+                      "started_at": None, "finished_at": None, "error": None}
+        self.state.update(state or {})
+        self.chunk_seconds = Histogram(LATENCY_BUCKETS_SECONDS)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _checkpoint(self, **changes):
+        with self._lock:
+            self.state.update(changes)
+            snapshot = dict(self.state)
+        if self.checkpoint_fn:
+            self.checkpoint_fn(snapshot)
+
+    def run(self) -> dict:
+        """Run to completion (or until stopped) on the calling thread."""
+        self._checkpoint(status="running", error=None, finished_at=None,
+                         started_at=self.state.get("started_at") or time.time())
+        try:
+            while not self._stop.is_set():
+                started = time.perf_counter()
+                rows = self.fetch_fn(self.state["cursor"], self.chunk_size)
+                if not rows:
+                    if self.follow_seconds is None:
+                        self._checkpoint(status="completed", finished_at=time.time())
+                        break
+                    if self.state["status"] != "waiting":
+                        self._checkpoint(status="waiting")
+                    self._stop.wait(self.follow_seconds)
+                    continue
+                updated = self.process_fn(rows)
+                elapsed = time.perf_counter() - started
+                self.chunk_seconds.observe(elapsed)
+                self._checkpoint(
+                    status="running",
+                    cursor=rows[-1][0],
+                    processed=self.state["processed"] + len(rows),
+                    updated=self.state["updated"] + updated,
+                    chunks=self.state["chunks"] + 1,
+                )
+                self._stop.wait(elapsed * (1.0 - self.duty_cycle) / self.duty_cycle)
+            else:
+                self._checkpoint(status="paused")
+        except Exception as exc:
+            self._checkpoint(status="failed", error=exc.__class__.__name__)
+        return self.status()
+
+    def start(self) -> bool:
+        """Run in a daemon thread; returns False if the job is already running."""
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name=f"hpv31-job-{self.name}", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self, wait: bool = True):
+        self._stop.set()
+        if wait and self._thread is not None:
+            self._thread.join(timeout=10)
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def status(self) -> dict:
+        with self._lock:
+            status = dict(self.state)
+        status["running"] = self.running()
+        status["chunk_seconds"] = self.chunk_seconds.snapshot()
+        return status
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_IPV4_RE = re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b")
+_RANDOM_TOKEN_RE = re.compile(r"\b(?=[a-z_]*\d)[a-z0-9_]{4,}\b")
+
+
+class MinHasher:
+    """MinHash signatures and LSH band keys for near-duplicate payloads.
+
+    Payloads are lowercased, IPv4 addresses and digit-bearing tokens (random
+    filenames, hashes, ports) are masked, and the result is shingled into
+    character ``shingle_size``-grams, so two droppers that differ only in
+    URL, filename or a random token share most shingles.
+
+    Signatures use one-permutation hashing: each shingle is hashed once and
+    lands in one of ``num_perm`` bins, which keep their minimum. Empty bins
+    borrow from the next non-empty bin (rotation densification), so the cost
+    is one hash per shingle instead of one per shingle and permutation. The
+    signature is split into ``bands`` bands whose keys are bucket ids for an
+    LSH index.
+    """
+
+    def __init__(self, num_perm: int = 32, bands: int = 16, shingle_size: int = 4, max_chars: int = 2048,
+                 seed: int = 0x9E3779B1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.max_chars = max_chars
+        self.seed = seed | 1
+        self._offset = (1 << 32) // num_perm
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        text = _IPV4_RE.sub("<ip>", str(text or "").lower())
+        text = _RANDOM_TOKEN_RE.sub("<t>", text)
+        return _WHITESPACE_RE.sub(" ", text).strip()
+
+    def signature(self, text: str) -> tuple[int, ...]:
+        text = self.normalize(text)[: self.max_chars]
+        k, bins_count, seed = self.shingle_size, self.num_perm, self.seed
+        bins: list[int | None] = [None] * bins_count
+        for i in range(max(1, len(text) - k + 1)):
+            h = (zlib.crc32(text[i:i + k].encode()) * seed) & 0xFFFFFFFF
+            index, value = h % bins_count, h // bins_count
+            current = bins[index]
+            if current is None or value < current:
+                bins[index] = value
+        signature = list(bins)
+        for index in range(bins_count):
+            if signature[index] is None:
+                distance = 1
+                while bins[(index + distance) % bins_count] is None:
+                    distance += 1
+                signature[index] = bins[(index + distance) % bins_count] + distance * self._offset
+        return tuple(signature)
+
+    def band_keys(self, signature: tuple[int, ...]) -> list[int]:
+        """One non-negative 63-bit bucket key per band (fits an SQLite INTEGER)."""
+        keys = []
+        for band in range(self.bands):
+            chunk = signature[band * self.rows:(band + 1) * self.rows]
+            digest = hashlib.blake2b(repr((band, chunk)).encode(), digest_size=8).digest()
+            keys.append(int.from_bytes(digest, "big") >> 1)
+        return keys
+
+    @staticmethod
+    def similarity(left: tuple[int, ...], right: tuple[int, ...]) -> float:
+        """Estimated Jaccard similarity of the payloads behind two signatures."""
+        if not left or len(left) != len(right):
+            return 0.0
+        return sum(1 for a, b in zip(left, right) if a == b) / len(left)
+
+
+# Relative weight of each per-command category when scoring a whole session.
+SESSION_CATEGORY_WEIGHTS = {
+    "Malware Attempt": 3.0,
+    "Malware Download": 3.0,
+    "Malware Execution": 3.0,
+    "Reverse Shell": 3.0,
+    "Data Exfiltration": 2.5,
+    "Persistence": 2.5,
+    "Privilege Escalation": 2.5,
+    "Credential Access": 2.0,
+    "Defense Evasion": 2.0,
+    "Web Exploit": 2.0,
+    "Brute Force": 1.5,
+    "Credential Stuffing": 1.5,
+    "Reconnaissance": 1.0,
+    "Benign": 0.0,
+    "Unknown": 0.0,
+}
+RECON_CATEGORIES = frozenset({"Reconnaissance"})
+
+
+class SessionFeatures:
+    """Session features maintained incrementally as commands arrive.
+
+    Every update is O(1). Per-command labels come back from micro-batched
+    classification and may arrive out of order; they are applied in command
+    order so the transition counts reflect the real sequence. A session is
+    one connection and therefore one service, so the intent score counts a
+    single service.
+    """
+
+    def __init__(self):
+        self.commands = 0
+        self.unique = set()
+        self.shell_depth = 0
+        self.first_at: float | None = None
+        self.last_at: float | None = None
+        self.delays = 0
+        self.humanish_delays = 0
+        self.max_delay = 0.0
+        self.counts = Counter()
+        self.transitions = Counter()
+        self.first_category: str | None = None
+        self.last_category: str | None = None
+        self._next_label = 0
+        self._early: dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def observe_command(self, command: str, at: float | None = None) -> int:
+        """Record a command and return its index for the matching ``observe_label`` call."""
+        at = time.time() if at is None else at
+        text = str(command).strip()
+        with self._lock:
+            index = self.commands
+            self.commands += 1
+            self.unique.add(hash(text))
+            if _has_shell_marker(text):
+                self.shell_depth += 1
+            if self.last_at is not None:
+                delay = max(0.0, at - self.last_at)
+                self.delays += 1
+                self.humanish_delays += _humanish_delay(delay)
+                self.max_delay = max(self.max_delay, delay)
+            if self.first_at is None:
+                self.first_at = at
+            self.last_at = at
+            return index
+
+    def observe_label(self, index: int, category: str | None):
+        with self._lock:
+            self._early[index] = category or "Unknown"
+            while self._next_label in self._early:
+                category = self._early.pop(self._next_label)
+                self._next_label += 1
+                self.counts[category] += 1
+                if self.last_category is None:
+                    self.first_category = category
+                elif self.last_category != category:
+                    self.transitions[(self.last_category, category)] += 1
+                self.last_category = category
+
+    def pending(self) -> int:
+        with self._lock:
+            return self.commands - self._next_label - len(self._early)
+
+    def duration(self) -> float:
+        if self.first_at is None or self.last_at is None:
+            return 0.0
+        return self.last_at - self.first_at
+
+    def intent_score(self) -> float:
+        """Same score as ``noise_intent_score`` over the full transcript, from running totals."""
+        if not self.commands:
+            return 0.0
+        delay_score = self.humanish_delays / self.delays if self.delays else 0.0
+        return _intent_score(len(self.unique) / self.commands, self.duration(), 1, delay_score,
+                             self.shell_depth / self.commands)
+
+    def classify(self) -> str:
+        """Highest weighted category; an action that follows reconnaissance counts double.
+
+        The follow-up bonus grows with the share of human-paced gaps, so an
+        operator acting on recon output escalates further than a script does.
+        """
+        pace = self.humanish_delays / self.delays if self.delays else 0.0
+        scores = {}
+        for category, count in self.counts.items():
+            scores[category] = SESSION_CATEGORY_WEIGHTS.get(category, 1.0) * count
+        for (previous, category), count in self.transitions.items():
+            if previous in RECON_CATEGORIES and SESSION_CATEGORY_WEIGHTS.get(category, 1.0) > 1.0:
+                scores[category] += SESSION_CATEGORY_WEIGHTS.get(category, 1.0) * count * (1.0 + pace)
+        if not scores or max(scores.values()) <= 0:
+            return "Benign" if self.counts.get("Benign") else "Unknown"
+        return max(scores, key=lambda category: (scores[category], SESSION_CATEGORY_WEIGHTS.get(category, 1.0)))
+
+    def snapshot(self) -> dict:
+        return {
+            "commands": self.commands,
+            "unique_commands": len(self.unique),
+            "duration_sec": round(self.duration(), 3),
+            "max_delay_sec": round(self.max_delay, 3),
+            "category_counts": dict(self.counts),
+            "first_category": self.first_category,
+            "last_category": self.last_category,
+            "intent_score": self.intent_score(),
+        }
+
+
+class SessionSequenceClassifier:
+    """Session-level classification from features built while the session runs.
+
+    ``observe`` is called for every command with either its category or a
+    Future that resolves to it (e.g. from StreamingCommandClassifier).
+    ``finish`` at disconnect classifies the precomputed state once the last
+    per-command label is in, without re-vectorizing the transcript. Results
+    are written through ``apply_fn`` in batches, like BatchedSessionClassifier.
+    A finishing session evicted by ``max_sessions`` before its labels arrive
+    is classified at once from the labels it already has.
+    """
+
+    def __init__(self, apply_fn: Callable[[list[tuple[Any, dict]]], Any] | None = None, window_seconds: float = 0.05,
+                 max_batch: int = 256, max_sessions: int = 10000):
+        self.apply_fn = apply_fn
+        self.max_sessions = max_sessions
+        self.sessions: OrderedDict[Any, SessionFeatures] = OrderedDict()
+        self._finishing: dict[Any, tuple[Any, concurrent.futures.Future]] = {}
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.evicted = 0
+        self.writer = EventWriteBuffer(flush_interval=window_seconds, sink=self._apply, max_batch_size=max_batch)
+        self.writer.start()
+
+    def observe(self, session_id: Any, command: str, label: str | concurrent.futures.Future | None,
+                at: float | None = None):
+        evicted = None
+        with self._lock:
+            features = self.sessions.get(session_id)
+            if features is not None:
+                self.sessions.move_to_end(session_id)  # least recently active sessions are evicted first
+            else:
+                features = self.sessions[session_id] = SessionFeatures()
+                if len(self.sessions) > self.max_sessions:
+                    evicted_id, evicted_features = self.sessions.popitem(last=False)
+                    self.evicted += 1
+                    finishing = self._finishing.pop(evicted_id, None)
+                    if finishing is not None:  # nothing would resolve its future once it leaves ``sessions``
+                        self.completed += 1
+                        evicted = (evicted_id, evicted_features, *finishing)
+        if evicted is not None:
+            self._write(*evicted)
+        index = features.observe_command(command, at=at)
+        if isinstance(label, concurrent.futures.Future):
+            label.add_done_callback(lambda done: self._label(session_id, features, index, done))
+        else:
+            self._set_label(session_id, features, index, label)
+
+    def _label(self, session_id: Any, features: SessionFeatures, index: int, done: concurrent.futures.Future):
+        category = None
+        if not done.cancelled() and done.exception() is None:
+            category = done.result()
+        self._set_label(session_id, features, index, category)
+
+    def _set_label(self, session_id: Any, features: SessionFeatures, index: int, category: str | None):
+        features.observe_label(index, category)
+        if features.pending() == 0:
+            self._complete(session_id, features)
+
+    def finish(self, session_id: Any, context: Any = None) -> concurrent.futures.Future | None:
+        """Future for the session result, or None if the session was never observed."""
+        with self._lock:
+            features = self.sessions.get(session_id)
+            if features is None:
+                return None
+            future: concurrent.futures.Future = concurrent.futures.Future()
+            self._finishing[session_id] = (context, future)
+        if features.pending() == 0:
+            self._complete(session_id, features)
+        return future
+
+    def _complete(self, session_id: Any, features: SessionFeatures):
+        with self._lock:
+            if session_id not in self._finishing or self.sessions.get(session_id) is not features:
+                return
+            context, future = self._finishing.pop(session_id)
+            del self.sessions[session_id]
+            self.completed += 1
+        self._write(session_id, features, context, future)
+
+    def _write(self, session_id: Any, features: SessionFeatures, context: Any, future: concurrent.futures.Future):
+        result = {"session_id": session_id, "attack_category": features.classify(), "features": features.snapshot()}
+        self.writer.add({"context": context, "result": result, "future": future})
+
+    def _apply(self, batch: list[dict]):
+        try:
+            if self.apply_fn:
+                self.apply_fn([(item["context"], item["result"]) for item in batch])
+        except Exception as exc:
+            for item in batch:
+                if not item["future"].done():
+                    item["future"].set_exception(exc)
+            return
+        for item in batch:
+            if not item["future"].done():
+                item["future"].set_result(item["result"])
+
+    def metrics(self) -> dict:
+        with self._lock:
+            active, finishing = len(self.sessions), len(self._finishing)
+        return {
+            "active_sessions": active,
+            "finishing": finishing,
+            "completed": self.completed,
+            "evicted": self.evicted,
+            "writer": self.writer.metrics(),
+        }
+
+    def shutdown(self):
+        self.writer.stop()
 
 
 def should_run_heavy_analysis(session_duration_sec: float, minimum_seconds: float = 60) -> bool:
@@ -154,15 +1216,30 @@ def noise_intent_score(commands: Iterable[str], session_duration_sec: float = 0,
         return 0.0
 
     unique_ratio = len(set(commands)) / max(len(commands), 1)
-    duration_score = min(float(session_duration_sec or 0) / 180.0, 1.0)
-    service_score = min(len(services) / 3.0, 1.0)
     delay_score = 0.0
     if delays:
-        humanish = [d for d in delays if 1.0 <= d <= 30.0]
+        humanish = [d for d in delays if _humanish_delay(d)]
         delay_score = len(humanish) / len(delays)
-    shell_markers = ("sudo", "whoami", "id", "find ", "cat ", "curl", "wget", "python", "perl", "bash", "chmod")
-    command_depth = sum(1 for c in commands if any(m in c.lower() for m in shell_markers)) / len(commands)
+    command_depth = sum(1 for c in commands if _has_shell_marker(c)) / len(commands)
+    return _intent_score(unique_ratio, session_duration_sec, len(services), delay_score, command_depth)
+
+
+SHELL_MARKERS = ("sudo", "whoami", "id", "find ", "cat ", "curl", "wget", "python", "perl", "bash", "chmod")
 
+
+def _humanish_delay(delay: float) -> bool:
+    return 1.0 <= delay <= 30.0
+
+
+def _has_shell_marker(command: str) -> bool:
+    lowered = command.lower()
+    return any(m in lowered for m in SHELL_MARKERS)
+
+
+def _intent_score(unique_ratio: float, session_duration_sec: float, service_count: int, delay_score: float,
+                  command_depth: float) -> float:
+    duration_score = min(float(session_duration_sec or 0) / 180.0, 1.0)
+    service_score = min(service_count / 3.0, 1.0)
     score = (unique_ratio * 0.20) + (duration_score * 0.30) + (service_score * 0.15) + (delay_score * 0.15) + (command_depth * 0.20)
     return round(max(0.0, min(score, 1.0)), 3)
 